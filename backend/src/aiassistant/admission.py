@@ -0,0 +1,178 @@
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+
+class Saturated(Throttled):
+    """All LLM slots are busy and the wait queue is full (or the wait timed out)."""
+    default_detail = "The assistant is busy right now. Please retry shortly."
+
+
+# --- Global cap on concurrent LLM calls ---
+class ConcurrencyLimiter:
+    """
+    Lets at most ``max_concurrent`` LLM calls run at once in this process.
+
+    Up to ``max_queue`` further requests wait (at most ``timeout`` seconds)
+    for a slot; anything beyond that is rejected straight away with
+    ``Saturated`` instead of piling up on the workers. Retry-After is
+    estimated from the average time a slot is held.
+    """
+
+    def __init__(self, max_concurrent, max_queue, timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self._avg_hold = 1.0   # seconds, moving average
+        self._stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(settings.LLM_MAX_CONCURRENCY, settings.LLM_MAX_QUEUE, settings.LLM_QUEUE_TIMEOUT)
+
+    def retry_after(self):
+        """Seconds until the queue in front of a new request should have drained."""
+        backlog = (self.waiting + 1) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(self._avg_hold * backlog))
+
+    def acquire(self):
+        """Take a slot, waiting in the bounded queue if needed. Returns a ``Slot``."""
+        with self._cond:
+            if self.in_flight >= self.max_concurrent or self.waiting:
+                if self.waiting >= self.max_queue:
+                    self._stats["rejected_queue_full"] += 1
+                    raise Saturated(wait=self.retry_after())
+
+                self.waiting += 1
+                self._stats["queued"] += 1
+                try:
+                    admitted = self._cond.wait_for(lambda: self.in_flight < self.max_concurrent, self.timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self._stats["rejected_timeout"] += 1
+                    raise Saturated(wait=self.retry_after())
+
+            self.in_flight += 1
+            self._stats["admitted"] += 1
+        return Slot(self)
+
+    def _release(self, held):
+        with self._cond:
+            self.in_flight -= 1
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, in_flight=self.in_flight, queue_depth=self.waiting)
+
+
+class Slot:
+    """A held LLM slot; ``release()`` is safe to call more than once."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter._release(time.monotonic() - self.started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Return the process-wide ConcurrencyLimiter, or None when LLM_MAX_CONCURRENCY is 0."""
+    global _limiter
+    if not settings.LLM_MAX_CONCURRENCY:
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = ConcurrencyLimiter.from_settings()
+    return _limiter
+
+
+def acquire_llm_slot():
+    """Take an LLM slot, or return None when the cap is disabled."""
+    limiter = get_limiter()
+    return limiter.acquire() if limiter else None
+
+
+# --- Per-user token bucket (DRF throttle) ---
+class UserTokenBucketThrottle(BaseThrottle):
+    """
+    Allows bursts of ``USER_MESSAGE_BURST`` messages per user, refilled at
+    ``USER_MESSAGES_PER_MINUTE``. Buckets live in the RATE_LIMIT_CACHE_ALIAS
+    cache so every worker shares them (point it at Redis or the DB cache in
+    production). Updates are read-modify-write, so two simultaneous requests
+    from one user may both take the last token; the limit is approximate by
+    at most one message per worker.
+    """
+    cache_format = "aiassistant:ratelimit:%s"
+    rejections = 0
+    _lock = threading.Lock()
+
+    def allow_request(self, request, view):
+        rate = settings.USER_MESSAGES_PER_MINUTE / 60
+        burst = settings.USER_MESSAGE_BURST
+        if not rate or not burst:
+            return True
+
+        ident = request.user.pk if request.user.is_authenticated else self.get_ident(request)
+        key = self.cache_format % ident
+        cache = caches[settings.RATE_LIMIT_CACHE_ALIAS]
+        now = time.time()
+
+        tokens, updated_at = cache.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        if tokens < 1:
+            self._wait = (1 - tokens) / rate
+            with self._lock:
+                UserTokenBucketThrottle.rejections += 1
+            return False
+
+        # Expire once the bucket would be full again anyway
+        cache.set(key, (tokens - 1, now), math.ceil(burst / rate))
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+def collect_metrics():
+    """Admission control state for fastai.metrics."""
+    metrics = [
+        ("llm_admission_rejections_total", "counter", "Requests rejected with 429, by reason.",
+         {(("reason", "rate_limited"),): UserTokenBucketThrottle.rejections}),
+    ]
+    limiter = get_limiter()
+    if limiter is None:
+        return metrics
+    stats = limiter.stats()
+    metrics[0][3].update({
+        (("reason", "queue_full"),): stats["rejected_queue_full"],
+        (("reason", "queue_timeout"),): stats["rejected_timeout"],
+    })
+    return metrics + [
+        ("llm_admission_in_flight", "gauge", "LLM calls holding a slot.", {(): stats["in_flight"]}),
+        ("llm_admission_queue_depth", "gauge", "Requests waiting for an LLM slot.", {(): stats["queue_depth"]}),
+        ("llm_admission_queued_total", "counter", "Requests that had to wait for a slot.", {(): stats["queued"]}),
+    ]
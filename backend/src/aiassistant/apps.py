@@ -1,6 +1,38 @@
+import logging
+import os
+import threading
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class AiassistantConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'aiassistant'
+
+    def ready(self):
+        from fastai.metrics import registry
+        from . import admission, cache, images, jobs, llm, resilience
+
+        # ---- Export stats kept by the cache, client pool, job and image queues, admission control and the breaker
+        for module in (cache, llm, jobs, images, admission, resilience):
+            registry.register_collector(module.collect_metrics)
+
+        # ---- Optionally create the Watsonx client before the first message arrives
+        # (under gunicorn each worker does this after fork instead, see gunicorn.conf.py)
+        if settings.WATSONX_WARMUP and not os.getenv("GUNICORN_PRELOAD"):
+            threading.Thread(target=warm_up_llm, name="llm-warmup", daemon=True).start()
+
+        # ---- In-process generation: pick up jobs left behind by a dead process (see jobs.py)
+        if settings.GENERATION_QUEUE == "inprocess" and not os.getenv("GUNICORN_PRELOAD"):
+            jobs.start_job_recovery()
+
+
+def warm_up_llm():
+    from .llm import get_provider
+
+    try:
+        get_provider().warm_up()
+    except Exception:
+        logger.exception("WatsonxAI warm-up failed")
@@ -0,0 +1,164 @@
+"""
+Cold archival of idle conversations.
+
+``archive_batch()`` writes a batch of conversations, with their messages, to
+one gzipped JSONL file under ARCHIVE_DIR (one conversation per line), then
+records an ``ArchivedConversation`` per line and deletes the conversations
+from the hot tables in the same transaction. ``restore_conversation()`` reads
+the line back and re-inserts the conversation and its messages under their
+original ids and timestamps.
+
+Generation jobs are transient and are not archived. Uploaded message images
+stay in MEDIA_ROOT; only their paths and ImageAsset ids are archived.
+"""
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ArchivedConversation, Conversation, GenerationJob, ImageAsset, Message
+
+CONVERSATION_FIELDS = (
+    "id", "user_id", "title", "created_at", "summary", "summarized_until", "user_message_count", "last_message_at",
+)
+MESSAGE_FIELDS = ("id", "sender", "content", "image", "image_asset_id", "created_at")
+DATETIME_FIELDS = ("created_at", "last_message_at")
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    """Keeps microseconds, which DjangoJSONEncoder drops (messages are ordered by created_at)."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+# ---- Helper function: Conversations idle since before the cutoff
+def stale_conversations(cutoff):
+    return Conversation.objects.annotate(
+        last_activity=Coalesce("last_message_at", "created_at")
+    ).filter(last_activity__lt=cutoff)
+
+
+def retention_cutoff(days=None):
+    days = settings.MESSAGE_RETENTION_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days) if days else None
+
+
+def archive_path(relative: str) -> Path:
+    return Path(settings.ARCHIVE_DIR) / relative
+
+
+# ---- Move one batch of conversations to an archive file
+def archive_batch(conversation_ids, cutoff) -> int:
+    """
+    Archive the conversations in ``conversation_ids`` that are still idle at
+    ``cutoff``; returns how many were archived. The file is complete on disk
+    before the rows are deleted, and the rows are only deleted if the
+    transaction commits.
+    """
+    with transaction.atomic():
+        # Locked, so a message arriving meanwhile waits for the delete instead of being lost silently
+        conversations = list(
+            stale_conversations(cutoff).select_for_update().filter(id__in=conversation_ids)
+            .order_by("id").values(*CONVERSATION_FIELDS)
+        )
+        if not conversations:
+            return 0
+        ids = [conversation["id"] for conversation in conversations]
+
+        messages = {conversation_id: [] for conversation_id in ids}
+        rows = Message.objects.filter(conversation_id__in=ids).order_by("conversation_id", "created_at", "id")
+        for row in rows.values("conversation_id", *MESSAGE_FIELDS).iterator(chunk_size=2000):
+            messages[row.pop("conversation_id")].append(row)
+
+        archived_at = timezone.now()
+        relative = f"{archived_at:%Y/%m}/conversations-{archived_at:%Y%m%dT%H%M%S}-{ids[0]}-{ids[-1]}.jsonl.gz"
+        write_archive(archive_path(relative), (dict(conversation, messages=messages[conversation["id"]])
+                                               for conversation in conversations))
+
+        ArchivedConversation.objects.bulk_create([
+            ArchivedConversation(
+                conversation_id=conversation["id"],
+                user_id=conversation["user_id"],
+                title=conversation["title"],
+                message_count=len(messages[conversation["id"]]),
+                created_at=conversation["created_at"],
+                last_message_at=conversation["last_message_at"],
+                archive_file=relative,
+            )
+            for conversation in conversations
+        ])
+        # Children first, so the conversation delete has nothing left to cascade
+        GenerationJob.objects.filter(conversation_id__in=ids).delete()
+        Message.objects.filter(conversation_id__in=ids).delete()
+        Conversation.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def write_archive(path: Path, records):
+    """Write ``records`` as gzipped JSONL; readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".partial")
+    with gzip.open(partial, "wt", encoding="utf-8") as archive:
+        for record in records:
+            archive.write(json.dumps(record, cls=ArchiveEncoder, ensure_ascii=False) + "\n")
+    with open(partial, "rb") as written:
+        os.fsync(written.fileno())
+    os.replace(partial, path)
+
+
+# ---- Bring an archived conversation back into the hot tables
+def read_record(archived: ArchivedConversation) -> dict:
+    path = archive_path(archived.archive_file)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            for line in archive:
+                record = json.loads(line)
+                if record["id"] == archived.conversation_id:
+                    return record
+    except OSError as e:
+        raise ArchiveError(f"Cannot read archive {path}: {e}") from e
+    raise ArchiveError(f"Conversation {archived.conversation_id} is missing from {path}")
+
+
+def restore_conversation(archived: ArchivedConversation) -> Conversation:
+    """
+    Re-insert an archived conversation and its messages under their original
+    ids. Raises ``ArchivedConversation.DoesNotExist`` when a concurrent call
+    restored it first.
+    """
+    with transaction.atomic():
+        archived = ArchivedConversation.objects.select_for_update().get(pk=archived.pk)
+        record = read_record(archived)
+        messages = record.pop("messages")
+        for field in DATETIME_FIELDS:
+            if record.get(field):
+                record[field] = parse_datetime(record[field])
+
+        conversation = Conversation(**record)
+        conversation.save(force_insert=True)
+        # Older archives have no asset ids; assets deleted since then are dropped
+        assets = set(ImageAsset.objects.filter(
+            id__in=[message["image_asset_id"] for message in messages if message.get("image_asset_id")]
+        ).values_list("id", flat=True))
+        for message in messages:
+            message["image_asset_id"] = message.get("image_asset_id") if message.get("image_asset_id") in assets else None
+        # bulk_create skips Message.save(): the archived counters are restored as they were
+        Message.objects.bulk_create([
+            Message(conversation=conversation, **dict(message, created_at=parse_datetime(message["created_at"])))
+            for message in messages
+        ], batch_size=500)
+        archived.delete()
+    return conversation
@@ -0,0 +1,96 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.conf import settings
+from fastai.metrics import llm_batch_size, llm_batch_wait
+from .llm import get_llm
+from .resilience import get_guard, is_transient
+
+
+# --- Micro-batching dispatcher ---
+class BatchDispatcher:
+    """
+    Groups prompts that arrive within ``window`` seconds (at most
+    ``max_batch`` of them) into one multi-prompt ``llm.generate`` call and
+    hands each caller its own reply.
+
+    A single collector thread forms the batches; up to ``concurrency``
+    batches run at the same time on a small pool, so a slow batch does not
+    hold back the next one. A failed call fails every prompt in its batch and
+    counts once against the circuit breaker (see resilience.py).
+    """
+
+    def __init__(self, window, max_batch, concurrency=4, llm_factory=get_llm):
+        self.window = window
+        self.max_batch = max_batch
+        self.llm_factory = llm_factory
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm-batch")
+        self._collector = threading.Thread(target=self._collect, name="llm-batch-collector", daemon=True)
+        self._collector.start()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            window=settings.LLM_BATCH_WINDOW_MS / 1000,
+            max_batch=settings.LLM_BATCH_MAX_SIZE,
+            concurrency=settings.LLM_BATCH_CONCURRENCY,
+        )
+
+    def submit(self, prompt) -> Future:
+        future = Future()
+        self._queue.put((prompt, future, time.perf_counter()))
+        return future
+
+    def generate(self, prompt, timeout=None) -> str:
+        """Block until the batch holding ``prompt`` has been generated."""
+        return self.submit(prompt).result(timeout)
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        started = time.perf_counter()
+        for _, _, queued_at in batch:
+            llm_batch_wait.observe(started - queued_at)
+        llm_batch_size.observe(len(batch))
+
+        try:
+            result = self.llm_factory().generate([prompt for prompt, _, _ in batch])
+            texts = [generations[0].text for generations in result.generations]
+        except Exception as e:
+            breaker = get_guard().breaker
+            breaker.record_failure() if is_transient(e) else breaker.record_success()
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        get_guard().breaker.record_success()
+        for (_, future, _), text in zip(batch, texts):
+            future.set_result(text)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Return the process-wide BatchDispatcher, or None when LLM_BATCH_WINDOW_MS is 0."""
+    global _dispatcher
+    if not settings.LLM_BATCH_WINDOW_MS:
+        return None
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = BatchDispatcher.from_settings()
+    return _dispatcher
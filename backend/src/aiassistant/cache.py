@@ -0,0 +1,246 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+VERSION_KEY = "aiassistant:response-cache:version"
+GENERATION_KEY = "aiassistant:response-cache:generation:%s"
+
+
+# --- Helper function: Normalize a user question ---
+def normalize_question(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip("?!. ")
+
+
+# --- In-process LRU backend ---
+class LocMemLRUBackend:
+    """Size-bounded LRU dict with per-entry expiry, private to this process."""
+    name = "locmem"
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# --- Django cache backend (shared between processes) ---
+class DjangoCacheBackend:
+    """Stores entries in a Django cache (DB, Redis, Memcached...) shared by all workers."""
+    name = "django"
+
+    def __init__(self, alias="default", max_entries=None):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, ttl):
+        self.cache.set(key, value, ttl)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def get_version(self):
+        return self.cache.get_or_set(VERSION_KEY, 1, None)
+
+    def get_versions(self, digest):
+        """(cache-wide version, generation of one question) in one round trip."""
+        found = self.cache.get_many([VERSION_KEY, GENERATION_KEY % digest])
+        version = found.get(VERSION_KEY) or self.get_version()
+        return version, found.get(GENERATION_KEY % digest, 0)
+
+    def bump_version(self):
+        return self._incr(VERSION_KEY, start=1)
+
+    def bump_generation(self, digest):
+        # Never expires: a reset to 0 could make old entries reachable again
+        return self._incr(GENERATION_KEY % digest, start=0)
+
+    def _incr(self, key, start):
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, start + 1, None)
+            return start + 1
+
+
+BACKENDS = {
+    "locmem": LocMemLRUBackend,
+    "django": DjangoCacheBackend,
+}
+
+
+# --- Tiered response cache ---
+class ResponseCache:
+    """
+    Caches AI replies for repeated questions, fastest tier first.
+
+    Keys combine the normalized question, model id, generation params and a
+    ``context``: what else the prompt is built from (services.cache_context:
+    the system prompt and the retrieval index build). Changing any of them
+    changes every key, so answers built from an older prompt are not served.
+    Only standalone questions are cached; conversation history is not keyed.
+
+    The shared tier keeps a version number, and a generation per invalidated
+    question, and both are part of every key: bumping either invalidates every
+    tier in every process, including the other workers' local LRUs, from their
+    next lookup on. The "django" tier is only shared when its CACHES alias is
+    (Redis, database); on the default per-process LocMem, or with "locmem"
+    alone, invalidation only reaches this process and other workers serve the
+    old answer until it expires (RESPONSE_CACHE_TTL).
+    """
+
+    def __init__(self, backends, ttl):
+        self.backends = backends
+        self.ttl = ttl
+        self._local_version = 1
+        self._local_generations = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "invalidations": 0}
+        self._tier_hits = {backend.name: 0 for backend in backends}
+
+    @classmethod
+    def from_settings(cls):
+        backends = []
+        for name in settings.RESPONSE_CACHE_BACKENDS:
+            backend_cls = BACKENDS.get(name) or import_string(name)
+            if backend_cls is DjangoCacheBackend:
+                backends.append(backend_cls(alias=settings.RESPONSE_CACHE_ALIAS))
+            else:
+                backends.append(backend_cls(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES))
+        return cls(backends, settings.RESPONSE_CACHE_TTL)
+
+    def versions(self, digest):
+        """(cache-wide version, generation of the question with this digest)."""
+        for backend in self.backends:
+            if hasattr(backend, "get_versions"):
+                return backend.get_versions(digest)
+        return self._local_version, self._local_generations.get(digest, 0)
+
+    @staticmethod
+    def digest(question, model_id, params, context=""):
+        payload = json.dumps([normalize_question(question), model_id, params, context], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def make_key(self, question, model_id, params, context=""):
+        digest = self.digest(question, model_id, params, context)
+        version, generation = self.versions(digest)
+        return f"aiassistant:response:{version}:{digest}:{generation}"
+
+    def get(self, key):
+        for i, backend in enumerate(self.backends):
+            value = backend.get(key)
+            if value is not None:
+                # Backfill the faster tiers we missed on the way down
+                for faster in self.backends[:i]:
+                    faster.set(key, value, self.ttl)
+                self._count("hits", backend.name)
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        for backend in self.backends:
+            backend.set(key, value, self.ttl)
+        self._count("sets")
+
+    def invalidate(self, question=None, model_id=None, params=None, context=""):
+        """Drop one question's entry, or everything when no question is given."""
+        if question is not None:
+            key = self.make_key(question, model_id, params, context)
+            digest = self.digest(question, model_id, params, context)
+            with self._lock:
+                self._local_generations[digest] = self._local_generations.get(digest, 0) + 1
+            for backend in self.backends:
+                backend.delete(key)
+                if hasattr(backend, "bump_generation"):
+                    backend.bump_generation(digest)
+        else:
+            with self._lock:
+                self._local_version += 1
+            for backend in self.backends:
+                if hasattr(backend, "bump_version"):
+                    backend.bump_version()
+        self._count("invalidations")
+
+    def _count(self, stat, tier=None):
+        with self._lock:
+            self._stats[stat] += 1
+            if tier is not None:
+                self._tier_hits[tier] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                hit_ratio=self._stats["hits"] / lookups if lookups else 0.0,
+                tier_hits=dict(self._tier_hits),
+            )
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide ResponseCache, or None when caching is disabled."""
+    global _response_cache
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache.from_settings()
+    return _response_cache
+
+
+def collect_metrics():
+    """Response cache counters for fastai.metrics."""
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return []
+    stats = response_cache.stats()
+    return [
+        ("response_cache_lookups_total", "counter", "Response cache lookups by result.",
+         {(("result", "hit"),): stats["hits"], (("result", "miss"),): stats["misses"]}),
+        ("response_cache_tier_hits_total", "counter", "Response cache hits by tier.",
+         {(("tier", tier),): hits for tier, hits in stats["tier_hits"].items()}),
+        ("response_cache_invalidations_total", "counter", "Response cache invalidations.",
+         {(): stats["invalidations"]}),
+    ]
@@ -0,0 +1,43 @@
+import hashlib
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+# --- Conditional GET for polled read endpoints ---
+class ConditionalGetMixin:
+    """
+    Answers GET with 304 Not Modified while the client's ETag (or
+    Last-Modified) still matches, before the payload is queried or serialized.
+
+    Views implement ``get_version()``, returning ``(marker, last_modified)``
+    from one cheap query (``Conversation.updated_at`` and friends), or None
+    to serve the request unconditionally. The ETag hashes the marker with the
+    user and the full path, so every page, cursor and filter gets its own.
+    Last-Modified has one-second resolution; the ETag is the exact validator.
+    """
+
+    def get_version(self):
+        raise NotImplementedError
+
+    def get_etag(self, marker):
+        key = f"{self.request.user.pk}|{self.request.get_full_path()}|{marker}"
+        return quote_etag(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        version = self.get_version()
+        if version is None:
+            return super().get(request, *args, **kwargs)
+
+        marker, last_modified = version
+        etag = self.get_etag(marker)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        response["ETag"] = etag
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+        # Let browsers keep the body but revalidate on every poll
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,69 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from users.middleware import BEARER_SUBPROTOCOL
+from .models import Conversation
+from .push import conversation_group
+
+
+# --- Conversation push consumer ---
+class ConversationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes new assistant messages (and, with WEBSOCKET_PUSH_TOKENS, streamed
+    tokens) to the client instead of having it poll latest-message.
+    WS /ws/aiassistant/   (SimpleJWT access token, see users/middleware.py)
+
+    Client -> server:
+    - ``{"action": "subscribe", "conversation": <id>}``
+    - ``{"action": "unsubscribe", "conversation": <id>}``
+
+    Server -> client:
+    - ``{"type": "subscribed" | "unsubscribed", "conversation": <id>}``
+    - ``{"type": "message", "message": {...}}``: a saved message, as in the REST API
+    - ``{"type": "token", "conversation": <id>, "content": "..."}``
+    - ``{"type": "error", "detail": "..."}``
+    """
+    UNAUTHORIZED = 4401
+
+    async def connect(self):
+        self.conversations = set()
+        if not self.scope["user"].is_authenticated:
+            await self.close(code=self.UNAUTHORIZED)
+            return
+        # Echo the subprotocol when the token came that way, or browsers drop the connection
+        subprotocol = BEARER_SUBPROTOCOL if BEARER_SUBPROTOCOL in self.scope.get("subprotocols", []) else None
+        await self.accept(subprotocol)
+
+    async def disconnect(self, code):
+        for conversation_id in getattr(self, "conversations", ()):
+            await self.channel_layer.group_discard(conversation_group(conversation_id), self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        action = content.get("action")
+        conversation_id = content.get("conversation")
+        if action not in ("subscribe", "unsubscribe") or not isinstance(conversation_id, int):
+            await self.send_json({"type": "error", "detail": "Expected an action and a conversation id."})
+            return
+
+        if action == "unsubscribe":
+            self.conversations.discard(conversation_id)
+            await self.channel_layer.group_discard(conversation_group(conversation_id), self.channel_name)
+            await self.send_json({"type": "unsubscribed", "conversation": conversation_id})
+            return
+
+        if not await self.owns(conversation_id):
+            await self.send_json({"type": "error", "detail": "Conversation not found."})
+            return
+        self.conversations.add(conversation_id)
+        await self.channel_layer.group_add(conversation_group(conversation_id), self.channel_name)
+        await self.send_json({"type": "subscribed", "conversation": conversation_id})
+
+    @database_sync_to_async
+    def owns(self, conversation_id):
+        return Conversation.objects.filter(id=conversation_id, user=self.scope["user"]).exists()
+
+    # --- Channel layer events (see push.py) ---
+    async def message_created(self, event):
+        await self.send_json({"type": "message", "message": event["message"]})
+
+    async def message_token(self, event):
+        await self.send_json({"type": "token", "conversation": event["conversation"], "content": event["content"]})
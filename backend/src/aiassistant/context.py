@@ -0,0 +1,119 @@
+import math
+import re
+from dataclasses import dataclass, field
+from django.conf import settings
+from .models import Message
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+TOKENS_PER_WORD = 4 / 3   # rough English average for Granite's tokenizer
+MIN_TURN_TOKENS = 4       # smallest cost of a turn, verbatim or as a summary line
+
+
+# --- Helper function: Estimate tokens ---
+def count_tokens(text: str) -> int:
+    """Cheap token estimate from the word count (no tokenizer round trip)."""
+    return math.ceil(len(text.split()) * TOKENS_PER_WORD)
+
+
+# --- Helper function: Summarize a turn in one line ---
+def summarize_turn(message, max_words=25) -> str:
+    first_sentence = SENTENCE_RE.split(message.content.strip(), 1)[0]
+    words = first_sentence.split()
+    text = " ".join(words[:max_words]) + ("..." if len(words) > max_words else "")
+    role = "User asked" if message.sender == "user" else "Assistant answered"
+    return f"- {role}: {text}"
+
+
+# --- Helper function: Fold turns into the rolling summary ---
+def fold_into_summary(summary: str, messages, max_tokens: int) -> str:
+    """Append one line per folded turn, dropping the oldest lines past ``max_tokens``."""
+    lines = [line for line in summary.splitlines() if line] + [summarize_turn(m) for m in messages]
+    kept, used = [], 0
+    for line in reversed(lines):
+        used += count_tokens(line)
+        if kept and used > max_tokens:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+
+@dataclass
+class AssembledContext:
+    prompt: str
+    tokens: dict = field(default_factory=dict)   # tokens per prompt section, plus "total"
+    history_turns: int = 0
+    summarized_turns: int = 0
+
+    @property
+    def is_standalone(self):
+        """True when the prompt does not depend on earlier turns (safe to cache by question)."""
+        return not self.history_turns and not self.tokens.get("summary")
+
+
+# --- Context assembler ---
+class ContextAssembler:
+    """
+    Fits prior turns of a conversation into a token budget.
+
+    Recent turns are kept verbatim, newest first, while they fit. Turns that
+    no longer fit are folded into ``Conversation.summary`` once and never
+    re-read: only messages after ``summarized_until`` are loaded per request,
+    so prompt size and query cost stay bounded as the conversation grows.
+    """
+
+    def __init__(self, budget=None, summary_budget=None):
+        self.budget = budget or settings.CONTEXT_TOKEN_BUDGET
+        self.summary_budget = summary_budget or settings.CONTEXT_SUMMARY_TOKENS
+
+    def assemble(self, message, system_prompt, sources=""):
+        conversation = message.conversation
+        question = message.content.strip()
+
+        history = Message.objects.in_conversation(conversation).filter(id__lt=message.id)
+        if conversation.summarized_until:
+            history = history.filter(id__gt=conversation.summarized_until)
+        # Every turn costs at least MIN_TURN_TOKENS, so older rows could never make it into the prompt
+        history = list(history.order_by("-id")[:(self.budget + self.summary_budget) // MIN_TURN_TOKENS])
+
+        tokens = {
+            "system": count_tokens(system_prompt),
+            "sources": count_tokens(sources),
+            "question": count_tokens(question),
+            "summary": count_tokens(conversation.summary),
+        }
+        # The summary may grow up to its own budget once older turns are folded in
+        available = self.budget - tokens["system"] - tokens["sources"] - tokens["question"] - self.summary_budget
+
+        # --- Keep the newest turns that fit ---
+        kept = []
+        for turn in history:
+            cost = count_tokens(turn.content) + 2
+            if cost > available:
+                break
+            kept.append(turn)
+            available -= cost
+        folded = history[len(kept):]
+
+        # --- Fold the rest into the rolling summary, oldest first ---
+        if folded:
+            conversation.summary = fold_into_summary(conversation.summary, reversed(folded), self.summary_budget)
+            conversation.summarized_until = folded[0].id
+            conversation.save(update_fields=["summary", "summarized_until"])
+            tokens["summary"] = count_tokens(conversation.summary)
+
+        kept.reverse()
+        transcript = "\n".join(f"{turn.sender.capitalize()}: {turn.content.strip()}" for turn in kept)
+        tokens["history"] = count_tokens(transcript)
+
+        sections = [system_prompt]
+        if sources:
+            sections.append(sources)
+        if conversation.summary:
+            sections.append(f"Summary of the earlier conversation:\n{conversation.summary}")
+        if transcript:
+            sections.append(f"Recent conversation:\n{transcript}")
+        sections.append(f"User question:\n{question}")
+
+        prompt = "\n\n".join(sections)
+        tokens["total"] = count_tokens(prompt)
+        return AssembledContext(prompt, tokens, history_turns=len(kept), summarized_turns=len(folded))
@@ -0,0 +1,117 @@
+"""
+Streaming export of a user's conversations as NDJSON or CSV.
+
+Rows come from a single ordered query read through ``.iterator(chunk_size)``
+(a server-side cursor on PostgreSQL, chunked fetches on SQLite) and are
+encoded, buffered and optionally gzipped one chunk at a time, so memory use
+does not depend on the size of the history.
+
+- NDJSON: one conversation per line, with its messages nested.
+- CSV: one message per row, repeating the conversation columns
+  (conversations without messages get a row with empty message columns).
+  Text cells that a spreadsheet would run as a formula get a leading ``'``.
+
+Archived conversations (see archive.py) are not included until restored.
+"""
+import csv
+import json
+import zlib
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Conversation
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+CONVERSATION_COLUMNS = ("id", "title", "created_at")
+MESSAGE_COLUMNS = ("messages__id", "messages__sender", "messages__content", "messages__created_at")
+CSV_HEADER = (
+    "conversation_id", "conversation_title", "conversation_created_at",
+    "message_id", "sender", "content", "message_created_at",
+)
+BUFFER_BYTES = 64 * 1024
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+# ---- Helper function: One row per message, in conversation order
+def export_rows(user, chunk_size=None):
+    rows = Conversation.objects.filter(user=user).order_by(
+        "id", "messages__created_at", "messages__id"
+    ).values_list(*CONVERSATION_COLUMNS, *MESSAGE_COLUMNS)
+    return rows.iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+
+def ndjson_lines(rows):
+    """Group consecutive message rows into one JSON line per conversation."""
+    current = None
+    for conversation_id, title, created_at, message_id, sender, content, message_created_at in rows:
+        if current is None or current["id"] != conversation_id:
+            if current is not None:
+                yield json.dumps(current, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+            current = {"id": conversation_id, "title": title, "created_at": created_at, "messages": []}
+        if message_id is not None:
+            current["messages"].append(
+                {"id": message_id, "sender": sender, "content": content, "created_at": message_created_at}
+            )
+    if current is not None:
+        yield json.dumps(current, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+class Echo:
+    """File-like object whose write() hands the line back (csv.writer without a buffer)."""
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value   # shown as text, not run, when the file is opened in a spreadsheet
+    return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+# ---- Helper function: Fewer, larger chunks for the response
+def buffered(lines, size=BUFFER_BYTES):
+    parts, length = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        parts.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(parts)
+            parts, length = [], 0
+    if parts:
+        yield b"".join(parts)
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(user, fmt="ndjson", compress=False, chunk_size=None):
+    """Encoded export of ``user``'s conversations as an iterator of byte chunks."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}")
+    encode = ndjson_lines if fmt == "ndjson" else csv_lines
+    chunks = buffered(encode(export_rows(user, chunk_size)))
+    return gzipped(chunks) if compress else chunks
+
+
+def export_filename(fmt, compress=False, date=None):
+    name = f"conversations-{date:%Y%m%d}.{fmt}" if date else f"conversations.{fmt}"
+    return name + ".gz" if compress else name
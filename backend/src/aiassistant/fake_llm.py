@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+from django.conf import settings
+
+DEFAULT_REPLY = (
+    "**Staying healthy** starts with the basics:\n"
+    "- Sleep seven or more hours a night\n"
+    "- Eat plenty of vegetables and limit salt\n"
+    "- Move for at least 150 minutes a week\n"
+    "Source: World Health Organization."
+)
+
+
+class FakeLLMError(ConnectionError):
+    """Raised by FakeLLM to simulate a failed Watsonx call (transient, like a dropped connection)."""
+
+
+# ---- Local stand-in for WatsonxLLM (benchmarks, load tests, tests)
+class FakeLLM:
+    """
+    Mimics the parts of WatsonxLLM the app uses (``invoke``, ``stream``,
+    ``generate``) without any network access.
+
+    - ``latency``: seconds before the first token (time to first byte).
+    - ``tokens_per_second``: generation speed; 0 returns the reply at once.
+    - ``failure_rate``: probability that a call raises FakeLLMError.
+    - ``slow_rate`` / ``slow_latency``: probability that a call waits
+      ``slow_latency`` instead of ``latency`` (tail latency, or a hang).
+    - ``faults``: per-call script played before the random faults, one
+      entry per call: None (normal), "error", "slow" or "fatal" (an
+      error that is not worth retrying).
+    - ``seed``: makes failures reproducible between runs.
+    """
+
+    def __init__(self, reply=DEFAULT_REPLY, latency=0.0, tokens_per_second=0.0, failure_rate=0.0,
+                 slow_rate=0.0, slow_latency=0.0, faults=(), seed=None):
+        self.reply = reply
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.faults = list(faults)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            latency=settings.FAKE_LLM_LATENCY,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            failure_rate=settings.FAKE_LLM_FAILURE_RATE,
+            slow_rate=settings.FAKE_LLM_SLOW_RATE,
+            slow_latency=settings.FAKE_LLM_SLOW_LATENCY,
+            seed=settings.FAKE_LLM_SEED,
+        )
+
+    def _next_fault(self):
+        with self._lock:
+            self.calls += 1
+            if self.faults:
+                return self.faults.pop(0)
+            if self._random.random() < self.failure_rate:
+                return "error"
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                return "slow"
+            return None
+
+    def _start_call(self):
+        fault = self._next_fault()
+        time.sleep(self.slow_latency if fault == "slow" else self.latency)
+        if fault == "error":
+            raise FakeLLMError("Simulated Watsonx failure")
+        if fault == "fatal":
+            raise ValueError("Simulated invalid request")
+
+    def _tokens(self, prompt):
+        return [word + " " for word in self.reply.split(" ")]
+
+    def stream(self, prompt, **kwargs):
+        self._start_call()
+        delay = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        for token in self._tokens(prompt):
+            if delay:
+                time.sleep(delay)
+            yield token
+
+    def invoke(self, prompt, **kwargs):
+        return "".join(self.stream(prompt)).strip()
+
+    def generate(self, prompts, **kwargs):
+        """Multi-prompt call, shaped like LangChain's ``LLMResult.generations``."""
+        self._start_call()
+        if self.tokens_per_second:
+            time.sleep(len(self._tokens(prompts[0])) / self.tokens_per_second)
+        return FakeLLMResult([[FakeGeneration(self.reply)] for _ in prompts])
+
+
+class FakeGeneration:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeLLMResult:
+    def __init__(self, generations):
+        self.generations = generations
@@ -0,0 +1,254 @@
+"""
+Content-addressed image storage with variants built off the request.
+
+An upload is hashed while it is read (SHA-256) and stored once, as
+``images/<first two hex digits>/<hash><ext>`` in the default storage.
+Uploading the same bytes again reuses the existing ``ImageAsset``, its file
+and its variants (an asset that failed to build is queued again).
+
+New assets are queued; a worker decodes each original once and writes
+WebP variants (``display`` and ``thumb``, see IMAGE_* settings) next to it:
+
+- IMAGE_QUEUE="inprocess": a small thread pool in the web process, fed after
+  the upload commits (Pillow releases the GIL while decoding and encoding).
+- IMAGE_QUEUE="db": ``manage.py run_image_worker`` claims queued assets and
+  renders them in a process pool.
+
+Serializers only ever return the URLs of the variants, which are re-encoded
+without metadata: the original keeps whatever the camera wrote into it (EXIF,
+GPS position) and is never linked to. Until an asset is ready only its status
+is returned. Names never change for given content, so everything under
+MEDIA_URL/images/ may be cached forever.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+from .models import ImageAsset
+
+logger = logging.getLogger(__name__)
+
+SAFE_EXTENSION = re.compile(r"^\.[a-z0-9]{1,5}$")
+
+
+# ---- Storage names derived from the content hash
+def original_name(digest, filename=""):
+    ext = os.path.splitext(filename)[1].lower()
+    return f"images/{digest[:2]}/{digest}{ext if SAFE_EXTENSION.match(ext) else ''}"
+
+
+def variant_name(digest, variant):
+    return f"images/{digest[:2]}/{digest}-{variant}.webp"
+
+
+def variant_sizes():
+    """(name, longest side) pairs, largest first: each variant is scaled down from the previous one."""
+    return (("display", settings.IMAGE_DISPLAY_SIZE), ("thumb", settings.IMAGE_THUMB_SIZE))
+
+
+# ---- Helper function: Store an upload once per content hash
+def store_image(upload) -> ImageAsset:
+    """Hash ``upload`` (a Django File) and return its asset, storing and queueing it if new."""
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    digest = digest.hexdigest()
+
+    asset = ImageAsset.objects.filter(sha256=digest).first()
+    if asset is not None:
+        if asset.status == ImageAsset.STATUS_FAILED:
+            retry_image(asset)
+        return asset
+
+    name = original_name(digest, upload.name or "")
+    if not default_storage.exists(name):
+        upload.seek(0)
+        name = default_storage.save(name, upload)
+    asset, created = ImageAsset.objects.get_or_create(
+        sha256=digest, defaults={"original": name, "size": upload.size},
+    )
+    if created:
+        enqueue_image(asset)
+    elif asset.original.name != name:
+        default_storage.delete(name)   # lost a race with an identical upload
+    return asset
+
+
+def retry_image(asset: ImageAsset):
+    """Queue a failed asset again (it may have failed on something transient, like storage)."""
+    requeued = ImageAsset.objects.filter(id=asset.id, status=ImageAsset.STATUS_FAILED).update(
+        status=ImageAsset.STATUS_QUEUED, started_at=None, error="",
+    )
+    if requeued:
+        asset.status, asset.started_at, asset.error = ImageAsset.STATUS_QUEUED, None, ""
+        enqueue_image(asset)
+
+
+def image_variants(asset, request=None):
+    """Serializer representation of an asset: status, size, and URLs of each built variant (never the original)."""
+    if asset is None:
+        return None
+
+    def url(name):
+        location = default_storage.url(name)
+        return request.build_absolute_uri(location) if request is not None else location
+
+    return {
+        "status": asset.status,
+        "width": asset.width,
+        "height": asset.height,
+        **{variant: url(info["name"]) for variant, info in asset.variants.items()},
+    }
+
+
+# ---- Rendering (no Django, so it can run in another process)
+def render_variants(data: bytes, sizes, quality):
+    """
+    Decode an image once and return ``(width, height, [(variant, webp bytes, width, height), ...])``.
+    Applies the EXIF orientation and drops metadata (camera, location). JPEGs are
+    decoded at a reduced scale when the largest variant allows it.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        if image.getexif().get(0x0112) in (5, 6, 7, 8):   # Orientation: rotated by 90 degrees
+            width, height = height, width
+        largest = max(side for _, side in sizes)
+        image.draft("RGB", (largest, largest))   # JPEG only: decode at 1/2, 1/4 or 1/8 scale
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in image.mode or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        rendered = []
+        for variant, side in sizes:
+            image.thumbnail((side, side), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            out = io.BytesIO()
+            image.save(out, "WEBP", quality=quality)
+            rendered.append((variant, out.getvalue(), image.width, image.height))
+    return width, height, rendered
+
+
+def renderer():
+    """render_variants bound to the current settings (picklable, for process pools)."""
+    return partial(render_variants, sizes=variant_sizes(), quality=settings.IMAGE_WEBP_QUALITY)
+
+
+# --- In-process worker pool (created on first use) ---
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="images")
+    return _executor
+
+
+def enqueue_image(asset: ImageAsset):
+    if settings.IMAGE_QUEUE == "inprocess":
+        transaction.on_commit(lambda: get_executor().submit(process_image_in_worker, asset.id))
+
+
+# --- Helper function: Claim an asset ---
+def claim_image(asset_id: int) -> bool:
+    """Atomically move a queued asset to running. Returns False if someone else got it."""
+    return ImageAsset.objects.filter(id=asset_id, status=ImageAsset.STATUS_QUEUED).update(
+        status=ImageAsset.STATUS_RUNNING,
+        started_at=timezone.now(),
+    ) == 1
+
+
+def claim_next_image():
+    """Claim the oldest queued asset, or return None when the queue is empty."""
+    while True:
+        asset_id = (
+            ImageAsset.objects.filter(status=ImageAsset.STATUS_QUEUED)
+            .order_by("created_at", "id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if asset_id is None:
+            return None
+        if claim_image(asset_id):
+            return ImageAsset.objects.get(id=asset_id)
+
+
+def requeue_stale_images(older_than: timedelta) -> int:
+    """Put assets left running by a dead worker back on the queue."""
+    return ImageAsset.objects.filter(
+        status=ImageAsset.STATUS_RUNNING,
+        started_at__lt=timezone.now() - older_than,
+    ).update(status=ImageAsset.STATUS_QUEUED, started_at=None)
+
+
+# --- Helper function: Build the variants of a claimed asset ---
+def process_image(asset: ImageAsset, render=None) -> ImageAsset:
+    """Render ``asset`` with ``render(data)`` (default: in this thread) and save the variants."""
+    asset.attempts += 1
+    try:
+        with default_storage.open(asset.original.name, "rb") as original:
+            data = original.read()
+        asset.width, asset.height, rendered = (render or renderer())(data)
+        variants = {}
+        for variant, body, width, height in rendered:
+            name = variant_name(asset.sha256, variant)
+            if default_storage.exists(name):
+                default_storage.delete(name)   # left over by an interrupted attempt
+            variants[variant] = {"name": default_storage.save(name, ContentFile(body)), "width": width, "height": height}
+        asset.variants = variants
+        asset.status = ImageAsset.STATUS_READY
+        asset.error = ""
+    except Exception as e:
+        logger.exception("Image processing failed for asset %s", asset.id)
+        asset.status = ImageAsset.STATUS_FAILED
+        asset.error = str(e)
+
+    asset.processed_at = timezone.now()
+    asset.save(update_fields=["attempts", "width", "height", "variants", "status", "error", "processed_at"])
+    return asset
+
+
+def process_image_in_worker(asset_id: int):
+    """Entry point for pool threads: claim, render, and release the DB connection."""
+    close_old_connections()
+    try:
+        if claim_image(asset_id):
+            process_image(ImageAsset.objects.get(id=asset_id))
+    finally:
+        close_old_connections()
+
+
+def process_next_image(render=None):
+    """Claim and process one queued asset. Returns it, or None if the queue was empty."""
+    asset = claim_next_image()
+    if asset is not None:
+        process_image(asset, render)
+    return asset
+
+
+def collect_metrics():
+    """Queued/running image counts for fastai.metrics (one aggregate query per scrape)."""
+    counts = dict(
+        ImageAsset.objects.filter(status__in=[ImageAsset.STATUS_QUEUED, ImageAsset.STATUS_RUNNING])
+        .values_list("status").annotate(n=Count("id")).order_by()
+    )
+    return [
+        ("image_assets", "gauge", "Uploaded images waiting for or building their variants.",
+         {(("status", status),): counts.get(status, 0)
+          for status in (ImageAsset.STATUS_QUEUED, ImageAsset.STATUS_RUNNING)}),
+    ]
@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+from .models import GenerationJob
+from .services import generate_reply, save_ai_message
+
+logger = logging.getLogger(__name__)
+
+# --- In-process worker pool (created on first use) ---
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()     # job ids waiting in or running on this process's pool
+_pending_lock = threading.Lock()
+_recovery = None
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.GENERATION_WORKERS,
+                thread_name_prefix="generation",
+            )
+    return _executor
+
+
+# --- Helper function: Queue a reply for generation ---
+def enqueue_generation(message, prompt: str, cacheable: bool = True) -> GenerationJob:
+    """Create a job for the user message; in-process mode also schedules it."""
+    job = GenerationJob.objects.create(
+        conversation=message.conversation,
+        user_message=message,
+        prompt=prompt,
+        cacheable=cacheable,
+    )
+    if settings.GENERATION_QUEUE == "inprocess":
+        # Only hand the job to a worker once the row is visible to other connections
+        transaction.on_commit(lambda: submit_job(job.id))
+    return job
+
+
+def submit_job(job_id: int):
+    """Run a job on this process's pool, unless it is already waiting there."""
+    with _pending_lock:
+        if job_id in _pending:
+            return
+        _pending.add(job_id)
+    get_executor().submit(run_job_in_worker, job_id)
+
+
+# --- Helper function: Claim a job ---
+def claim_job(job_id: int) -> bool:
+    """Atomically move a queued job to running. Returns False if someone else got it."""
+    return GenerationJob.objects.filter(id=job_id, status=GenerationJob.STATUS_QUEUED).update(
+        status=GenerationJob.STATUS_RUNNING,
+        started_at=timezone.now(),
+    ) == 1
+
+
+def claim_next_job():
+    """Claim the oldest queued job, or return None when the queue is empty."""
+    while True:
+        job_id = (
+            GenerationJob.objects.filter(status=GenerationJob.STATUS_QUEUED)
+            .order_by("created_at", "id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        if claim_job(job_id):
+            return GenerationJob.objects.select_related("conversation", "user_message").get(id=job_id)
+
+
+def requeue_stale_jobs(older_than: timedelta) -> int:
+    """Put jobs left running by a dead worker back on the queue."""
+    return GenerationJob.objects.filter(
+        status=GenerationJob.STATUS_RUNNING,
+        started_at__lt=timezone.now() - older_than,
+    ).update(status=GenerationJob.STATUS_QUEUED, started_at=None)
+
+
+# --- Helper function: Run a claimed job ---
+def run_job(job: GenerationJob) -> GenerationJob:
+    """Call the LLM for a claimed job and save the reply through save_ai_message."""
+    job.attempts += 1
+    try:
+        question = job.user_message.content if job.cacheable else None
+        ai_response = generate_reply(job.prompt, question=question, conversation=job.conversation)
+        job.assistant_message = save_ai_message(job.conversation_id, ai_response)
+        job.status = GenerationJob.STATUS_DONE
+    except Exception as e:
+        # No assistant message; job.error is for operators and is not serialized
+        logger.exception("WatsonxAI error in job %s", job.id)
+        job.status = GenerationJob.STATUS_FAILED
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["attempts", "status", "error", "assistant_message", "finished_at"])
+    return job
+
+
+def run_job_in_worker(job_id: int):
+    """Entry point for pool threads: claim, run, and release the DB connection."""
+    close_old_connections()
+    try:
+        if claim_job(job_id):
+            run_job(GenerationJob.objects.select_related("conversation", "user_message").get(id=job_id))
+    finally:
+        with _pending_lock:
+            _pending.discard(job_id)
+        close_old_connections()
+
+
+# --- In-process mode: pick up jobs a dead or restarted process left behind ---
+def recover_jobs() -> int:
+    """
+    Requeue jobs running for more than GENERATION_STALE_AFTER seconds, then hand
+    jobs queued for more than GENERATION_RECOVER_INTERVAL seconds to this
+    process's pool (their process died before running them). Every web process
+    may do this: claim_job() lets only one of them run a job.
+    """
+    requeue_stale_jobs(timedelta(seconds=settings.GENERATION_STALE_AFTER))
+    waiting = list(
+        GenerationJob.objects.filter(
+            status=GenerationJob.STATUS_QUEUED,
+            created_at__lt=timezone.now() - timedelta(seconds=settings.GENERATION_RECOVER_INTERVAL),
+        ).order_by("created_at", "id").values_list("id", flat=True)
+    )
+    for job_id in waiting:
+        submit_job(job_id)
+    return len(waiting)
+
+
+def start_job_recovery():
+    """Run recover_jobs() every GENERATION_RECOVER_INTERVAL seconds on a daemon thread (once per process)."""
+    global _recovery
+    with _pending_lock:
+        if _recovery is None:
+            _recovery = threading.Thread(target=recover_jobs_forever, name="generation-recovery", daemon=True)
+            _recovery.start()
+
+
+def recover_jobs_forever():
+    while True:
+        time.sleep(settings.GENERATION_RECOVER_INTERVAL)
+        close_old_connections()
+        try:
+            recovered = recover_jobs()
+            if recovered:
+                logger.info("Resubmitted %s orphaned generation job(s)", recovered)
+        except Exception:
+            logger.exception("Generation job recovery failed")
+        finally:
+            close_old_connections()
+
+
+def process_next_job():
+    """Claim and run one queued job. Returns the job, or None if the queue was empty."""
+    job = claim_next_job()
+    if job is not None:
+        run_job(job)
+    return job
+
+
+def collect_metrics():
+    """Queued/running job counts for fastai.metrics (one aggregate query per scrape)."""
+    counts = dict(
+        GenerationJob.objects.filter(status__in=[GenerationJob.STATUS_QUEUED, GenerationJob.STATUS_RUNNING])
+        .values_list("status").annotate(n=Count("id")).order_by()
+    )
+    return [
+        ("generation_jobs", "gauge", "Generation jobs waiting or running.",
+         {(("status", status),): counts.get(status, 0)
+          for status in (GenerationJob.STATUS_QUEUED, GenerationJob.STATUS_RUNNING)}),
+    ]
@@ -0,0 +1,189 @@
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# --- Model configuration ---
+MODEL_ID = "ibm/granite-3-3-8b-instruct"
+GENERATION_PARAMS = {
+    "decoding_method": "greedy",
+    "temperature": 0,
+    "min_new_tokens": 10,
+    "max_new_tokens": 800,
+    "repetition_penalty": 1.2,
+}
+SYSTEM_PROMPT = (
+    "You are a professional health assistant. Always answer health-related questions accurately and politely.\n"
+    "Do NOT create any new questions or topics. Only answer the user question.\n\n"
+    "- Always provide sources for only health related question.\n"
+    "- Use Markdown formatting for emphasis:\n"
+    "  - **Bold important terms**\n"
+    "  - Use bullet points for lists\n"
+    "  - Use tables when appropriate\n"
+    "  - Use headings for sections"
+)
+
+
+# --- LLM provider interface ---
+class LLMProvider:
+    """
+    Hands out LLM objects with ``invoke`` / ``stream`` / ``generate``.
+
+    Providers import their SDKs on first use, never at module import, so
+    worker boot and management commands (migrate, collectstatic...) do not
+    load LangChain or the IBM SDK. LLM_BACKEND picks the provider.
+    """
+
+    def get(self, model_id=MODEL_ID, params=None):
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Do the expensive first-use work (imports, clients, tokens) ahead of the first message."""
+        self.get()
+
+    def stats(self):
+        return {}
+
+
+# --- Process-wide Watsonx client registry ---
+class LLMRegistry(LLMProvider):
+    """
+    Keeps one Watsonx client per (model id, params) for the whole process.
+
+    - All models share a single APIClient, so the IAM token and the keep-alive
+      HTTP connection pool are created once instead of on every message.
+    - The token is checked before each checkout; the SDK refreshes it ahead of
+      expiry, so requests never start with a token about to run out.
+    - ``stats()`` reports how often clients were created, reused and refreshed.
+    - ``langchain_ibm`` and ``ibm_watsonx_ai`` are imported by the first ``get()``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._api_client = None
+        self._token = None
+        self._llms = {}
+        self._stats = {"clients_created": 0, "clients_reused": 0, "token_refreshes": 0}
+
+    @staticmethod
+    def make_key(model_id, params):
+        return model_id, tuple(sorted((params or {}).items()))
+
+    def get_api_client(self):
+        with self._lock:
+            if self._api_client is None:
+                import httpx
+                from ibm_watsonx_ai import APIClient, Credentials
+
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=settings.WATSONX_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.WATSONX_MAX_CONNECTIONS,
+                        keepalive_expiry=settings.WATSONX_KEEPALIVE_SECONDS,
+                    ),
+                    timeout=httpx.Timeout(settings.LLM_ATTEMPT_TIMEOUT, connect=10),
+                )
+                self._api_client = APIClient(
+                    credentials=Credentials(url=settings.WATSONX_URL, api_key=settings.WATSONX_APIKEY),
+                    project_id=settings.WATSONX_PROJECT_ID,
+                    httpx_client=http_client,
+                )
+            return self._api_client
+
+    def get(self, model_id=MODEL_ID, params=None):
+        params = dict(GENERATION_PARAMS if params is None else params)
+        key = self.make_key(model_id, params)
+        api_client = self.get_api_client()
+
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                from langchain_ibm import WatsonxLLM
+
+                llm = WatsonxLLM(model_id=model_id, watsonx_client=api_client, params=params)
+                self._llms[key] = llm
+                self._stats["clients_created"] += 1
+            else:
+                self._stats["clients_reused"] += 1
+
+        self.refresh_token()
+        return llm
+
+    def refresh_token(self):
+        """Touch the token so the SDK renews it before it expires; count renewals."""
+        token = self.get_api_client().token
+        with self._lock:
+            if self._token is not None and token != self._token:
+                self._stats["token_refreshes"] += 1
+            self._token = token
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, clients=len(self._llms))
+
+    def clear(self):
+        with self._lock:
+            self._llms.clear()
+            self._api_client = None
+            self._token = None
+
+
+registry = LLMRegistry()
+
+
+# --- Local stand-in provider (see fake_llm.py) ---
+class FakeProvider(LLMProvider):
+    """One FakeLLM for the whole process, whatever model or params are asked for."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._llm = None
+
+    def get(self, model_id=MODEL_ID, params=None):
+        with self._lock:
+            if self._llm is None:
+                from .fake_llm import FakeLLM
+
+                self._llm = FakeLLM.from_settings()
+            return self._llm
+
+
+PROVIDERS = {
+    "watsonx": registry,
+    "fake": FakeProvider(),
+}
+
+
+def get_provider():
+    """The provider named by LLM_BACKEND, or a dotted path to a custom LLMProvider instance."""
+    return PROVIDERS.get(settings.LLM_BACKEND) or import_string(settings.LLM_BACKEND)
+
+
+# --- Helper function: Get a pooled LLM client ---
+def get_llm(model_id=MODEL_ID, params=None):
+    """Return the process-wide LLM for the given model and params (LLM_BACKEND picks which)."""
+    return get_provider().get(model_id, params)
+
+
+def collect_metrics():
+    """Client pool counters for fastai.metrics."""
+    stats = registry.stats()
+    return [
+        ("llm_clients_created_total", "counter", "Watsonx clients created.", {(): stats["clients_created"]}),
+        ("llm_clients_reused_total", "counter", "Watsonx client checkouts served from the pool.", {(): stats["clients_reused"]}),
+        ("llm_token_refreshes_total", "counter", "IAM token refreshes.", {(): stats["token_refreshes"]}),
+    ]
+
+
+# --- Helper function: Normalize raw LLM output ---
+def normalize_response(raw_response) -> str:
+    """Turn whatever the LLM returned into a plain, stripped string."""
+    if hasattr(raw_response, "content"):
+        ai_response = raw_response.content
+    elif isinstance(raw_response, dict) and "generations" in raw_response:
+        ai_response = "\n".join([g.get("text", "") for g in raw_response["generations"]])
+    elif isinstance(raw_response, list):
+        ai_response = "\n".join(str(part) for part in raw_response)
+    else:
+        ai_response = str(raw_response)
+
+    return ai_response.strip()
@@ -0,0 +1,49 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from aiassistant.archive import archive_batch, retention_cutoff, stale_conversations
+
+
+class Command(BaseCommand):
+    help = (
+        "Move conversations idle for longer than the retention window (MESSAGE_RETENTION_DAYS) "
+        "into gzipped JSONL files under ARCHIVE_DIR, in batches, and delete them from the hot tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Retention in days (default: MESSAGE_RETENTION_DAYS).")
+        parser.add_argument("--batch-size", type=int, default=None, help="Conversations per archive file and transaction.")
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many conversations.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be archived.")
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options["days"])
+        if cutoff is None:
+            self.stdout.write("Retention is disabled (MESSAGE_RETENTION_DAYS=0); pass --days to archive anyway.")
+            return
+        batch_size = options["batch_size"] or settings.ARCHIVE_BATCH_SIZE
+        limit = options["limit"]
+
+        if options["dry_run"]:
+            count = stale_conversations(cutoff).count()
+            self.stdout.write(f"{count} conversations idle since before {cutoff:%Y-%m-%d %H:%M} would be archived.")
+            return
+
+        started = time.perf_counter()
+        archived, last_id = 0, 0
+        while limit is None or archived < limit:
+            size = batch_size if limit is None else min(batch_size, limit - archived)
+            # Keyset over ids, so each batch is one index range scan however much was archived before
+            ids = list(
+                stale_conversations(cutoff).filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:size]
+            )
+            if not ids:
+                break
+            archived += archive_batch(ids, cutoff)
+            last_id = ids[-1]
+            self.stdout.write(f"Archived {archived} conversations (up to id {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} conversations idle since before {cutoff:%Y-%m-%d %H:%M} "
+            f"into {settings.ARCHIVE_DIR} in {time.perf_counter() - started:.1f}s."
+        ))
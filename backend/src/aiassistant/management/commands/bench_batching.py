@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from django.core.management.base import BaseCommand
+from aiassistant.batching import BatchDispatcher
+from aiassistant.fake_llm import FakeLLM
+
+
+class CappedLLM:
+    """FakeLLM behind a limit on concurrent upstream requests, like the Watsonx quota."""
+
+    def __init__(self, llm, concurrency):
+        self.llm = llm
+        self._slots = threading.Semaphore(concurrency)
+
+    def invoke(self, prompt):
+        with self._slots:
+            return self.llm.invoke(prompt)
+
+    def generate(self, prompts):
+        with self._slots:
+            return self.llm.generate(prompts)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare one invoke per prompt with micro-batched generate calls against the "
+        "local stand-in LLM: throughput, per-prompt latency and upstream calls."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--callers", type=int, default=32, help="Concurrent users sending prompts.")
+        parser.add_argument("--prompts", type=int, default=4, help="Prompts sent by each caller.")
+        parser.add_argument("--windows", default="0,5,20,50", help="Comma-separated batch windows in ms (0 = no batching).")
+        parser.add_argument("--batch-size", type=int, default=8)
+        parser.add_argument("--upstream-concurrency", type=int, default=4, help="Concurrent calls the LLM accepts.")
+        parser.add_argument("--latency", type=float, default=0.2, help="Stand-in LLM time to first token (s).")
+        parser.add_argument("--tokens-per-second", type=float, default=200)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'window ms':>9} {'calls':>6} {'prompts/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+        for window in [int(w) for w in options["windows"].split(",")]:
+            fake = FakeLLM(latency=options["latency"], tokens_per_second=options["tokens_per_second"])
+            llm = CappedLLM(fake, options["upstream_concurrency"])
+
+            if window:
+                dispatcher = BatchDispatcher(
+                    window / 1000, options["batch_size"], options["upstream_concurrency"], llm_factory=lambda: llm
+                )
+                send = dispatcher.generate
+            else:
+                send = llm.invoke
+
+            latencies, elapsed = self.run(send, options["callers"], options["prompts"])
+            latencies = np.array(latencies) * 1000
+            self.stdout.write(
+                f"{window:>9} {fake.calls:>6} {len(latencies) / elapsed:>10.1f} {np.percentile(latencies, 50):>9.1f} "
+                f"{np.percentile(latencies, 95):>9.1f} {latencies.max():>9.1f}"
+            )
+
+    @staticmethod
+    def run(send, callers, prompts):
+        def caller(i):
+            timings = []
+            for j in range(prompts):
+                began = time.perf_counter()
+                send(f"Question {i}-{j}")
+                timings.append(time.perf_counter() - began)
+            return timings
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=callers) as pool:
+            results = list(pool.map(caller, range(callers)))
+        return [t for timings in results for t in timings], time.perf_counter() - began
@@ -0,0 +1,107 @@
+import gc
+import os
+import resource
+import time
+from django.core.management.base import BaseCommand
+from django.db import reset_queries, transaction
+from rest_framework.renderers import JSONRenderer
+from aiassistant.export import export_stream
+from aiassistant.models import Conversation, Message
+from aiassistant.serializers import ConversationSerializer
+from users.models import UserAccount
+
+
+class Rollback(Exception):
+    pass
+
+
+def rss_mb():
+    """Current resident set size (Linux), else the peak so far."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Export a synthetic history (default one million messages) through the streaming "
+        "exporter and report throughput and memory along the way. --naive also serializes it "
+        "the old way (ConversationSerializer, everything in memory). Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1_000_000)
+        parser.add_argument("--per-conversation", type=int, default=16)
+        parser.add_argument("--format", dest="fmt", default="ndjson", choices=["ndjson", "csv"])
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--chunk-size", type=int, default=None)
+        parser.add_argument("--naive", action="store_true", help="Also time the in-memory serializer export.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = self.seed(options["messages"], options["per_conversation"])
+                self.stream(user, options)
+                if options["naive"]:
+                    self.naive(user)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, total, per_conversation):
+        started = time.perf_counter()
+        user = UserAccount.objects.create_user(email="bench-export@example.invalid", first_name="Bench", last_name="Export")
+        conversations = Conversation.objects.bulk_create(
+            [Conversation(user=user, title=f"Conversation {i}") for i in range(-(-total // per_conversation))],
+            batch_size=2000,
+        )
+        batch = []
+        for i in range(total):
+            conversation = conversations[i // per_conversation]
+            sender = "user" if i % 2 == 0 else "assistant"
+            batch.append(Message(conversation=conversation, sender=sender, content=f"Message {i} " + "lorem ipsum " * 8))
+            if len(batch) == 5000:
+                Message.objects.bulk_create(batch)
+                batch = []
+        Message.objects.bulk_create(batch)
+        reset_queries()  # DEBUG keeps every INSERT otherwise
+        gc.collect()
+        self.stdout.write(
+            f"Seeded {total} messages in {len(conversations)} conversations in {time.perf_counter() - started:.1f}s"
+        )
+        return user
+
+    def stream(self, user, options):
+        baseline = rss_mb()
+        samples, written = [], 0
+        started = time.perf_counter()
+        chunks = export_stream(user, options["fmt"], compress=options["gzip"], chunk_size=options["chunk_size"])
+        for i, chunk in enumerate(chunks):
+            written += len(chunk)
+            if i % 50 == 0:
+                samples.append(rss_mb() - baseline)
+        elapsed = time.perf_counter() - started
+        samples.append(rss_mb() - baseline)
+
+        quarter = max(len(samples) // 4, 1)
+        self.stdout.write(
+            f"streaming {options['fmt']}{' gzip' if options['gzip'] else ''}: "
+            f"{written / 2**20:.1f} MB in {elapsed:.1f}s ({options['messages'] / elapsed:,.0f} messages/s)"
+        )
+        self.stdout.write(
+            "  RSS growth over baseline, MB (first quarter / last quarter / max): "
+            f"{max(samples[:quarter]):.1f} / {max(samples[-quarter:]):.1f} / {max(samples):.1f}"
+        )
+
+    def naive(self, user):
+        baseline = rss_mb()
+        started = time.perf_counter()
+        queryset = Conversation.objects.filter(user=user).prefetch_related("messages")
+        body = JSONRenderer().render(ConversationSerializer(queryset, many=True).data)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"naive serializer: {len(body) / 2**20:.1f} MB in {elapsed:.1f}s, "
+            f"RSS growth {rss_mb() - baseline:.1f} MB"
+        )
@@ -0,0 +1,89 @@
+import io
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from aiassistant.images import render_variants, renderer, variant_sizes
+
+
+def phone_photo(rng, width, height):
+    """A JPEG with gradients and sensor-like noise, about the size a phone camera writes."""
+    from PIL import Image
+
+    noise = Image.effect_noise((width // 4, height // 4), rng.randint(20, 60)).resize((width, height))
+    red = Image.linear_gradient("L").resize((width, height))
+    blue = Image.radial_gradient("L").resize((width, height))
+    out = io.BytesIO()
+    Image.merge("RGB", (red, noise, blue)).save(out, "JPEG", quality=92)
+    return out.getvalue()
+
+
+def naive_render(data, sizes, quality):
+    """The straightforward version: full-resolution decode, every variant resized from the original."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        rendered = []
+        for variant, side in sizes:
+            copy = image.copy()
+            copy.thumbnail((side, side), Image.Resampling.LANCZOS)
+            out = io.BytesIO()
+            copy.save(out, "WEBP", quality=quality)
+            rendered.append((variant, out.getvalue(), copy.width, copy.height))
+    return image.width, image.height, rendered
+
+
+def timed(render, data):
+    began = time.perf_counter()
+    render(data)
+    return time.perf_counter() - began
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the image variants for a batch of large synthetic photos and report throughput: "
+        "serially (what an upload request would wait for), the naive full-decode renderer, "
+        "and the thread/process pools used by the image workers. Nothing is stored."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=48)
+        parser.add_argument("--width", type=int, default=4032)
+        parser.add_argument("--height", type=int, default=3024)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        started = time.perf_counter()
+        photos = [phone_photo(rng, options["width"], options["height"]) for _ in range(options["images"])]
+        megabytes = sum(map(len, photos)) / 2**20
+        self.stdout.write(
+            f"Generated {len(photos)} {options['width']}x{options['height']} JPEGs "
+            f"({megabytes / len(photos):.1f} MB each) in {time.perf_counter() - started:.1f}s"
+        )
+
+        render = renderer()
+        naive = lambda data: naive_render(data, variant_sizes(), render.keywords["quality"])
+        workers = options["workers"]
+        self.stdout.write(f"{'renderer':<24} {'images/s':>9} {'MB/s':>7} {'p50 ms':>8} {'p95 ms':>8}")
+        self.run_case("naive, serial", photos, lambda: [timed(naive, data) for data in photos])
+        self.run_case("draft, serial", photos, lambda: [timed(render, data) for data in photos])
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            self.run_case(f"draft, {workers} threads", photos, lambda: list(pool.map(timed, [render] * len(photos), photos)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pool.submit(render_variants, photos[0], variant_sizes(), 80).result()   # start the processes first
+            self.run_case(f"draft, {workers} processes", photos, lambda: list(pool.map(timed, [render] * len(photos), photos)))
+
+    def run_case(self, name, photos, call):
+        began = time.perf_counter()
+        timings = sorted(seconds * 1000 for seconds in call())
+        elapsed = time.perf_counter() - began
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{name:<24} {len(photos) / elapsed:>9.1f} {sum(map(len, photos)) / 2**20 / elapsed:>7.1f} "
+            f"{statistics.median(timings):>8.1f} {p95:>8.1f}"
+        )
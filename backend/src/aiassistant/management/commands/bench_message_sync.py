@@ -0,0 +1,87 @@
+import statistics
+import time
+from unittest import mock
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from aiassistant.models import Conversation, Message
+from aiassistant.views import LatestMessageView, MessageCreateView, MessageListView
+from users.models import UserAccount
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Show that message sync cost stays flat as a conversation grows. "
+        "Runs inside a transaction that is rolled back; the LLM is stubbed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10,100,1000,10000", help="Comma-separated history lengths.")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        host = next((h for h in settings.ALLOWED_HOSTS if h and "*" not in h), "localhost").lstrip(".")
+        self.factory = APIRequestFactory(SERVER_NAME=host)
+        self.stdout.write(f"{'history':>8} {'endpoint':>12} {'bytes':>8} {'p50 ms':>8} {'max ms':>8}")
+        try:
+            with transaction.atomic():
+                self.user = UserAccount.objects.create_user(
+                    email="bench-sync@example.invalid", first_name="Bench", last_name="Sync"
+                )
+                for size in [int(s) for s in options["sizes"].split(",")]:
+                    self.run_size(size, options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run_size(self, size, repeat):
+        conversation = Conversation.objects.create(user=self.user)
+        # bulk_create skips Message.clean(), so the history can exceed the per-conversation limit
+        Message.objects.bulk_create(
+            Message(conversation=conversation, sender="assistant", content=f"Answer {i} " * 20)
+            for i in range(size)
+        )
+        last_id = Message.objects.filter(conversation=conversation).order_by("-id").values_list("id", flat=True)[0]
+        list_path = f"/aiassistant/messages/all/?conversation={conversation.id}"
+        latest_path = f"/aiassistant/conversations/{conversation.id}/latest-message/"
+        list_etag = self.call(MessageListView, "get", list_path)["ETag"]
+        latest_etag = self.call(LatestMessageView, "get", latest_path, conversation_id=conversation.id)["ETag"]
+
+        cases = {
+            "list page": lambda: self.call(MessageListView, "get", list_path),
+            "list 304": lambda: self.call(MessageListView, "get", list_path, HTTP_IF_NONE_MATCH=list_etag),
+            "since": lambda: self.call(MessageListView, "get", f"{list_path}&since={last_id}"),
+            "latest": lambda: self.call(LatestMessageView, "get", latest_path, conversation_id=conversation.id),
+            "latest 304": lambda: self.call(
+                LatestMessageView, "get", latest_path, conversation_id=conversation.id, HTTP_IF_NONE_MATCH=latest_etag
+            ),
+            "create": lambda: self.call(MessageCreateView, "post", "/aiassistant/messages/", {"content": "Any tips?", "conversation": conversation.id}),
+        }
+        # Measure the endpoint itself, not the per-user rate limit
+        with mock.patch("aiassistant.views.generate_reply", return_value="Drink water."), \
+                override_settings(USER_MESSAGE_BURST=0):
+            for name, call in cases.items():
+                timings, size_bytes = [], 0
+                for _ in range(repeat):
+                    began = time.perf_counter()
+                    response = call()
+                    timings.append((time.perf_counter() - began) * 1000)
+                    size_bytes = len(response.content)
+                    if name == "create":  # keep the history length fixed between runs
+                        Message.objects.filter(conversation=conversation, id__gt=last_id).delete()
+                self.stdout.write(
+                    f"{size:>8} {name:>12} {size_bytes:>8} {statistics.median(timings):>8.2f} {max(timings):>8.2f}"
+                )
+
+    def call(self, view, method, path, data=None, conversation_id=None, **headers):
+        request = getattr(self.factory, method)(path, data, format="json", **headers)
+        force_authenticate(request, user=self.user)
+        kwargs = {"conversation_id": conversation_id} if conversation_id else {}
+        response = view.as_view()(request, **kwargs)
+        return response.render() if hasattr(response, "render") else response
@@ -0,0 +1,58 @@
+import tempfile
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from aiassistant.retrieval import VectorIndex
+
+
+class Command(BaseCommand):
+    help = "Benchmark top-k search latency on synthetic memory-mapped indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated chunk counts.")
+        parser.add_argument("--dim", type=int, default=256)
+        parser.add_argument("--k", type=int, default=3)
+        parser.add_argument("--queries", type=int, default=64)
+        parser.add_argument("--batch", type=int, default=16, help="Queries searched per call.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        dim = options["dim"]
+        self.stdout.write(f"{'chunks':>10} {'batch':>6} {'p50 ms':>9} {'p95 ms':>9} {'queries/s':>10}")
+
+        for size in [int(s) for s in options["sizes"].split(",")]:
+            with tempfile.TemporaryDirectory() as index_dir:
+                index = self.synthetic_index(index_dir, size, dim, rng)
+                queries = self.normalize(rng.standard_normal((options["queries"], dim), dtype=np.float32))
+                index.search(queries[:1], options["k"])  # fault pages in once
+
+                timings = []
+                for start in range(0, len(queries), options["batch"]):
+                    batch = queries[start:start + options["batch"]]
+                    began = time.perf_counter()
+                    index.search(batch, options["k"])
+                    timings.append((time.perf_counter() - began) / len(batch))
+
+                timings = np.array(timings) * 1000
+                self.stdout.write(
+                    f"{size:>10} {options['batch']:>6} {np.percentile(timings, 50):>9.2f} "
+                    f"{np.percentile(timings, 95):>9.2f} {1000 / timings.mean():>10.1f}"
+                )
+
+    @staticmethod
+    def normalize(vectors):
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def synthetic_index(self, index_dir, size, dim, rng):
+        vectors = np.lib.format.open_memmap(f"{index_dir}/vectors.npy", mode="w+", dtype=np.float32, shape=(size, dim))
+        for start in range(0, size, 100000):
+            end = min(start + 100000, size)
+            vectors[start:end] = self.normalize(rng.standard_normal((end - start, dim), dtype=np.float32))
+        vectors.flush()
+        del vectors
+        np.save(f"{index_dir}/offsets.npy", np.zeros(size, dtype=np.int64))
+        open(f"{index_dir}/chunks.jsonl", "w").close()
+        with open(f"{index_dir}/meta.json", "w") as f:
+            f.write(f'{{"count": {size}, "dim": {dim}, "embedder": "synthetic"}}')
+        return VectorIndex(index_dir)
@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from aiassistant.models import Conversation, Message
+from aiassistant.search import search
+from users.models import UserAccount
+
+WORDS = (
+    "sleep magnesium vitamin iron zinc protein fiber sugar insulin glucose blood pressure heart cholesterol "
+    "exercise walking running stretching posture back pain headache migraine fever cough cold flu allergy "
+    "asthma skin rash acne eczema stress anxiety mood depression therapy diet breakfast dinner water caffeine "
+    "coffee tea alcohol smoking weight calories metabolism thyroid hormone kidney liver stomach digestion "
+    "bloating nausea vaccine immunity infection antibiotic dose tablet supplement doctor appointment symptom"
+).split()
+# Zipf-like frequencies, so queries range from common to rare words
+WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+QUERIES = {
+    "common word": WORDS[0],
+    "mid word": WORDS[len(WORDS) // 4],
+    "rare word": WORDS[-1],
+    "two words": f"{WORDS[1]} {WORDS[10]}",
+    "no match": "xylophone",
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a large synthetic message history (default one million messages over many users) "
+        "and time ranked full-text search for one user against an unindexed icontains scan. "
+        "Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1_000_000, help="Messages in total.")
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        try:
+            with transaction.atomic():
+                user = self.seed(rng, options["messages"], options["users"])
+                self.stdout.write(f"{'query':<12} {'engine':<10} {'hits':>5} {'p50 ms':>9} {'p95 ms':>9}")
+                for name, query in QUERIES.items():
+                    self.run_case(name, "index", options["repeat"], lambda: search(user, query))
+                    self.run_case(name, "icontains", options["repeat"], lambda: self.scan(user, query))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, rng, total, users):
+        started = time.perf_counter()
+        accounts = UserAccount.objects.bulk_create([
+            UserAccount(email=f"bench-search-{i}@example.invalid", first_name="Bench", last_name="Search")
+            for i in range(users)
+        ])
+        conversations = Conversation.objects.bulk_create([
+            Conversation(user=account, title="Search bench") for account in accounts for _ in range(4)
+        ], batch_size=2000)
+        batch = []
+        for i in range(total):
+            content = " ".join(rng.choices(WORDS, WEIGHTS, k=rng.randint(8, 40)))
+            batch.append(Message(conversation=conversations[i % len(conversations)], sender="user", content=content))
+            if len(batch) == 5000:
+                Message.objects.bulk_create(batch)
+                batch = []
+        Message.objects.bulk_create(batch)
+        reset_queries()
+        own = total // users
+        self.stdout.write(
+            f"Seeded {total} messages for {users} users ({own} each) on {connection.vendor} "
+            f"in {time.perf_counter() - started:.0f}s"
+        )
+        return accounts[0]
+
+    @staticmethod
+    def scan(user, query):
+        """What a search without an index would do: a substring scan of the user's messages."""
+        messages = Message.objects.filter(conversation__user=user)
+        for word in query.split():
+            messages = messages.filter(content__icontains=word)
+        return list(messages.order_by("-created_at", "-id").values("id", "content")[:20])
+
+    def run_case(self, name, engine, repeat, call):
+        timings, hits = [], 0
+        for _ in range(repeat):
+            began = time.perf_counter()
+            hits = len(call())
+            timings.append((time.perf_counter() - began) * 1000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(f"{name:<12} {engine:<10} {hits:>5} {statistics.median(timings):>9.2f} {p95:>9.2f}")
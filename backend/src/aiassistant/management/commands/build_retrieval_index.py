@@ -0,0 +1,38 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from aiassistant.cache import get_response_cache
+from aiassistant.retrieval import VectorIndex, get_embedder, load_corpus
+
+
+class Command(BaseCommand):
+    help = "Chunk and embed the curated health corpus into the retrieval index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", required=True, help="Directory of .md/.txt/.jsonl documents.")
+        parser.add_argument("--output", default=None, help="Index directory (default: RETRIEVAL_INDEX_DIR).")
+        parser.add_argument("--embedder", default=None, help="Dotted path of the embedder class.")
+        parser.add_argument("--dim", type=int, default=512, help="Embedding dimension.")
+        parser.add_argument("--chunk-words", type=int, default=120)
+        parser.add_argument("--overlap", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=256)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        chunks = list(load_corpus(options["corpus"], options["chunk_words"], options["overlap"]))
+        if not chunks:
+            raise CommandError(f"No documents found in {options['corpus']}.")
+
+        embedder = get_embedder(options["embedder"], dim=options["dim"])
+        output = options["output"] or settings.RETRIEVAL_INDEX_DIR
+        index = VectorIndex.build(chunks, output, embedder, batch_size=options["batch_size"])
+
+        # Answers may cite different passages now; drop cached replies
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            response_cache.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(index)} chunks with {embedder.name} into {output} "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,39 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from aiassistant.export import EXPORT_FORMATS, export_stream
+from users.models import UserAccount
+
+
+class Command(BaseCommand):
+    help = "Stream a user's conversations and messages to a file (or stdout) as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", help="Account whose history is exported.")
+        parser.add_argument("--format", dest="fmt", choices=sorted(EXPORT_FORMATS), default="ndjson")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output.")
+        parser.add_argument("--output", default="-", help="File to write (default: stdout).")
+        parser.add_argument("--chunk-size", type=int, default=None, help="Rows per database fetch (default: EXPORT_CHUNK_SIZE).")
+
+    def handle(self, *args, **options):
+        try:
+            user = UserAccount.objects.get(email=options["email"])
+        except UserAccount.DoesNotExist:
+            raise CommandError(f"No user with email {options['email']}.")
+
+        started = time.perf_counter()
+        chunks = export_stream(user, options["fmt"], compress=options["gzip"], chunk_size=options["chunk_size"])
+        written = 0
+        output = sys.stdout.buffer if options["output"] == "-" else open(options["output"], "wb")
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        if options["output"] != "-":
+            self.stdout.write(self.style.SUCCESS(
+                f"Exported {written / 1e6:.1f} MB to {options['output']} in {time.perf_counter() - started:.1f}s."
+            ))
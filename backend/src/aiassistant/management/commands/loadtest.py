@@ -0,0 +1,146 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from .seed_benchmark_data import QUESTIONS
+
+DEFAULT_MIX = "send=1,messages=3,conversations=3,latest=3"
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a running server at a target concurrency and report throughput and "
+        "p50/p95/p99 latency per endpoint. Seed users first with seed_benchmark_data, "
+        "and run the server with LLM_BACKEND=fake to leave Watsonx out of the numbers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://localhost:8000")
+        parser.add_argument("--users", type=int, default=20, help="Seeded bench users to log in as.")
+        parser.add_argument("--password", default="bench-password")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=30, help="Measured seconds.")
+        parser.add_argument("--warmup", type=float, default=3, help="Seconds excluded from the results.")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help="Relative weight of each scenario.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write results as JSON (for comparing runs).")
+        parser.add_argument("--compare", help="Earlier --output file to diff against.")
+
+    def handle(self, *args, **options):
+        self.base_url = options["base_url"].rstrip("/")
+        mix = {name: float(weight) for name, weight in (part.split("=") for part in options["mix"].split(","))}
+        unknown = set(mix) - {"send", "messages", "conversations", "latest"}
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        sessions = self.log_in(options["users"], options["password"])
+        self.stdout.write(f"Logged in {len(sessions)} users; running {options['concurrency']} workers "
+                          f"for {options['warmup']}s warm-up + {options['duration']}s.")
+
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        started = time.monotonic()
+        measure_from = started + options["warmup"]
+        stop_at = measure_from + options["duration"]
+
+        def worker(index):
+            rng = random.Random(options["seed"] * 1000 + index)
+            names, weights = zip(*mix.items())
+            while time.monotonic() < stop_at:
+                session, conversations = rng.choice(sessions)
+                name = rng.choices(names, weights)[0]
+                began = time.monotonic()
+                try:
+                    ok = self.run_scenario(name, session, conversations, rng)
+                except requests.RequestException:
+                    ok = False
+                ended = time.monotonic()
+                if began >= measure_from:
+                    with lock:
+                        samples[name].append(ended - began)
+                        if not ok:
+                            errors[name] += 1
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            list(pool.map(worker, range(options["concurrency"])))
+
+        results = self.summarize(samples, errors, options["duration"])
+        self.report(results)
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.compare(results, json.load(f)["results"])
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"options": {k: options[k] for k in ("concurrency", "duration", "mix", "seed", "users")},
+                           "results": results}, f, indent=2)
+
+    def log_in(self, users, password):
+        sessions = []
+        for i in range(users):
+            session = requests.Session()
+            response = session.post(f"{self.base_url}/auth/jwt/create/",
+                                    json={"email": f"bench-{i}@example.invalid", "password": password})
+            if response.status_code != 200:
+                raise CommandError(f"Login failed for bench-{i}: {response.status_code}. Run seed_benchmark_data first.")
+            session.headers["Authorization"] = f"Bearer {response.json()['access']}"
+            page = session.get(f"{self.base_url}/aiassistant/conversations/").json()
+            sessions.append((session, [c["id"] for c in page.get("results", page)]))
+        return sessions
+
+    def run_scenario(self, name, session, conversations, rng):
+        conversation = rng.choice(conversations) if conversations else None
+        if name == "send":
+            response = session.post(f"{self.base_url}/aiassistant/messages/",
+                                    json={"content": rng.choice(QUESTIONS), "conversation": conversation})
+        elif name == "messages":
+            response = session.get(f"{self.base_url}/aiassistant/messages/all/", params={"conversation": conversation})
+        elif name == "conversations":
+            response = session.get(f"{self.base_url}/aiassistant/conversations/")
+        else:
+            response = session.get(f"{self.base_url}/aiassistant/conversations/{conversation}/latest-message/")
+        return response.status_code < 400
+
+    @staticmethod
+    def summarize(samples, errors, duration):
+        results = {}
+        for name, latencies in sorted(samples.items()):
+            latencies.sort()
+            results[name] = {
+                "requests": len(latencies),
+                "errors": errors[name],
+                "rps": len(latencies) / duration,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+            }
+        return results
+
+    def report(self, results):
+        self.stdout.write(f"{'scenario':<14} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name, r in results.items():
+            self.stdout.write(f"{name:<14} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8.1f} "
+                              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+
+    def compare(self, results, baseline):
+        self.stdout.write("\nChange vs baseline (positive latency = slower):")
+        for name, r in results.items():
+            if name not in baseline:
+                continue
+            b = baseline[name]
+            change = lambda key: (r[key] - b[key]) / b[key] * 100 if b[key] else 0.0
+            self.stdout.write(f"{name:<14} req/s {change('rps'):+6.1f}%  p50 {change('p50_ms'):+6.1f}%  "
+                              f"p95 {change('p95_ms'):+6.1f}%  p99 {change('p99_ms'):+6.1f}%")
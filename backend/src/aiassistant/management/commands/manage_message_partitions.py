@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from aiassistant import partitions
+from aiassistant.archive import retention_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "PostgreSQL only: create the upcoming monthly partitions of the message table and drop "
+        "empty ones older than the retention window. Run daily, after archive_conversations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=None, help="Months to create ahead (default: MESSAGE_PARTITIONS_AHEAD).")
+        parser.add_argument("--keep-empty", action="store_true", help="Do not drop emptied partitions.")
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            self.stdout.write("The message table is not partitioned on this database; nothing to do.")
+            return
+
+        this_month = partitions.month_start(timezone.now())
+        ahead = settings.MESSAGE_PARTITIONS_AHEAD if options["ahead"] is None else options["ahead"]
+        created = partitions.ensure_partitions(this_month, partitions.add_months(this_month, ahead))
+
+        dropped = []
+        cutoff = retention_cutoff()
+        if cutoff is not None and not options["keep_empty"]:
+            dropped = partitions.drop_empty_partitions(partitions.month_start(cutoff))
+
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        for name in dropped:
+            self.stdout.write(f"Dropped {name}")
+        monthly = partitions.list_partitions()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(monthly)} monthly partitions ({min(monthly):%Y-%m} to {max(monthly):%Y-%m}), "
+            f"{partitions.default_partition_rows()} rows in the default partition."
+        ))
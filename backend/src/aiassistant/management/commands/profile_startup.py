@@ -0,0 +1,80 @@
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Loads Django and the app the way a worker does, in a fresh interpreter
+STARTUP_SCRIPT = """
+import time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+from django.utils.module_loading import import_string
+import_string({app!r})
+get_resolver().url_patterns
+print(time.perf_counter() - started)
+"""
+
+# Must stay out of boot: imported by the LLM provider on first use
+LAZY_PACKAGES = "langchain,langchain_core,langchain_ibm,ibm_watsonx_ai"
+
+
+class Command(BaseCommand):
+    help = (
+        "Report cold-start time of the Django app and an import-time breakdown by "
+        "package, measured in fresh interpreters. Fails when a lazily loaded package "
+        "is imported at boot or when --budget-ms is exceeded (for CI)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--app", default="fastai.asgi.application", help="Application to load (WSGI or ASGI).")
+        parser.add_argument("--repeat", type=int, default=3, help="Cold starts to time (median is reported).")
+        parser.add_argument("--top", type=int, default=15, help="Packages to list in the breakdown.")
+        parser.add_argument("--lazy", default=LAZY_PACKAGES, help="Comma-separated packages that must not load at boot.")
+        parser.add_argument("--budget-ms", type=float, help="Fail when the median cold start is slower.")
+
+    def handle(self, *args, **options):
+        script = STARTUP_SCRIPT.format(app=options["app"])
+
+        timings = [float(self.run(script).stdout.strip().splitlines()[-1]) * 1000 for _ in range(options["repeat"])]
+        cold_start = statistics.median(timings)
+        self.stdout.write(f"Cold start ({options['app']}): {cold_start:.0f} ms median of {len(timings)} runs\n")
+
+        packages = self.import_times(self.run(script, "-X", "importtime").stderr)
+        total = sum(packages.values()) or 1
+        self.stdout.write(f"{'package':<28} {'self ms':>9} {'share':>6}")
+        for name, micros in sorted(packages.items(), key=lambda item: -item[1])[:options["top"]]:
+            self.stdout.write(f"{name:<28} {micros / 1000:>9.1f} {micros / total:>6.0%}")
+
+        loaded = sorted(set(options["lazy"].split(",")) & set(packages))
+        if loaded:
+            raise CommandError(f"Imported at startup but meant to load lazily: {', '.join(loaded)}")
+        if options["budget_ms"] and cold_start > options["budget_ms"]:
+            raise CommandError(f"Cold start {cold_start:.0f} ms is over the {options['budget_ms']:.0f} ms budget")
+
+    @staticmethod
+    def run(script, *flags):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        result = subprocess.run(
+            [sys.executable, *flags, "-c", script],
+            cwd=Path(settings.BASE_DIR).parent, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+        return result
+
+    @staticmethod
+    def import_times(stderr):
+        """Sum ``-X importtime`` self times (microseconds) per top-level package."""
+        packages = defaultdict(int)
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, _, name = line[len("import time:"):].split("|")
+            packages[name.strip().split(".")[0]] += int(self_us)
+        return packages
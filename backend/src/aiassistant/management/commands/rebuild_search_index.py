@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from aiassistant.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the full-text search index. Only needed on SQLite, after a migration "
+        "rebuilt the message or prompt table (PostgreSQL keeps its index current)."
+    )
+
+    def handle(self, *args, **options):
+        get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from aiassistant.archive import ArchiveError, restore_conversation
+from aiassistant.models import ArchivedConversation
+
+
+class Command(BaseCommand):
+    help = "Restore archived conversations (by original conversation id) into the hot tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("conversation_ids", nargs="+", type=int)
+
+    def handle(self, *args, **options):
+        for conversation_id in options["conversation_ids"]:
+            try:
+                archived = ArchivedConversation.objects.get(conversation_id=conversation_id)
+                conversation = restore_conversation(archived)
+            except ArchivedConversation.DoesNotExist:
+                raise CommandError(f"Conversation {conversation_id} is not archived.")
+            except ArchiveError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f"Restored conversation {conversation.id} ({archived.message_count} messages)."
+            ))
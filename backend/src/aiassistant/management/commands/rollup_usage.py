@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from aiassistant.usage import prune_usage, rollup_usage
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold recorded LLM calls into per-user, per-day, per-model usage rollups (incrementally, "
+        "from the last checkpoint), then delete rolled-up calls older than USAGE_RAW_RETENTION_DAYS. "
+        "Run it every few minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Call ids per transaction (default: USAGE_ROLLUP_BATCH).")
+        parser.add_argument("--lag", type=int, default=None, help="Leave calls younger than this many seconds (default: USAGE_ROLLUP_LAG).")
+        parser.add_argument("--no-prune", action="store_true", help="Keep the raw calls.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        folded = rollup_usage(batch_size=options["batch_size"], lag=options["lag"])
+        pruned = 0 if options["no_prune"] else prune_usage()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {folded} calls and pruned {pruned} in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from aiassistant.jobs import process_next_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued AI reply generation jobs (GENERATION_QUEUE=db)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="Jobs generated in parallel.")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--stale-after", type=int, default=600, help="Requeue running jobs older than this many seconds.")
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit.")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(timedelta(seconds=options["stale_after"]))
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s).")
+
+        concurrency = options["concurrency"]
+        self.stdout.write(f"Generation worker started with {concurrency} slot(s).")
+        # One claim-run loop per slot: a slow reply holds up only its own slot
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="generation") as pool:
+            slots = [pool.submit(self.run_slot, options) for _ in range(concurrency)]
+            for slot in slots:
+                slot.result()
+
+    def run_slot(self, options):
+        while True:
+            job = self.run_one()
+            if job:
+                self.stdout.write(f"{job} for conversation {job.conversation_id}")
+            elif options["once"]:
+                return
+            else:
+                time.sleep(options["poll_interval"])
+
+    @staticmethod
+    def run_one():
+        close_old_connections()
+        try:
+            return process_next_job()
+        finally:
+            close_old_connections()
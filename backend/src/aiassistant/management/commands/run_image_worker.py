@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from aiassistant.images import process_next_image, renderer, requeue_stale_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Build thumbnail/WebP variants of uploaded images (IMAGE_QUEUE=db). "
+        "Decoding and encoding run in a process pool; database and storage calls stay in this process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=2, help="Images processed in parallel (processes).")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--stale-after", type=int, default=300, help="Requeue running images older than this many seconds.")
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit.")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_images(timedelta(seconds=options["stale_after"]))
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale image(s).")
+
+        concurrency = options["concurrency"]
+        self.stdout.write(f"Image worker started with {concurrency} process(es).")
+        with ProcessPoolExecutor(max_workers=concurrency) as renderers, \
+                ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="images") as pool:
+            render = renderer()
+            remote = lambda data: renderers.submit(render, data).result()
+            # One claim-render loop per process: a large image holds up only its own slot
+            slots = [pool.submit(self.run_slot, remote, options) for _ in range(concurrency)]
+            for slot in slots:
+                slot.result()
+
+    def run_slot(self, render, options):
+        while True:
+            asset = self.run_one(render)
+            if asset:
+                self.stdout.write(f"{asset} in {asset.original.name}")
+            elif options["once"]:
+                return
+            else:
+                time.sleep(options["poll_interval"])
+
+    @staticmethod
+    def run_one(render):
+        close_old_connections()
+        try:
+            return process_next_image(render)
+        finally:
+            close_old_connections()
@@ -0,0 +1,86 @@
+import random
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from aiassistant.fake_llm import DEFAULT_REPLY
+from aiassistant.models import Conversation, Message
+from users.models import UserAccount
+
+QUESTIONS = [
+    "How can I lower my blood pressure?",
+    "When should I get a flu shot?",
+    "How much sleep does an adult need?",
+    "Is intermittent fasting safe?",
+    "What are early signs of diabetes?",
+    "How much water should I drink per day?",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed load-test users, conversations and messages in bulk. "
+        "Users are bench-<n>@example.invalid with the given password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--conversations", type=int, default=20, help="Conversations per user.")
+        parser.add_argument("--messages", type=int, default=8, help="Messages per conversation.")
+        parser.add_argument("--password", default="bench-password")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--clear", action="store_true", help="Delete earlier bench users first.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+
+        if options["clear"]:
+            deleted, _ = UserAccount.objects.filter(email__endswith="@example.invalid", email__startswith="bench-").delete()
+            self.stdout.write(f"Deleted {deleted} rows from earlier runs.")
+
+        password = make_password(options["password"])  # hash once, not per user
+        with transaction.atomic():
+            users = UserAccount.objects.bulk_create(
+                [
+                    UserAccount(email=f"bench-{i}@example.invalid", first_name="Bench", last_name=str(i), password=password)
+                    for i in range(options["users"])
+                ],
+                batch_size=batch_size,
+            )
+
+            now = timezone.now()
+            messages_per_conversation = options["messages"]
+            user_turns = (messages_per_conversation + 1) // 2
+            conversations = Conversation.objects.bulk_create(
+                [
+                    Conversation(
+                        user=user,
+                        title=f"Chat {n}",
+                        user_message_count=min(user_turns, Message.MAX_MESSAGES_PER_CONVERSATION),
+                        last_message_at=now,
+                    )
+                    for user in users
+                    for n in range(options["conversations"])
+                ],
+                batch_size=batch_size,
+            )
+
+            # bulk_create skips Message.save(), so the counters above are set by hand
+            batch, total = [], 0
+            for conversation in conversations:
+                for i in range(messages_per_conversation):
+                    batch.append(Message(
+                        conversation=conversation,
+                        sender="user" if i % 2 == 0 else "assistant",
+                        content=rng.choice(QUESTIONS) if i % 2 == 0 else DEFAULT_REPLY,
+                    ))
+                if len(batch) >= batch_size:
+                    total += len(Message.objects.bulk_create(batch))
+                    batch = []
+            total += len(Message.objects.bulk_create(batch))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(conversations)} conversations, {total} messages."
+        ))
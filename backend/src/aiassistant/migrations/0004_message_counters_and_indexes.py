@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    """Fill the new counters for existing conversations in one UPDATE."""
+    Conversation = apps.get_model('aiassistant', 'Conversation')
+    Message = apps.get_model('aiassistant', 'Message')
+
+    per_conversation = Message.objects.filter(conversation=OuterRef('pk')).order_by().values('conversation')
+    Conversation.objects.update(
+        user_message_count=Coalesce(
+            Subquery(per_conversation.filter(sender='user').annotate(c=Count('id')).values('c')), 0
+        ),
+        last_message_at=Subquery(per_conversation.annotate(m=Max('created_at')).values('m')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aiassistant', '0003_conversation_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='conversation_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at', 'id'], name='message_conv_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'sender'], name='message_conv_sender_idx'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:22
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+
+def backfill_updated_at(apps, schema_editor):
+    """Start from the last activity instead of the migration time."""
+    Conversation = apps.get_model('aiassistant', 'Conversation')
+    Conversation.objects.update(updated_at=Coalesce(F('last_message_at'), F('created_at')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aiassistant', '0004_message_counters_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,113 @@
+from datetime import date, timezone as dt_timezone
+from django.db import migrations
+from django.utils import timezone
+
+# Frozen here on purpose: this migration must keep doing what it did when it was written,
+# whatever later happens to aiassistant/partitions.py (which manages partitions at run time).
+TABLE = "aiassistant_message"
+OLD_TABLE = f"{TABLE}_unpartitioned"
+DEFAULT_PARTITION = f"{TABLE}_default"
+MONTHS_AHEAD = 3   # manage_message_partitions creates later months
+INDEXES = [
+    # Same names as in Message.Meta.indexes; the first one also serves the conversation foreign key
+    f'CREATE INDEX "message_conv_created_idx" ON "{TABLE}" ("conversation_id", "created_at", "id")',
+    f'CREATE INDEX "message_conv_sender_idx" ON "{TABLE}" ("conversation_id", "sender")',
+]
+CONVERSATION_FK = (
+    f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_conversation_id_fk" FOREIGN KEY ("conversation_id") '
+    f'REFERENCES "aiassistant_conversation" ("id") DEFERRABLE INITIALLY DEFERRED'
+)
+
+
+def month_start(value):
+    value = value.astimezone(dt_timezone.utc) if timezone.is_aware(value) else value
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def is_partitioned(connection):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def partition_messages(apps, schema_editor):
+    """
+    Rebuild the message table as PARTITION BY RANGE (created_at), one partition
+    per month of existing data up to MONTHS_AHEAD months ahead plus
+    a DEFAULT partition. PostgreSQL only; other databases keep the plain table.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql" or is_partitioned(connection):
+        return
+
+    execute = schema_editor.execute
+    execute(f'ALTER TABLE "{TABLE}" RENAME TO "{OLD_TABLE}"')
+    # LIKE copies columns and NOT NULL only; the identity on id stays with the old table
+    execute(f'CREATE TABLE "{TABLE}" (LIKE "{OLD_TABLE}") PARTITION BY RANGE ("created_at")')
+    execute(f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT')
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT min("created_at") FROM "{OLD_TABLE}"')
+        oldest = cursor.fetchone()[0] or timezone.now()
+    month, last = month_start(oldest), add_months(month_start(timezone.now()), MONTHS_AHEAD)
+    while month <= last:
+        upper = add_months(month, 1)
+        # Bounds are UTC midnights, the same instants for every session time zone
+        execute(
+            f'CREATE TABLE "{TABLE}_y{month.year:04d}m{month.month:02d}" PARTITION OF "{TABLE}" '
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+        )
+        month = upper
+
+    execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{OLD_TABLE}"')
+    execute(f'DROP TABLE "{OLD_TABLE}"')
+
+    # The partition key has to be part of the primary key; ids still come from one sequence
+    execute(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY ("id", "created_at")')
+    execute(f'CREATE SEQUENCE "{TABLE}_id_seq" OWNED BY "{TABLE}"."id"')
+    execute(f'ALTER TABLE "{TABLE}" ALTER COLUMN "id" SET DEFAULT nextval(\'"{TABLE}_id_seq"\')')
+    execute(f'SELECT setval(\'"{TABLE}_id_seq"\', coalesce(max("id"), 0) + 1, false) FROM "{TABLE}"')
+    for statement in INDEXES:
+        execute(statement)
+    execute(CONVERSATION_FK)
+
+
+def unpartition_messages(apps, schema_editor):
+    """Back to a plain table with an identity primary key on id."""
+    connection = schema_editor.connection
+    if not is_partitioned(connection):
+        return
+
+    execute = schema_editor.execute
+    execute(f'ALTER TABLE "{TABLE}" RENAME TO "{OLD_TABLE}"')
+    execute(f'ALTER SEQUENCE "{TABLE}_id_seq" OWNED BY NONE')
+    execute(f'CREATE TABLE "{TABLE}" (LIKE "{OLD_TABLE}")')
+    execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{OLD_TABLE}"')
+    execute(f'DROP TABLE "{OLD_TABLE}"')  # drops every partition and index with it
+
+    execute(f'DROP SEQUENCE "{TABLE}_id_seq"')
+    execute(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY ("id")')
+    execute(f'ALTER TABLE "{TABLE}" ALTER COLUMN "id" ADD GENERATED BY DEFAULT AS IDENTITY')
+    execute(f'SELECT setval(pg_get_serial_sequence(\'"{TABLE}"\', \'id\'), coalesce(max("id"), 0) + 1, false) FROM "{TABLE}"')
+    for statement in INDEXES:
+        execute(statement)
+    execute(CONVERSATION_FK)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aiassistant', '0006_message_retention'),
+    ]
+
+    operations = [
+        # Copies and rebuilds the whole table: run it in a maintenance window on large databases
+        migrations.RunPython(partition_messages, unpartition_messages),
+    ]
@@ -0,0 +1,96 @@
+from django.db import migrations
+
+# The DDL is frozen here on purpose: this migration must keep creating what it did when it
+# was written, whatever later happens to aiassistant/search.py (which also uses it for
+# `manage.py rebuild_search_index` on SQLite).
+
+
+# ---- PostgreSQL: generated tsvector columns + GIN indexes
+# The explicit regconfig keeps to_tsvector immutable, as generated columns require. 'english'
+# is the SEARCH_CONFIG default this was written with; other configs need a later migration.
+POSTGRES_CREATE = [
+    "ALTER TABLE aiassistant_message ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english'::regconfig, content)) STORED",
+    "ALTER TABLE aiassistant_prompt ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, input_text), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(output_text, '')), 'C')) STORED",
+    # On the partitioned message table this creates one GIN index per partition
+    "CREATE INDEX message_search_idx ON aiassistant_message USING gin (search_vector)",
+    "CREATE INDEX prompt_search_idx ON aiassistant_prompt USING gin (search_vector)",
+]
+
+POSTGRES_DROP = [
+    "ALTER TABLE aiassistant_message DROP COLUMN search_vector",
+    "ALTER TABLE aiassistant_prompt DROP COLUMN search_vector",
+]
+
+# ---- SQLite: external-content FTS5 tables kept in sync by triggers
+MESSAGE_OWNER = "(SELECT 'u' || user_id FROM aiassistant_conversation WHERE id = {row}.conversation_id)"
+SQLITE_CREATE = [
+    "CREATE VIEW aiassistant_message_search AS "
+    "SELECT m.id, m.content, 'u' || c.user_id AS owner "
+    "FROM aiassistant_message m JOIN aiassistant_conversation c ON c.id = m.conversation_id",
+    "CREATE VIRTUAL TABLE aiassistant_message_fts USING fts5(content, owner, "
+    "content='aiassistant_message_search', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER aiassistant_message_fts_ai AFTER INSERT ON aiassistant_message BEGIN "
+    "INSERT INTO aiassistant_message_fts(rowid, content, owner) "
+    f"VALUES (new.id, new.content, {MESSAGE_OWNER.format(row='new')}); END",
+    "CREATE TRIGGER aiassistant_message_fts_ad AFTER DELETE ON aiassistant_message BEGIN "
+    "INSERT INTO aiassistant_message_fts(aiassistant_message_fts, rowid, content, owner) "
+    f"VALUES ('delete', old.id, old.content, {MESSAGE_OWNER.format(row='old')}); END",
+    "CREATE TRIGGER aiassistant_message_fts_au AFTER UPDATE OF content ON aiassistant_message BEGIN "
+    "INSERT INTO aiassistant_message_fts(aiassistant_message_fts, rowid, content, owner) "
+    f"VALUES ('delete', old.id, old.content, {MESSAGE_OWNER.format(row='old')}); "
+    "INSERT INTO aiassistant_message_fts(rowid, content, owner) "
+    f"VALUES (new.id, new.content, {MESSAGE_OWNER.format(row='new')}); END",
+    "INSERT INTO aiassistant_message_fts(aiassistant_message_fts) VALUES ('rebuild')",
+    "CREATE VIEW aiassistant_prompt_search AS "
+    "SELECT id, title, input_text, output_text, 'u' || user_id AS owner FROM aiassistant_prompt",
+    "CREATE VIRTUAL TABLE aiassistant_prompt_fts USING fts5(title, input_text, output_text, owner, "
+    "content='aiassistant_prompt_search', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER aiassistant_prompt_fts_ai AFTER INSERT ON aiassistant_prompt BEGIN "
+    "INSERT INTO aiassistant_prompt_fts(rowid, title, input_text, output_text, owner) "
+    "VALUES (new.id, new.title, new.input_text, new.output_text, 'u' || new.user_id); END",
+    "CREATE TRIGGER aiassistant_prompt_fts_ad AFTER DELETE ON aiassistant_prompt BEGIN "
+    "INSERT INTO aiassistant_prompt_fts(aiassistant_prompt_fts, rowid, title, input_text, output_text, owner) "
+    "VALUES ('delete', old.id, old.title, old.input_text, old.output_text, 'u' || old.user_id); END",
+    "CREATE TRIGGER aiassistant_prompt_fts_au AFTER UPDATE OF title, input_text, output_text "
+    "ON aiassistant_prompt BEGIN "
+    "INSERT INTO aiassistant_prompt_fts(aiassistant_prompt_fts, rowid, title, input_text, output_text, owner) "
+    "VALUES ('delete', old.id, old.title, old.input_text, old.output_text, 'u' || old.user_id); "
+    "INSERT INTO aiassistant_prompt_fts(rowid, title, input_text, output_text, owner) "
+    "VALUES (new.id, new.title, new.input_text, new.output_text, 'u' || new.user_id); END",
+    "INSERT INTO aiassistant_prompt_fts(aiassistant_prompt_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    f"DROP {kind} IF EXISTS aiassistant_{table}{suffix}"
+    for table in ("message", "prompt")
+    for kind, suffix in (("TRIGGER", "_fts_ai"), ("TRIGGER", "_fts_ad"), ("TRIGGER", "_fts_au"),
+                         ("TABLE", "_fts"), ("VIEW", "_search"))
+]
+
+
+def create_search_index(apps, schema_editor):
+    """tsvector columns + GIN indexes on PostgreSQL, FTS5 tables on SQLite (see search.py)."""
+    vendor = schema_editor.connection.vendor
+    statements = {"postgresql": POSTGRES_CREATE, "sqlite": SQLITE_CREATE}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in {"postgresql": POSTGRES_DROP, "sqlite": SQLITE_DROP}.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aiassistant', '0007_partition_messages'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aiassistant', '0008_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prompt',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='prompt_user_created_idx'),
+        ),
+    ]
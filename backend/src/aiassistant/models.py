@@ -1,5 +1,7 @@
-from django.db import models
-from datetime import datetime
+from django.db import models, transaction
+from django.db.models import DateTimeField, ExpressionWrapper, F, Subquery, Value
+from django.utils import timezone
+from datetime import datetime, timedelta
 from users.models import UserAccount
 from django.core.exceptions import ValidationError
 
@@ -10,6 +12,8 @@ class Prompt(models.Model):
     input_text = models.TextField(max_length=3000)
     output_text = models.TextField(max_length=3000, blank=True, null=True)
     image = models.ImageField(upload_to='prompts/', blank=True, null=True)
+    # Deduplicated copy of ``image`` with its thumbnail/WebP variants (see images.py)
+    image_asset = models.ForeignKey('ImageAsset', on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -17,6 +21,12 @@ class Prompt(models.Model):
     model_used = models.CharField(max_length=50, default="fastai")  # which model handled it
     metadata = models.JSONField(null=True, blank=True)          # extra info like temperature, tokens, etc.
 
+    class Meta:
+        indexes = [
+            # PromptListCreateView: the user's prompts, newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='prompt_user_created_idx'),
+        ]
+
     def __str__(self):
         return self.title or f"Prompt {self.id}"
 
@@ -35,33 +45,268 @@ class Prompt(models.Model):
 class Conversation(models.Model):
     user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, related_name='conversations')
     title = models.CharField(max_length=150, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)  # kept as is on restore
+    updated_at = models.DateTimeField(auto_now=True)   # also bumped by every new message (ETag marker)
+
+    summary = models.TextField(blank=True)                                # rolling summary of older turns
+    summarized_until = models.BigIntegerField(null=True, blank=True)      # id of the last message folded into it
+
+    # Maintained by Message.save() in the same transaction as the insert
+    user_message_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='conversation_user_created_idx'),
+        ]
 
     def __str__(self):
         return self.title or f"Conversation {self.id}"
     
+# ---- Message queries bounded to a conversation's lifetime
+class MessageQuerySet(models.QuerySet):
+    # Margin for clocks of different web servers; messages are never older than their conversation
+    CLOCK_SKEW = timedelta(minutes=5)
+
+    def in_conversation(self, conversation):
+        """
+        Messages of ``conversation`` (an instance or an id). The lower bound on
+        ``created_at`` lets PostgreSQL skip the monthly partitions from before
+        the conversation started (see partitions.py); elsewhere it is a no-op.
+        """
+        if isinstance(conversation, Conversation):
+            return self.filter(conversation=conversation, created_at__gte=conversation.created_at - self.CLOCK_SKEW)
+        started = Conversation.objects.filter(pk=conversation).values('created_at')[:1]
+        return self.filter(
+            conversation_id=conversation,
+            created_at__gte=ExpressionWrapper(Subquery(started) - Value(self.CLOCK_SKEW), output_field=DateTimeField()),
+        )
+
+
 # Create a Message Model
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.CharField(max_length=200, choices=[('user', 'User'), ('assistant', 'Assistant')])
     content = models.TextField()
     image = models.ImageField(upload_to='messages/', blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    image_asset = models.ForeignKey('ImageAsset', on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    # Partition key on PostgreSQL (see partitions.py); kept as is on restore
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = MessageQuerySet.as_manager()
 
     MAX_MESSAGES_PER_CONVERSATION = 8  # class-level constant
 
+    class Meta:
+        indexes = [
+            # MessageListView / LatestMessageView ordering within a conversation
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_conv_created_idx'),
+            models.Index(fields=['conversation', 'sender'], name='message_conv_sender_idx'),
+        ]
+
+    def limit_error(self):
+        return ValidationError(
+            f"This conversation already has {self.MAX_MESSAGES_PER_CONVERSATION} user messages.",
+            code="conversation_full",
+        )
+
     def clean(self):
-        # Only limit user messages
-        if self.sender.lower() == 'user':
-            user_messages_count = Message.objects.filter(
-                conversation=self.conversation,
-                sender='user'
-            ).count()
-            if user_messages_count >= self.MAX_MESSAGES_PER_CONVERSATION:
-                raise ValidationError(
-                    f"This conversation already has {self.MAX_MESSAGES_PER_CONVERSATION} user messages."
-                )
+        # Only limit user messages (uses the denormalized counter, no COUNT query)
+        if self.sender.lower() == 'user' and self._state.adding:
+            if self.conversation.user_message_count >= self.MAX_MESSAGES_PER_CONVERSATION:
+                raise self.limit_error()
 
     def save(self, *args, **kwargs):
         self.full_clean()  # triggers clean() before saving
-        super().save(*args, **kwargs)
\ No newline at end of file
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                self.update_conversation_counters()
+
+    def update_conversation_counters(self):
+        """Bump the conversation counters; the filter re-checks the limit atomically."""
+        conversations = Conversation.objects.filter(pk=self.conversation_id)
+        changes = {'last_message_at': self.created_at, 'updated_at': self.created_at}
+        if self.sender.lower() == 'user':
+            conversations = conversations.filter(user_message_count__lt=self.MAX_MESSAGES_PER_CONVERSATION)
+            changes['user_message_count'] = F('user_message_count') + 1
+
+        if not conversations.update(**changes):
+            raise self.limit_error()  # a concurrent message took the last slot; rolls back the insert
+
+        if 'user_message_count' in changes:
+            self.conversation.user_message_count += 1
+        self.conversation.last_message_at = self.created_at
+        self.conversation.updated_at = self.created_at
+
+
+# ---- Create a Generation Job model
+class GenerationJob(models.Model):
+    """An AI reply waiting to be generated off the request thread."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='generation_jobs')
+    # No database constraint: the partitioned message table has no unique key on id alone
+    # (Django still cascades and nulls these on delete)
+    user_message = models.OneToOneField(
+        Message, on_delete=models.CASCADE, related_name='generation_job', db_constraint=False
+    )
+    assistant_message = models.ForeignKey(
+        Message, on_delete=models.SET_NULL, related_name='+', null=True, blank=True, db_constraint=False
+    )
+    prompt = models.TextField()
+    cacheable = models.BooleanField(default=True)  # False when the prompt carries conversation history
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+
+# ---- Create an Archived Conversation model
+class ArchivedConversation(models.Model):
+    """
+    A conversation moved out of the hot tables into a compressed JSONL file
+    under ARCHIVE_DIR by ``manage.py archive_conversations`` (see archive.py).
+    Restoring it brings the conversation back under its original id.
+    """
+    conversation_id = models.BigIntegerField(unique=True)   # original Conversation id
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, related_name='archived_conversations')
+    title = models.CharField(max_length=150, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()                        # when the conversation started
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    archive_file = models.CharField(max_length=255)           # relative to ARCHIVE_DIR
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='archived_conv_user_idx'),
+        ]
+
+    def __str__(self):
+        return self.title or f"Archived conversation {self.conversation_id}"
+
+
+# ---- Create an Image Asset model
+class ImageAsset(models.Model):
+    """
+    An uploaded image stored once under its SHA-256 (see images.py), plus the
+    WebP variants a background worker builds from it. Prompts and messages
+    uploading the same bytes share one asset.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    original = models.FileField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    width = models.PositiveIntegerField(null=True, blank=True)    # after EXIF rotation
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=dict, blank=True)         # name -> {"name", "width", "height"}
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Image {self.sha256[:12]} ({self.status})"
+
+
+# ---- Create an LLM Usage model
+class LLMUsage(models.Model):
+    """
+    One row per LLM call (or response cache hit) made for a conversation, see usage.py.
+    Kept small on purpose: ``manage.py rollup_usage`` folds rows into UsageRollup
+    and prunes them after USAGE_RAW_RETENTION_DAYS.
+    """
+    STATUS_OK = 'ok'
+    STATUS_CACHED = 'cached'
+    STATUS_ERROR = 'error'
+    STATUS_CHOICES = [
+        (STATUS_OK, 'OK'),
+        (STATUS_CACHED, 'Cached'),
+        (STATUS_ERROR, 'Error'),
+    ]
+
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, related_name='+')
+    conversation_id = models.BigIntegerField(null=True, blank=True)   # no FK: conversations get archived
+    model = models.CharField(max_length=100)
+    mode = models.CharField(max_length=10)            # invoke, batch or stream
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    cost_micros = models.PositiveBigIntegerField(default=0)   # millionths of the LLM_PRICE_* currency
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='llm_usage_user_created_idx'),
+            models.Index(fields=['created_at'], name='llm_usage_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.status} ({self.prompt_tokens}+{self.completion_tokens} tokens)"
+
+
+# ---- Create a Usage Rollup model
+class UsageRollup(models.Model):
+    """Per-user, per-day, per-model totals of LLMUsage (tokens and cost of billed calls only)."""
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, related_name='usage_rollups')
+    day = models.DateField()
+    model = models.CharField(max_length=100)
+    calls = models.PositiveIntegerField(default=0)
+    cached_calls = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    latency_ms_total = models.PositiveBigIntegerField(default=0)
+    latency_ms_max = models.PositiveIntegerField(default=0)
+    cost_micros = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'model'], name='usage_rollup_user_day_model_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='usage_rollup_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.model}: {self.calls} calls"
+
+
+# ---- Create a Usage Checkpoint model
+class UsageCheckpoint(models.Model):
+    """The last LLMUsage id already folded into UsageRollup (a single row)."""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.last_id}"
@@ -0,0 +1,52 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# ---- Keyset pagination for a conversation's messages (oldest first)
+class MessageCursorPagination(CursorPagination):
+    ordering = ("created_at", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+# ---- Keyset pagination for the conversation sidebar (newest first)
+class ConversationCursorPagination(CursorPagination):
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+# ---- Keyset pagination for the user's prompt history (newest first)
+class PromptCursorPagination(CursorPagination):
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+# ---- Limit/offset over ranked search results, without a COUNT query
+class SearchPagination(LimitOffsetPagination):
+    default_limit = 20
+    max_limit = 50
+    max_offset = 500   # deeper pages re-rank ever more rows; refine the query instead
+
+    def paginate_search(self, search, request):
+        """Call ``search(limit, offset)`` for one extra row to learn whether a next page exists."""
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = min(self.get_offset(request), self.max_offset)
+        rows = search(self.limit + 1, self.offset)
+        self.has_next = len(rows) > self.limit and self.offset + self.limit <= self.max_offset
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "previous": self.get_previous_link(), "results": data})
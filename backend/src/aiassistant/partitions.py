@@ -0,0 +1,125 @@
+"""
+Monthly range partitions of ``aiassistant_message`` on PostgreSQL.
+
+Migration 0007 turns the table into ``PARTITION BY RANGE (created_at)`` with
+one partition per month (``aiassistant_message_y2026m10``) and a DEFAULT
+partition for rows outside them. ``manage.py manage_message_partitions``
+keeps upcoming months created and drops emptied months once archival has
+moved their conversations out, so the number of partitions stays bounded.
+
+Queries that bound ``created_at`` (``Message.objects.in_conversation()``)
+only touch the partitions a conversation can have rows in. On other
+databases the table is left as is: ``is_partitioned()`` is False and the
+callers skip the rest of this module.
+"""
+from datetime import date, datetime, timezone as dt_timezone
+from django.db import connection as default_connection
+from django.utils import timezone
+
+TABLE = "aiassistant_message"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def is_supported(connection=None) -> bool:
+    return (connection or default_connection).vendor == "postgresql"
+
+
+# ---- Helper function: Month arithmetic
+def month_start(value) -> date:
+    if isinstance(value, datetime):
+        value = value.astimezone(dt_timezone.utc) if timezone.is_aware(value) else value
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def months_between(first: date, last: date):
+    """Yield the first day of every month from ``first`` to ``last`` inclusive."""
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+# ---- Partition management (PostgreSQL only)
+def is_partitioned(connection=None) -> bool:
+    connection = connection or default_connection
+    if not is_supported(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def list_partitions(connection=None) -> dict:
+    """Monthly partitions as ``{month: name}`` (the DEFAULT partition is left out)."""
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        suffix = name[len(TABLE) + 2:]  # "_y2026m10" -> "2026m10"
+        if name.startswith(f"{TABLE}_y") and len(suffix) == 7:
+            partitions[date(int(suffix[:4]), int(suffix[5:]), 1)] = name
+    return partitions
+
+
+def create_partition(month: date, connection=None) -> bool:
+    """Create the partition for ``month``; False when it already exists."""
+    connection = connection or default_connection
+    name = partition_name(month)
+    if month in list_partitions(connection):
+        return False
+    upper = add_months(month, 1)
+    with connection.cursor() as cursor:
+        # Bounds are UTC midnights, the same instants for every session time zone
+        cursor.execute(
+            f'CREATE TABLE "{name}" PARTITION OF "{TABLE}" '
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+        )
+    return True
+
+
+def ensure_partitions(first: date, last: date, connection=None) -> list:
+    """Create every missing monthly partition from ``first`` to ``last``."""
+    return [partition_name(month) for month in months_between(first, last) if create_partition(month, connection)]
+
+
+def drop_empty_partitions(before: date, connection=None) -> list:
+    """Drop monthly partitions that end before ``before`` and hold no rows."""
+    connection = connection or default_connection
+    dropped = []
+    with connection.cursor() as cursor:
+        for month, name in sorted(list_partitions(connection).items()):
+            if add_months(month, 1) > before:
+                continue
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{name}")')
+            if cursor.fetchone()[0]:
+                continue
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+            dropped.append(name)
+    return dropped
+
+
+def default_partition_rows(connection=None) -> int:
+    """Rows that fell outside every monthly partition (e.g. restored from an old archive)."""
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM "{DEFAULT_PARTITION}"')
+        return cursor.fetchone()[0]
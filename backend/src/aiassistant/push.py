@@ -0,0 +1,38 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+# --- Helper function: Channel group of a conversation ---
+def conversation_group(conversation_id) -> str:
+    return f"conversation.{conversation_id}"
+
+
+def _group_send(conversation_id, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(conversation_group(conversation_id), event)
+    except Exception:
+        # Push is best effort: the message is saved and clients can still poll
+        logger.exception("WebSocket push failed")
+
+
+# --- Helper function: Push a saved message to subscribed sockets ---
+def push_message(message):
+    """Send ``message`` to the conversation's sockets once the row is committed."""
+    from .serializers import MessageSerializer
+
+    data = dict(MessageSerializer(message).data)
+    transaction.on_commit(
+        lambda: _group_send(message.conversation_id, {"type": "message.created", "message": data})
+    )
+
+
+# --- Helper function: Push one streamed token ---
+def push_token(conversation_id, content: str):
+    _group_send(conversation_id, {"type": "message.token", "conversation": conversation_id, "content": content})
@@ -0,0 +1,408 @@
+"""
+Deadlines, retries, hedged requests and a circuit breaker around LLM calls.
+
+``get_guard().call(fn)`` runs ``fn`` (one Watsonx call) on a small thread
+pool so it can be abandoned when it overruns:
+
+- Each attempt gets at most LLM_ATTEMPT_TIMEOUT seconds, and the whole call
+  LLM_DEADLINE seconds, retries and backoff included.
+- Transient failures (timeouts, connection errors, HTTP 429/5xx) are retried
+  up to LLM_MAX_RETRIES times with exponential backoff and full jitter, so
+  workers that failed together do not retry together. Other errors (a bad
+  request, a bug) are raised at once.
+- With LLM_HEDGE_PERCENTILE set, an attempt still running after that
+  percentile of recent latencies gets a second, identical request; whichever
+  answers first wins. Only for idempotent calls (replies use greedy decoding).
+- LLM_BREAKER_FAILURES calls in a row that failed for good (after their
+  retries; a failed micro-batch counts once) open the circuit: calls
+  raise CircuitOpen (503 with Retry-After) without touching Watsonx for
+  LLM_BREAKER_RESET seconds, then a single trial call decides whether the
+  circuit closes again.
+
+Views take a ``Permit`` from the breaker before saving the user's message,
+so a refused request leaves nothing behind. A call that fails for good
+reaches clients as ``api_error()`` (503/504); the error text only goes to
+the logs, never into a saved reply.
+
+``get_guard().stream(open_stream)`` applies the same rules until the first
+chunk arrives; once a token has reached the client a failure is not retried
+(the reply would repeat), it only counts against the breaker.
+
+An abandoned attempt cannot be cancelled: it keeps its pool thread until the
+HTTP read timeout (LLM_ATTEMPT_TIMEOUT, see llm.py) ends it.
+"""
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+TRANSIENT_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+TRANSIENT_ERROR_NAMES = {"ConnectionError", "ConnectTimeout", "ReadTimeout", "Timeout", "RemoteDisconnected"}
+END = object()
+
+
+class CircuitOpen(APIException):
+    """Watsonx has been failing; calls are refused until the breaker's reset timeout passes."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The assistant is temporarily unavailable. Please retry shortly."
+    default_code = "circuit_open"
+
+    def __init__(self, detail=None, code=None, wait=None):
+        super().__init__(detail, code)
+        self.wait = wait   # DRF turns this into Retry-After
+
+
+class DeadlineExceeded(TimeoutError):
+    """An attempt, or the whole call, ran out of time."""
+
+
+class LLMUnavailable(APIException):
+    """A call failed for good (after its retries); the cause is only logged."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The assistant could not answer right now. Please retry shortly."
+    default_code = "llm_unavailable"
+
+
+class LLMTimeout(APIException):
+    """A call ran out of time (after its retries)."""
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = "The assistant took too long to answer. Please retry."
+    default_code = "llm_timeout"
+
+
+# ---- Helper function: What a client is told about a failed call
+def api_error(error) -> APIException:
+    """
+    503/504 for a failed LLM call. CircuitOpen and other API errors pass as
+    they are; anything else becomes a generic error, since the upstream
+    message can name hosts, models or request details.
+    """
+    if isinstance(error, APIException):
+        return error
+    if isinstance(error, TimeoutError) or type(error).__name__ in {"ConnectTimeout", "ReadTimeout", "Timeout"}:
+        return LLMTimeout()
+    return LLMUnavailable()
+
+
+# ---- Helper function: Is an error worth retrying?
+def is_transient(error) -> bool:
+    """
+    Timeouts, dropped connections and 429/5xx responses, also when wrapped by
+    the SDK (the cause chain is checked). Anything else is a permanent failure.
+    """
+    seen = 0
+    while error is not None and seen < 5:
+        if isinstance(error, CircuitOpen):
+            return False
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        if type(error).__name__ in TRANSIENT_ERROR_NAMES or is_httpx_transport_error(error):
+            return True
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None) or getattr(error, "status_code", None)
+        if status_code in TRANSIENT_STATUS_CODES:
+            return True
+        error = error.__cause__ or error.__context__
+        seen += 1
+    return False
+
+
+def is_httpx_transport_error(error) -> bool:
+    if not type(error).__module__.startswith("httpx"):
+        return False
+    import httpx
+
+    return isinstance(error, httpx.TransportError)
+
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    """
+    closed -> open after ``failure_threshold`` failures in a row (0 disables);
+    open -> half_open once ``reset_timeout`` seconds have passed, letting one
+    trial call through; its outcome closes or re-opens the circuit.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._trials = 0
+        self._stats = {"opened": 0, "rejected": 0}
+
+    def _remaining(self):
+        return self.opened_at + self.reset_timeout - time.monotonic()
+
+    def _reject(self, wait):
+        self._stats["rejected"] += 1
+        raise CircuitOpen(wait=max(1, math.ceil(wait)))
+
+    def check(self):
+        """Raise CircuitOpen while the circuit is open or its trial call is running (without taking the trial)."""
+        with self._lock:
+            if self.state == self.OPEN and self._remaining() > 0:
+                self._reject(self._remaining())
+            if self._trial_running:
+                self._reject(self.reset_timeout)
+
+    def admit(self):
+        """Admit a call, or raise CircuitOpen. Returns a ``Permit``; when half-open it is the trial call."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return Permit(self, None)
+            if self.state == self.OPEN:
+                if self._remaining() > 0:
+                    self._reject(self._remaining())
+                self.state = self.HALF_OPEN
+            if self._trial_running:
+                self._reject(self.reset_timeout)
+            self._trial_running = True
+            self._trials += 1
+            return Permit(self, self._trials)
+
+    def _give_back(self, trial):
+        """Let another call be the trial when this one ended without an outcome."""
+        with self._lock:
+            if self._trial_running and trial == self._trials:
+                self._trial_running = False
+
+    def is_open(self):
+        with self._lock:
+            return self.state == self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if not self.failure_threshold:
+                return
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self._stats["opened"] += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            state = self.state
+            if state == self.OPEN and self._remaining() <= 0:
+                state = self.HALF_OPEN   # the next call will be the trial
+            return dict(self._stats, state=state, consecutive_failures=self.failures)
+
+
+class Permit:
+    """
+    A call admitted by the breaker. Views take one before saving anything and
+    hand it to the call; ``release()`` gives back a trial call that never
+    reached Watsonx (safe to call more than once, a no-op once an outcome was recorded).
+    """
+
+    def __init__(self, breaker, trial):
+        self.breaker = breaker
+        self.trial = trial
+
+    def release(self):
+        if self.trial is not None:
+            trial, self.trial = self.trial, None
+            self.breaker._give_back(trial)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# --- Guarded calls ---
+class Guard:
+    MIN_HEDGE_SAMPLES = 20
+
+    def __init__(self, deadline, attempt_timeout, max_retries, base_delay, max_delay,
+                 hedge_percentile, breaker, threads):
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="llm-call")
+        self._latencies = deque(maxlen=200)   # seconds, successful attempts
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._stats = {"calls": 0, "retries": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            deadline=settings.LLM_DEADLINE,
+            attempt_timeout=settings.LLM_ATTEMPT_TIMEOUT,
+            max_retries=settings.LLM_MAX_RETRIES,
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+            breaker=CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET),
+            threads=settings.LLM_CALL_THREADS,
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def backoff(self, retry):
+        """Full jitter: a random delay up to base * 2^retry, capped."""
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def hedge_delay(self):
+        """Seconds after which to send a hedged request, or None (disabled / too few samples)."""
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.MIN_HEDGE_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))]
+
+    def _attempt(self, fn, timeout, hedge):
+        """Run ``fn`` once (plus a hedge), waiting at most ``timeout`` seconds."""
+        started = time.monotonic()
+        first = self._executor.submit(fn)
+        pending = {first}
+        hedge_after = self.hedge_delay() if hedge else None
+        if hedge_after is not None and hedge_after < timeout:
+            if not wait(pending, hedge_after)[0]:
+                self._count("hedges")
+                pending.add(self._executor.submit(fn))
+
+        error = None
+        while pending:
+            done, pending = wait(pending, max(0, started + timeout - time.monotonic()), FIRST_COMPLETED)
+            if not done:
+                self._count("timeouts")
+                raise DeadlineExceeded(f"LLM call timed out after {timeout:.1f}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        self._count("hedge_wins")
+                    with self._lock:
+                        self._latencies.append(time.monotonic() - started)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _retrying(self, attempt, permit=None, counted=True):
+        """
+        Call ``attempt(timeout)`` until it succeeds, fails for good or runs out of time or retries.
+        The breaker sees one outcome per call, after the retries (none when not ``counted``).
+        """
+        with permit or self.breaker.admit():
+            self._count("calls")
+            deadline = time.monotonic() + self.deadline
+            retry = 0
+            while True:
+                try:
+                    result = attempt(min(self.attempt_timeout, deadline - time.monotonic()))
+                except Exception as e:
+                    transient = is_transient(e)
+                    delay = self.backoff(retry)
+                    if transient and retry < self.max_retries and not self.breaker.is_open() \
+                            and time.monotonic() + delay < deadline:
+                        retry += 1
+                        self._count("retries")
+                        time.sleep(delay)
+                        continue
+                    if transient:
+                        self._count("failures")
+                    if counted:
+                        # A non-transient error means Watsonx answered; the request was the problem
+                        self.breaker.record_failure() if transient else self.breaker.record_success()
+                    raise
+                if counted:
+                    self.breaker.record_success()
+                return result
+
+    def call(self, fn, hedge=True, permit=None, counted=True):
+        """
+        Return ``fn()``, with deadlines, retries, hedging (if ``hedge``) and the breaker applied.
+        ``permit``: taken by the caller beforehand (see Permit), else taken here.
+        ``counted=False`` leaves the breaker outcome to ``fn``'s side (the batch dispatcher
+        records one per batch, not one per caller in it).
+        """
+        return self._retrying(lambda timeout: self._attempt(fn, timeout, hedge), permit, counted)
+
+    def stream(self, open_stream, permit=None):
+        """
+        Yield the chunks of ``open_stream()`` (an iterator from ``llm.stream``).
+        Until the first chunk arrives, attempts are timed and retried like ``call``.
+        """
+        def first_chunk(timeout):
+            chunks = iter(open_stream())
+            return chunks, self._attempt(lambda: next(chunks, END), timeout, hedge=False)
+
+        chunks, first = self._retrying(first_chunk, permit)
+        try:
+            if first is not END:
+                yield first
+                yield from chunks
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+            raise
+        finally:
+            close = getattr(chunks, "close", None)
+            if close:
+                close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        hedge_after = self.hedge_delay()
+        stats["hedge_after_ms"] = None if hedge_after is None else round(hedge_after * 1000)
+        return {**stats, "breaker": self.breaker.stats()}
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def get_guard():
+    """Return the process-wide Guard."""
+    global _guard
+    with _guard_lock:
+        if _guard is None:
+            _guard = Guard.from_settings()
+    return _guard
+
+
+def collect_metrics():
+    """Retry, hedge and breaker counters for fastai.metrics."""
+    stats = get_guard().stats()
+    breaker = stats["breaker"]
+    return [
+        ("llm_retries_total", "counter", "LLM attempts retried after a transient failure.", {(): stats["retries"]}),
+        ("llm_attempt_timeouts_total", "counter", "LLM attempts abandoned at their deadline.", {(): stats["timeouts"]}),
+        ("llm_hedged_requests_total", "counter", "Hedged second requests sent.", {(): stats["hedges"]}),
+        ("llm_hedge_wins_total", "counter", "Hedged requests that answered first.", {(): stats["hedge_wins"]}),
+        ("llm_failed_calls_total", "counter", "LLM calls that failed after retries.", {(): stats["failures"]}),
+        ("llm_circuit_state", "gauge", "1 for the breaker's current state.",
+         {(("state", state),): int(breaker["state"] == state)
+          for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)}),
+        ("llm_circuit_opened_total", "counter", "Times the breaker opened.", {(): breaker["opened"]}),
+        ("llm_circuit_rejections_total", "counter", "Calls refused while the breaker was open.", {(): breaker["rejected"]}),
+    ]
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+# --- Helper function: Split text into overlapping chunks ---
+def chunk_text(text: str, max_words: int = 120, overlap: int = 20):
+    """Split text into chunks of ``max_words`` words sharing ``overlap`` words."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(max_words - overlap, 1)
+    return [" ".join(words[start:start + max_words]) for start in range(0, max(len(words) - overlap, 1), step)]
+
+
+# --- Helper function: Read a corpus directory ---
+def load_corpus(corpus_dir, max_words=120, overlap=20):
+    """
+    Yield ``{"title", "source", "text"}`` chunks from a curated corpus.
+
+    - ``*.md`` / ``*.txt``: one document per file; the first line is the title,
+      an optional ``Source: <url>`` line gives the citation.
+    - ``*.jsonl``: one ``{"title", "source", "text"}`` document per line.
+    """
+    for path in sorted(Path(corpus_dir).rglob("*")):
+        if path.suffix == ".jsonl":
+            with path.open(encoding="utf-8") as f:
+                documents = [json.loads(line) for line in f if line.strip()]
+        elif path.suffix in (".md", ".txt"):
+            lines = path.read_text(encoding="utf-8").splitlines()
+            title = lines[0].lstrip("# ").strip() if lines else path.stem
+            source = next((line.split(":", 1)[1].strip() for line in lines if line.lower().startswith("source:")), path.name)
+            body = "\n".join(line for line in lines[1:] if not line.lower().startswith("source:"))
+            documents = [{"title": title, "source": source, "text": body}]
+        else:
+            continue
+
+        for document in documents:
+            for chunk in chunk_text(document.get("text", ""), max_words, overlap):
+                yield {"title": document.get("title", path.stem), "source": document.get("source", path.name), "text": chunk}
+
+
+# --- Local embedder (works offline) ---
+class HashingEmbedder:
+    """
+    Feature-hashing bag of words + bigrams with sublinear TF, L2-normalized.
+
+    No model download or network call; good enough to surface the right
+    corpus passages and a stand-in for a real embedding model.
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    @property
+    def name(self):
+        return f"hashing-{self.dim}"
+
+    def _bucket(self, feature):
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = TOKEN_RE.findall(text.lower())
+            counts = {}
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                counts[feature] = counts.get(feature, 0) + 1
+            for feature, count in counts.items():
+                index, sign = self._bucket(feature)
+                vectors[row, index] += sign * (1.0 + np.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+def get_embedder(path=None, **kwargs):
+    return import_string(path or settings.RETRIEVAL_EMBEDDER)(**kwargs)
+
+
+def embedder_path(embedder):
+    return f"{type(embedder).__module__}.{type(embedder).__qualname__}"
+
+
+# --- Memory-mapped vector index ---
+class VectorIndex:
+    """
+    Normalized float32 vectors in ``vectors.npy`` (memory-mapped, so only the
+    pages touched by a search are loaded) plus chunk metadata in
+    ``chunks.jsonl``, addressed through ``offsets.npy``.
+
+    ``build()`` never touches files a running worker may have mapped: each
+    build goes to a new sibling directory, and ``index_dir`` is a symlink
+    switched to it in one rename. Workers notice the switch on their next
+    ``get_retriever()`` call.
+    """
+    BLOCK_ROWS = 65536  # rows scored per matrix multiply; bounds temporary memory
+
+    def __init__(self, index_dir):
+        # Open every file from the same build, even if the symlink is switched meanwhile
+        self.index_dir = Path(index_dir).resolve()
+        with (self.index_dir / "meta.json").open() as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(self.index_dir / "vectors.npy", mmap_mode="r")
+        self.offsets = np.load(self.index_dir / "offsets.npy", mmap_mode="r")
+        self._chunks = (self.index_dir / "chunks.jsonl").open("rb")
+        self._chunks_lock = threading.Lock()
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @classmethod
+    def build(cls, chunks, index_dir, embedder, batch_size=256):
+        """Embed ``chunks`` in batches into a new directory, then switch ``index_dir`` to it."""
+        index_dir = Path(index_dir)
+        index_dir.parent.mkdir(parents=True, exist_ok=True)
+        build_dir = Path(tempfile.mkdtemp(prefix=f"{index_dir.name}.", dir=index_dir.parent))
+        try:
+            cls.write(chunks, build_dir, embedder, batch_size)
+            previous = cls.publish(build_dir, index_dir)
+        except BaseException:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+
+        # Keep the build just replaced (a worker may be opening it right now), drop older ones.
+        # Workers still mapping a deleted build keep reading it until they reload.
+        for old in index_dir.parent.glob(f"{index_dir.name}.*"):
+            if old.is_dir() and not old.is_symlink() and old.name not in (build_dir.name, previous):
+                shutil.rmtree(old, ignore_errors=True)
+        return cls(index_dir)
+
+    @staticmethod
+    def publish(build_dir, index_dir):
+        """Point the ``index_dir`` symlink at ``build_dir`` atomically. Returns the name of the previous build."""
+        previous = None
+        if index_dir.is_symlink():
+            previous = os.path.basename(os.readlink(index_dir))
+        elif index_dir.exists():
+            # An index written in place by an older version: move it aside once
+            previous = f"{index_dir.name}.inplace"
+            os.replace(index_dir, index_dir.with_name(previous))
+        link = index_dir.with_name(f".{index_dir.name}.link-{os.getpid()}")
+        if link.is_symlink():
+            link.unlink()
+        os.symlink(build_dir.name, link)
+        os.replace(link, index_dir)
+        return previous
+
+    @staticmethod
+    def write(chunks, index_dir, embedder, batch_size):
+        chunks = list(chunks)
+        index_dir = Path(index_dir)
+        vectors = np.lib.format.open_memmap(
+            index_dir / "vectors.npy", mode="w+", dtype=np.float32, shape=(len(chunks), embedder.dim)
+        )
+        offsets = np.zeros(len(chunks), dtype=np.int64)
+        with (index_dir / "chunks.jsonl").open("wb") as f:
+            for start in range(0, len(chunks), batch_size):
+                batch = chunks[start:start + batch_size]
+                vectors[start:start + len(batch)] = embedder.embed([chunk["text"] for chunk in batch])
+                for i, chunk in enumerate(batch, start):
+                    offsets[i] = f.tell()
+                    f.write(json.dumps(chunk).encode() + b"\n")
+        vectors.flush()
+        del vectors
+        np.save(index_dir / "offsets.npy", offsets)
+
+        with (index_dir / "meta.json").open("w") as f:
+            json.dump({
+                "count": len(chunks), "dim": embedder.dim,
+                "embedder": embedder.name, "embedder_class": embedder_path(embedder),
+            }, f)
+
+    def search(self, query_vectors, k=3):
+        """
+        Batched top-k inner-product search.
+
+        Returns one list of ``(score, row)`` per query, best first.
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        k = min(k, len(self))
+        if k == 0:
+            return [[] for _ in queries]
+
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), k), dtype=np.int64)
+        for start in range(0, len(self), self.BLOCK_ROWS):
+            scores = queries @ self.vectors[start:start + self.BLOCK_ROWS].T
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(
+                np.arange(start, start + scores.shape[1] - k), (len(queries), scores.shape[1] - k)
+            )], axis=1)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [
+            [(float(score), int(row)) for score, row in zip(scores, rows) if np.isfinite(score)]
+            for scores, rows in zip(best_scores, best_rows)
+        ]
+
+    def chunk(self, row):
+        with self._chunks_lock:
+            self._chunks.seek(int(self.offsets[row]))
+            return json.loads(self._chunks.readline())
+
+
+# --- Retriever used when building prompts ---
+class Retriever:
+    def __init__(self, index, embedder, top_k=3, min_score=0.0):
+        self.index = index
+        self.embedder = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+
+    def retrieve(self, question, k=None):
+        """Return the best matching chunks for ``question`` with their scores."""
+        return self.retrieve_many([question], k)[0]
+
+    def retrieve_many(self, questions, k=None):
+        results = self.index.search(self.embedder.embed(questions), k or self.top_k)
+        return [
+            [dict(self.index.chunk(row), score=score) for score, row in hits if score >= self.min_score]
+            for hits in results
+        ]
+
+
+def load_retriever(index_dir):
+    """
+    A Retriever over the index in ``index_dir``, with the embedder it was built with.
+    Raises ImproperlyConfigured rather than mix embedding spaces.
+    """
+    index = VectorIndex(index_dir)
+    embedder = get_embedder(index.meta.get("embedder_class"), dim=index.meta["dim"])
+    if embedder.name != index.meta["embedder"]:
+        raise ImproperlyConfigured(
+            f"Retrieval index in {index.index_dir} was built with {index.meta['embedder']}, "
+            f"but {embedder.name} would embed the questions; rebuild it with build_retrieval_index."
+        )
+    return Retriever(index, embedder, top_k=settings.RETRIEVAL_TOP_K, min_score=settings.RETRIEVAL_MIN_SCORE)
+
+
+_retriever = None
+_retriever_build = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever():
+    """
+    Return the process-wide Retriever, or None when no index has been built.
+    Reloaded when build_retrieval_index publishes a new build (one stat per call).
+    """
+    global _retriever, _retriever_build
+    if not settings.RETRIEVAL_ENABLED:
+        return None
+    meta = os.path.join(settings.RETRIEVAL_INDEX_DIR, "meta.json")
+    try:
+        # The symlink target changes on every build; mtime covers indexes written in place
+        build = (os.path.realpath(meta), os.stat(meta).st_mtime_ns)
+    except FileNotFoundError:
+        return None
+    with _retriever_lock:
+        if build != _retriever_build:
+            _retriever = load_retriever(settings.RETRIEVAL_INDEX_DIR)
+            _retriever_build = build
+    return _retriever
+
+
+def index_version() -> str:
+    """The published index build the retriever serves ("" without one), e.g. for cache keys."""
+    if get_retriever() is None:
+        return ""
+    with _retriever_lock:
+        path, mtime_ns = _retriever_build
+    return f"{path}:{mtime_ns}"
+
+
+# --- Helper function: Format retrieved chunks for the prompt ---
+def format_sources(chunks):
+    return "\n\n".join(
+        f"[{i}] {chunk['title']} ({chunk['source']})\n{chunk['text']}"
+        for i, chunk in enumerate(chunks, 1)
+    )
@@ -0,0 +1,7 @@
+from django.urls import path
+from . import consumers
+
+# ---- WebSocket routes (served by fastai/asgi.py)
+websocket_urlpatterns = [
+    path("ws/aiassistant/", consumers.ConversationConsumer.as_asgi(), name="conversation-socket"),
+]
@@ -0,0 +1,285 @@
+"""
+Ranked full-text search over a user's messages and prompts.
+
+- PostgreSQL: a stored generated ``search_vector`` tsvector column on
+  ``aiassistant_message`` and ``aiassistant_prompt`` (kept current by the
+  database on every insert and update), GIN-indexed, queried with
+  ``websearch_to_tsquery`` and ranked by ``ts_rank_cd``.
+- SQLite: external-content FTS5 tables kept in sync by triggers, ranked by
+  ``bm25``. Used for tests and local development.
+
+Migration 0008 sets up the one for the database through ``create_index()``. Neither column nor
+table is on the Django models: queries go through the raw SQL below.
+On SQLite, a later migration that rebuilds the message or prompt table
+drops the triggers; run ``manage.py rebuild_search_index`` after it.
+
+Each backend provides ``rank()``, the SQL that finds and ranks the user's
+matches, and ``headlines()``, the highlights for one page of them. They come
+back HTML-escaped, with the matches wrapped in <mark>.
+"""
+import re
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape
+
+KINDS = ("message", "prompt")
+# Highlight delimiters: control characters that survive escaping, swapped for <mark> afterwards
+START, STOP = "\x02", "\x03"
+MAX_FRAGMENT_WORDS = 16
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+def mark(highlight: str) -> str:
+    return escape(highlight or "").replace(START, "<mark>").replace(STOP, "</mark>")
+
+
+def result(kind, row):
+    object_id, conversation_id, label, created_at, highlight, rank = row
+    if isinstance(created_at, str):  # SQLite returns text from raw compound queries
+        created_at = parse_datetime(created_at)
+        if settings.USE_TZ and timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at, dt_timezone.utc)
+    return {
+        "type": kind,
+        "id": object_id,
+        "conversation": conversation_id,
+        # Sender for messages, title for prompts
+        "label": label,
+        "created_at": created_at,
+        "highlight": mark(highlight),
+        "rank": rank,
+    }
+
+
+# ---- PostgreSQL: tsvector column + GIN index
+class PostgresSearch:
+    """Ranks by ts_rank_cd; higher is better."""
+
+    def create_index(self, schema_editor):
+        config = settings.SEARCH_CONFIG
+        # The explicit regconfig keeps to_tsvector immutable, as generated columns require
+        schema_editor.execute(
+            f"ALTER TABLE aiassistant_message ADD COLUMN search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('{config}'::regconfig, content)) STORED"
+        )
+        schema_editor.execute(
+            f"ALTER TABLE aiassistant_prompt ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('{config}'::regconfig, coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('{config}'::regconfig, input_text), 'B') || "
+            f"setweight(to_tsvector('{config}'::regconfig, coalesce(output_text, '')), 'C')) STORED"
+        )
+        # On the partitioned message table this creates one GIN index per partition
+        schema_editor.execute("CREATE INDEX message_search_idx ON aiassistant_message USING gin (search_vector)")
+        schema_editor.execute("CREATE INDEX prompt_search_idx ON aiassistant_prompt USING gin (search_vector)")
+
+    def drop_index(self, schema_editor):
+        schema_editor.execute("ALTER TABLE aiassistant_message DROP COLUMN search_vector")
+        schema_editor.execute("ALTER TABLE aiassistant_prompt DROP COLUMN search_vector")
+
+    def rebuild(self):
+        pass  # generated columns are always current
+
+    def rank(self, user_id, query, kinds):
+        # With few messages per user, the planner can also start from the user's
+        # conversations and recheck the stored vectors instead of using the GIN index.
+        # Only the newest SEARCH_MAX_CANDIDATES matches of each kind are ranked (LIMIT NULL: all).
+        limit = settings.SEARCH_MAX_CANDIDATES or None
+        parts, params = [], []
+        if "message" in kinds:
+            parts.append(
+                "SELECT 'message', m.id, m.conversation_id, m.sender, m.created_at, ts_rank_cd(m.search_vector, m.q) "
+                "FROM (SELECT m.id, m.conversation_id, m.sender, m.created_at, m.search_vector, q "
+                "FROM aiassistant_message m "
+                "JOIN aiassistant_conversation c ON c.id = m.conversation_id, "
+                "websearch_to_tsquery(%s::regconfig, %s) q "
+                "WHERE c.user_id = %s AND m.search_vector @@ q ORDER BY m.created_at DESC LIMIT %s) m"
+            )
+            params += [settings.SEARCH_CONFIG, query, user_id, limit]
+        if "prompt" in kinds:
+            parts.append(
+                "SELECT 'prompt', p.id, NULL, p.title, p.created_at, ts_rank_cd(p.search_vector, p.q) "
+                "FROM (SELECT p.id, p.title, p.created_at, p.search_vector, q "
+                "FROM aiassistant_prompt p, websearch_to_tsquery(%s::regconfig, %s) q "
+                "WHERE p.user_id = %s AND p.search_vector @@ q ORDER BY p.created_at DESC LIMIT %s) p"
+            )
+            params += [settings.SEARCH_CONFIG, query, user_id, limit]
+        return " UNION ALL ".join(parts), params
+
+    def headlines(self, kind, ids, query, user_id):
+        text = "content" if kind == "message" else "input_text || ' ' || coalesce(output_text, '')"
+        options = f"StartSel={START}, StopSel={STOP}, MaxWords={MAX_FRAGMENT_WORDS}, MinWords=5, MaxFragments=2"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, ts_headline(%s::regconfig, {text}, websearch_to_tsquery(%s::regconfig, %s), %s) "
+                f"FROM aiassistant_{kind} WHERE id = ANY(%s)",
+                [settings.SEARCH_CONFIG, settings.SEARCH_CONFIG, query, options, list(ids)],
+            )
+            return dict(cursor.fetchall())
+
+
+# ---- SQLite: FTS5 external-content tables
+class SQLiteSearch:
+    """
+    Ranks by bm25 (lower is better); the rank is negated so higher is better,
+    as on PostgreSQL. Each row also indexes an owner token (``u<user id>``),
+    so a query intersects with the user's rows inside FTS5 instead of
+    matching every user's messages first.
+    """
+
+    # kind: (FTS5 columns, content view, trigger source table, owner expression for a row)
+    TABLES = {
+        "message": (
+            ("content",),
+            "SELECT m.id, m.content, 'u' || c.user_id AS owner "
+            "FROM aiassistant_message m JOIN aiassistant_conversation c ON c.id = m.conversation_id",
+            "aiassistant_message",
+            "(SELECT 'u' || user_id FROM aiassistant_conversation WHERE id = {row}.conversation_id)",
+        ),
+        "prompt": (
+            ("title", "input_text", "output_text"),
+            "SELECT id, title, input_text, output_text, 'u' || user_id AS owner FROM aiassistant_prompt",
+            "aiassistant_prompt",
+            "'u' || {row}.user_id",
+        ),
+    }
+
+    def create_index(self, schema_editor):
+        for kind, (columns, view, table, owner) in self.TABLES.items():
+            fts = f"aiassistant_{kind}_fts"
+            names = ", ".join(columns)
+            new = ", ".join(f"new.{column}" for column in columns)
+            old = ", ".join(f"old.{column}" for column in columns)
+            new_owner, old_owner = owner.format(row="new"), owner.format(row="old")
+            # The view gives FTS5 the owner column to rebuild from and the text to build snippets from
+            schema_editor.execute(f"CREATE VIEW aiassistant_{kind}_search AS {view}")
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, owner, content='aiassistant_{kind}_search', "
+                f"content_rowid='id', tokenize='porter unicode61')"
+            )
+            schema_editor.execute(
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {names}, owner) VALUES (new.id, {new}, {new_owner}); END"
+            )
+            # Django deletes messages before their conversation, so the owner is still there
+            schema_editor.execute(
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {names}, owner) VALUES ('delete', old.id, {old}, {old_owner}); END"
+            )
+            schema_editor.execute(
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {names} ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {names}, owner) VALUES ('delete', old.id, {old}, {old_owner}); "
+                f"INSERT INTO {fts}(rowid, {names}, owner) VALUES (new.id, {new}, {new_owner}); END"
+            )
+            schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def drop_index(self, schema_editor):
+        for kind in self.TABLES:
+            fts = f"aiassistant_{kind}_fts"
+            for suffix in ("ai", "ad", "au"):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+            schema_editor.execute(f"DROP VIEW IF EXISTS aiassistant_{kind}_search")
+
+    def rebuild(self):
+        """Recreate missing triggers (dropped when Django rebuilds a table) and reindex."""
+        with connection.schema_editor() as schema_editor:
+            self.drop_index(schema_editor)
+            self.create_index(schema_editor)
+
+    def match_expression(self, kind, user_id, query: str) -> str:
+        """User input as an FTS5 query: every word must match, as quoted terms (no FTS syntax)."""
+        words = " ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+        return f'owner : "u{user_id}" AND {{{" ".join(self.TABLES[kind][0])}}} : ({words})'
+
+    def newest_matches(self, fts, match):
+        """Limit to the newest SEARCH_MAX_CANDIDATES matches: a rowid bound FTS5 applies while matching."""
+        if not settings.SEARCH_MAX_CANDIDATES:
+            return "", []
+        return (
+            f" AND {fts}.rowid >= coalesce((SELECT rowid FROM {fts} WHERE {fts} MATCH %s "
+            f"ORDER BY rowid DESC LIMIT 1 OFFSET %s), 0)",
+            [match, settings.SEARCH_MAX_CANDIDATES - 1],
+        )
+
+    def rank(self, user_id, query, kinds):
+        if not re.search(r"\w", query):
+            return None, []
+        parts, params = [], []
+        if "message" in kinds:
+            match = self.match_expression("message", user_id, query)
+            bound, bound_params = self.newest_matches("aiassistant_message_fts", match)
+            parts.append(
+                "SELECT 'message', m.id, m.conversation_id, m.sender, m.created_at, "
+                "-bm25(aiassistant_message_fts, 1.0, 0.0) "
+                "FROM aiassistant_message_fts JOIN aiassistant_message m ON m.id = aiassistant_message_fts.rowid "
+                "WHERE aiassistant_message_fts MATCH %s" + bound
+            )
+            params += [match, *bound_params]
+        if "prompt" in kinds:
+            match = self.match_expression("prompt", user_id, query)
+            bound, bound_params = self.newest_matches("aiassistant_prompt_fts", match)
+            parts.append(
+                "SELECT 'prompt', p.id, NULL, p.title, p.created_at, "
+                "-bm25(aiassistant_prompt_fts, 4.0, 2.0, 1.0, 0.0) "
+                "FROM aiassistant_prompt_fts JOIN aiassistant_prompt p ON p.id = aiassistant_prompt_fts.rowid "
+                "WHERE aiassistant_prompt_fts MATCH %s" + bound
+            )
+            params += [match, *bound_params]
+        return " UNION ALL ".join(parts), params
+
+    def headlines(self, kind, ids, query, user_id):
+        fts = f"aiassistant_{kind}_fts"
+        column = 0 if kind == "message" else -1
+        placeholders = ", ".join(["%s"] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, snippet({fts}, {column}, %s, %s, '…', %s) FROM {fts} "
+                f"WHERE {fts} MATCH %s AND rowid IN ({placeholders})",
+                [START, STOP, MAX_FRAGMENT_WORDS, self.match_expression(kind, user_id, query), *ids],
+            )
+            return dict(cursor.fetchall())
+
+
+BACKENDS = {
+    "postgresql": PostgresSearch,
+    "sqlite": SQLiteSearch,
+}
+
+
+def get_search_backend(conn=None):
+    vendor = (conn or connection).vendor
+    if vendor not in BACKENDS:
+        raise SearchUnavailable(f"Full-text search is not supported on {vendor}")
+    return BACKENDS[vendor]()
+
+
+def search(user, query, kinds=KINDS, limit=20, offset=0):
+    """
+    Ranked matches for ``query`` among ``user``'s messages and prompts, best
+    first. Ranking reads no text; highlights are built afterwards for the
+    returned page only.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    backend = get_search_backend()
+    sql, params = backend.rank(user.pk, query, tuple(kinds))
+    if not sql:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(f"{sql} ORDER BY 6 DESC, 5 DESC, 2 DESC LIMIT %s OFFSET %s", params + [limit, offset])
+        rows = cursor.fetchall()
+
+    highlights = {}
+    for kind in KINDS:
+        ids = [row[1] for row in rows if row[0] == kind]
+        if ids:
+            highlights[kind] = backend.headlines(kind, ids, query, user.pk)
+    return [result(kind, (object_id, *rest, highlights[kind].get(object_id, ""), rank))
+            for kind, object_id, *rest, rank in rows]
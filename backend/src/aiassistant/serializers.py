@@ -1,12 +1,52 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Conversation, Message, Prompt
+from .images import image_variants, store_image
+from .models import ArchivedConversation, Conversation, GenerationJob, Message, Prompt, UsageRollup
+
+# ---- Image upload fields shared by Message and Prompt serializers
+class ImageUploadMixin(serializers.Serializer):
+    """
+    Writable ``image`` plus read-only ``image_variants``. The upload itself is
+    never returned: clients get the metadata-free variants (see images.py).
+    """
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        return image_variants(obj.image_asset, self.context.get('request'))
+
+    def validate_image(self, value):
+        if value is not None and value.size > settings.IMAGE_MAX_UPLOAD_MB * 2**20:
+            raise serializers.ValidationError(f"Images are limited to {settings.IMAGE_MAX_UPLOAD_MB} MB.")
+        return value
+
+    def store_upload(self, validated_data):
+        # Uploads go to content-addressed storage; variants are built in the background (images.py)
+        if 'image' in validated_data:
+            upload = validated_data['image']
+            validated_data['image_asset'] = store_image(upload) if upload else None
+            validated_data['image'] = validated_data['image_asset'].original.name if upload else None
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self.store_upload(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self.store_upload(validated_data))
 
 # ---- Create a Message Serializers
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(ImageUploadMixin, serializers.ModelSerializer):
     class Meta:
         model = Message
-        fields = ['id', 'conversation', 'content', 'sender', 'created_at']
+        fields = ['id', 'conversation', 'content', 'sender', 'image', 'image_variants', 'created_at']
         read_only_fields = ['sender', 'id', 'created_at']  # prevent client from sending this
+        extra_kwargs = {'image': {'write_only': True}}
+
+    def validate_conversation(self, value):
+        # Only the user's own conversations: the reply is built from and saved into it
+        request = self.context.get('request')
+        if value is not None and request is not None and value.user_id != request.user.id:
+            raise serializers.ValidationError(f'Invalid pk "{value.pk}" - object does not exist.')
+        return value
 
     def create(self, validated_data):
         # Always use string for sender
@@ -23,9 +63,82 @@ class ConversationSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'title', 'created_at', 'messages']
         read_only_fields = ['id', 'created_at', 'messages']
 
+# ---- Create a Conversation Summary Serializers (list view, no nested messages)
+class ConversationSummarySerializer(serializers.ModelSerializer):
+    message_count = serializers.IntegerField(read_only=True)
+    last_message = serializers.CharField(source='last_message_preview', read_only=True, allow_null=True)
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'title', 'created_at', 'message_count', 'last_message']
+        read_only_fields = fields
+
+# ---- Create an Archived Conversation Serializers (restore with POST .../archived/<id>/restore/)
+class ArchivedConversationSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='conversation_id', read_only=True)
+
+    class Meta:
+        model = ArchivedConversation
+        fields = ['id', 'title', 'created_at', 'last_message_at', 'message_count', 'archived_at']
+        read_only_fields = fields
+
+# ---- Create a Search Result Serializers (rows from search.py)
+class SearchResultSerializer(serializers.Serializer):
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    conversation = serializers.IntegerField(allow_null=True)   # messages only
+    label = serializers.CharField(allow_null=True)             # sender of a message, title of a prompt
+    created_at = serializers.DateTimeField()
+    highlight = serializers.CharField()                         # HTML-escaped, matches in <mark>
+    rank = serializers.FloatField()
+
 # ---- Create a Prompt Serializers
-class PromptSerializer(serializers.ModelSerializer):
+class PromptSerializer(ImageUploadMixin, serializers.ModelSerializer):
     class Meta:
         model = Prompt
-        fields = ['id', 'user', 'title', 'input_text', 'output_text', 'image', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = [
+            'id', 'user', 'title', 'input_text', 'output_text', 'image', 'image_variants',
+            'model_used', 'confidence', 'created_at',
+        ]
+        read_only_fields = ['id', 'user', 'created_at']
+        extra_kwargs = {'image': {'write_only': True}}
+
+# ---- Create a Prompt Summary Serializers (list view, bodies only as a short preview)
+class PromptSummarySerializer(serializers.ModelSerializer):
+    input_preview = serializers.CharField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Prompt
+        fields = ['id', 'title', 'input_preview', 'image_variants', 'model_used', 'confidence', 'created_at']
+        read_only_fields = fields
+
+    def get_image_variants(self, obj):
+        return image_variants(obj.image_asset, self.context.get('request'))
+
+# ---- Create a Generation Job Serializers
+class GenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationJob
+        # Not ``error``: it holds the raw upstream message and stays server-side
+        fields = ['id', 'conversation', 'user_message', 'assistant_message', 'status', 'created_at', 'finished_at']
+        read_only_fields = fields
+
+# ---- Create a Usage Serializers (rows from usage.usage_by_day)
+class UsageRollupSerializer(serializers.ModelSerializer):
+    latency_ms_avg = serializers.SerializerMethodField()
+    cost = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UsageRollup
+        fields = [
+            'day', 'model', 'calls', 'cached_calls', 'errors', 'prompt_tokens', 'completion_tokens',
+            'latency_ms_avg', 'latency_ms_max', 'cost',
+        ]
+        read_only_fields = fields
+
+    def get_latency_ms_avg(self, obj):
+        return round(obj.latency_ms_total / obj.calls) if obj.calls else 0
+
+    def get_cost(self, obj):
+        return obj.cost_micros / 1_000_000
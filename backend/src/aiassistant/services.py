@@ -0,0 +1,153 @@
+import time
+from fastai.metrics import (
+    llm_call_duration, llm_errors, llm_generations_in_flight, llm_prompt_chars, llm_response_chars,
+)
+from .batching import get_dispatcher
+from .cache import get_response_cache
+from .llm import GENERATION_PARAMS, MODEL_ID, SYSTEM_PROMPT, get_llm, normalize_response
+from .models import Conversation, LLMUsage, Message
+from .push import push_message
+from .resilience import get_guard
+from .usage import record_usage
+
+# --- Constants ---
+MAX_WORDS = 1500          # Max words in AI response
+
+
+# --- Helper function: Truncate AI response ---
+def truncate_words(text: str, max_words: int = MAX_WORDS) -> str:
+    """Cut a response down to ``max_words`` words."""
+    words = text.split()
+    if len(words) > max_words:
+        return " ".join(words[:max_words])
+    return text
+
+
+# --- Helper function: What a cached reply depends on besides the question ---
+def cache_context() -> str:
+    """
+    The system prompt and the retrieval index build: a standalone prompt is made
+    of these and the question, so editing the prompt or publishing a new index
+    gives every question a new response cache key.
+    """
+    from .retrieval import index_version  # loads numpy on first use, not at boot
+
+    return f"{SYSTEM_PROMPT}\n{index_version()}"
+
+
+# --- Helper function: Generate a full AI reply ---
+def generate_reply(prompt: str, question: str = None, conversation=None, permit=None) -> str:
+    """
+    Invoke the LLM once and return the cleaned, truncated reply.
+    With LLM_BATCH_WINDOW_MS set, the prompt goes through the batching dispatcher.
+    Timeouts, retries, hedging and the circuit breaker come from resilience.py.
+
+    When ``question`` is given, replies are served from and stored in the
+    response cache (greedy decoding makes them deterministic).
+    When ``conversation`` is given, the call is recorded for its user (see usage.py).
+    ``permit``: the breaker admission taken by the view before saving anything.
+    """
+    response_cache = get_response_cache() if question else None
+    if response_cache is not None:
+        cache_key = response_cache.make_key(question, MODEL_ID, GENERATION_PARAMS, cache_context())
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            if conversation is not None:
+                record_usage(conversation, MODEL_ID, "cache", LLMUsage.STATUS_CACHED, prompt, cached)
+            return cached
+
+    # Concurrent prompts share one generate call when micro-batching is on
+    dispatcher = get_dispatcher()
+    mode = "batch" if dispatcher else "invoke"
+    started = time.perf_counter()
+    try:
+        with llm_generations_in_flight.track_inprogress():
+            if dispatcher:
+                # Not hedged: the copy would ride in the same batch; the dispatcher
+                # tells the breaker how each batch went
+                raw_response = get_guard().call(lambda: dispatcher.generate(prompt), hedge=False,
+                                                permit=permit, counted=False)
+            else:
+                raw_response = get_guard().call(lambda: get_llm().invoke(prompt), permit=permit)
+    except Exception as e:
+        llm_errors.inc(model=MODEL_ID, error=type(e).__name__)
+        if conversation is not None:
+            record_usage(conversation, MODEL_ID, mode, LLMUsage.STATUS_ERROR, prompt,
+                         latency=time.perf_counter() - started)
+        raise
+    latency = time.perf_counter() - started
+    llm_call_duration.observe(latency, model=MODEL_ID, mode=mode)
+    llm_prompt_chars.observe(len(prompt), model=MODEL_ID)
+
+    ai_response = truncate_words(normalize_response(raw_response))
+    llm_response_chars.observe(len(ai_response), model=MODEL_ID)
+    if conversation is not None:
+        record_usage(conversation, MODEL_ID, mode, LLMUsage.STATUS_OK, prompt, ai_response, raw_response, latency)
+
+    if response_cache is not None and ai_response:
+        response_cache.set(cache_key, ai_response)
+    return ai_response
+
+
+# --- Helper function: Stream an AI reply ---
+def stream_reply(prompt: str, conversation=None, permit=None):
+    """
+    Yield reply chunks as the LLM produces them.
+    Failures before the first chunk are retried (see resilience.py), later ones are not.
+    When ``conversation`` is given, the call is recorded for its user once the
+    stream ends, fails or is closed early (see usage.py).
+    """
+    started = time.perf_counter()
+    parts = []
+    status = LLMUsage.STATUS_OK
+    llm_prompt_chars.observe(len(prompt), model=MODEL_ID)
+    try:
+        with llm_generations_in_flight.track_inprogress():
+            for chunk in get_guard().stream(lambda: get_llm().stream(prompt), permit):
+                text = chunk.content if hasattr(chunk, "content") else str(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+    except Exception as e:
+        llm_errors.inc(model=MODEL_ID, error=type(e).__name__)
+        status = LLMUsage.STATUS_ERROR
+        raise
+    finally:
+        latency = time.perf_counter() - started
+        response = "".join(parts)
+        llm_call_duration.observe(latency, model=MODEL_ID, mode="stream")
+        llm_response_chars.observe(len(response), model=MODEL_ID)
+        if conversation is not None:
+            record_usage(conversation, MODEL_ID, "stream", status, prompt, response, latency=latency)
+
+
+# --- Helper function: Save AI message ---
+def save_ai_message(conversation_id: int, ai_message):
+    """
+    Save AI message and generate conversation title if missing.
+    ``ai_message`` is the reply text, or anything with ``.content`` (e.g. a LangChain AIMessage).
+    """
+    conversation = Conversation.objects.get(id=conversation_id)
+
+    # Clean AI message content (remove "Assistant:" prefix)
+    content = getattr(ai_message, "content", ai_message).strip()
+    if content.lower().startswith("assistant:"):
+        content = content.split(":", 1)[1].strip()
+
+    # Save AI-generated message
+    msg = Message.objects.create(
+        conversation=conversation,
+        sender="assistant",
+        content=content
+    )
+
+    # Auto-generate title if missing
+    if not conversation.title:
+        first_words = " ".join(content.split()[:6])
+        title = first_words[:50].rstrip(".!?")
+        conversation.title = title or "New Chat"
+        conversation.save(update_fields=["title", "updated_at"])
+
+    # --- Tell subscribed WebSockets right away instead of waiting for their next poll ---
+    push_message(msg)
+    return msg
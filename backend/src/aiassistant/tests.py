@@ -1,3 +1,1795 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
+from PIL import Image
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from fastai.metrics import Histogram
+from users.models import UserAccount
+from .admission import ConcurrencyLimiter, Saturated
+from .archive import archive_batch, restore_conversation, retention_cutoff
+from .batching import BatchDispatcher
+from .cache import DjangoCacheBackend, LocMemLRUBackend, ResponseCache
+from .context import ContextAssembler, count_tokens
+from .fake_llm import FakeLLM, FakeLLMError
+from .images import process_next_image, store_image
+from .jobs import process_next_job, recover_jobs
+from .llm import MODEL_ID, LLMRegistry, get_llm
+from .models import (
+    ArchivedConversation, Conversation, GenerationJob, ImageAsset, LLMUsage, Message, Prompt, UsageCheckpoint, UsageRollup,
+)
+from .partitions import add_months, is_partitioned, list_partitions, month_start, months_between, partition_name
+from .resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, Guard
+from .retrieval import (
+    HashingEmbedder, Retriever, VectorIndex, chunk_text, get_retriever, index_version, load_retriever,
+)
+from .services import generate_reply, save_ai_message
+from .usage import prune_usage, rollup_usage
+
+
+# ---- Fake LLM that streams a canned reply token by token
+class FakeStreamingLLM:
+    def __init__(self, tokens, fail_after=None):
+        self.tokens = tokens
+        self.fail_after = fail_after
+
+    def invoke(self, prompt):
+        return "".join(self.tokens)
+
+    def stream(self, prompt):
+        for i, token in enumerate(self.tokens):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("stream broke")
+            yield token
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+# ---- Streaming endpoint tests
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class MessageStreamViewTests(TestCase):
+    def setUp(self):
+        cache.clear()  # fresh rate-limit buckets
+        self.user = UserAccount.objects.create_user(
+            email="stream@example.com", first_name="Stream", last_name="User", password="pass12345"
+        )
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, llm):
+        with mock.patch("aiassistant.services.get_llm", return_value=llm):
+            response = self.client.post(
+                "/aiassistant/messages/stream/",
+                {"content": "How do I lower blood pressure?", "conversation": self.conversation.id},
+                format="json",
+            )
+            return response, b"".join(response.streaming_content).decode()
+
+    def test_streams_tokens_and_saves_reply_once(self):
+        response, body = self.post(FakeStreamingLLM(["Drink ", "water ", "daily."]))
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = parse_events(body)
+        self.assertEqual([name for name, _ in events], ["message", "token", "token", "token", "done"])
+        self.assertEqual(events[-1][1]["content"], "Drink water daily.")
+
+        replies = Message.objects.filter(conversation=self.conversation, sender="assistant")
+        self.assertEqual(list(replies.values_list("content", flat=True)), ["Drink water daily."])
+
+    def test_stream_error_keeps_received_tokens_and_hides_the_cause(self):
+        response, body = self.post(FakeStreamingLLM(["Partial ", "answer"], fail_after=1))
+
+        events = parse_events(body)
+        self.assertEqual([name for name, _ in events], ["message", "token", "error", "done"])
+        self.assertEqual(events[2][1]["code"], "llm_unavailable")
+        self.assertNotIn("stream broke", body)
+        reply = Message.objects.get(conversation=self.conversation, sender="assistant")
+        self.assertEqual(reply.content, "Partial")
+
+    def test_stream_error_before_any_token_saves_no_reply(self):
+        response, body = self.post(FakeStreamingLLM(["Never"], fail_after=0))
+
+        self.assertEqual([name for name, _ in parse_events(body)], ["message", "error"])
+        self.assertFalse(Message.objects.filter(sender="assistant").exists())
+
+    def test_client_disconnect_saves_partial_reply(self):
+        with mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["One ", "two ", "three"])):
+            response = self.client.post(
+                "/aiassistant/messages/stream/",
+                {"content": "Count please", "conversation": self.conversation.id},
+                format="json",
+            )
+            stream = iter(response.streaming_content)
+            next(stream)  # user message
+            next(stream)  # first token
+            response.close()
+
+        reply = Message.objects.get(conversation=self.conversation, sender="assistant")
+        self.assertEqual(reply.content, "One")
+
+    def test_async_stream_drives_sync_generator(self):
+        from .views import async_iterate
+
+        def events():
+            yield "a"
+            yield "b"
+
+        async def collect():
+            return [event async for event in async_iterate(events())]
+
+        self.assertEqual(async_to_sync(collect)(), ["a", "b"])
+
+
+# ---- Background generation job tests
+@override_settings(GENERATION_QUEUE="db", RESPONSE_CACHE_ENABLED=False)
+class GenerationJobTests(TestCase):
+    def setUp(self):
+        cache.clear()  # fresh rate-limit buckets
+        self.user = UserAccount.objects.create_user(
+            email="jobs@example.com", first_name="Job", last_name="User", password="pass12345"
+        )
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_post_queues_job_and_returns_202(self):
+        with mock.patch("aiassistant.services.get_llm") as get_llm:
+            response = self.client.post(
+                "/aiassistant/messages/",
+                {"content": "Flu shot schedule?", "conversation": self.conversation.id},
+                format="json",
+            )
+            get_llm.assert_not_called()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], GenerationJob.STATUS_QUEUED)
+        self.assertFalse(Message.objects.filter(sender="assistant").exists())
+
+    def test_worker_saves_reply_and_latest_message_reports_status(self):
+        self.client.post(
+            "/aiassistant/messages/",
+            {"content": "Flu shot schedule?", "conversation": self.conversation.id},
+            format="json",
+        )
+        latest = self.client.get(f"/aiassistant/conversations/{self.conversation.id}/latest-message/")
+        self.assertEqual(latest.data["generation"]["status"], GenerationJob.STATUS_QUEUED)
+
+        with mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["Once a year."])):
+            job = process_next_job()
+
+        self.assertEqual(job.status, GenerationJob.STATUS_DONE)
+        self.assertIsNone(process_next_job())
+        latest = self.client.get(f"/aiassistant/conversations/{self.conversation.id}/latest-message/")
+        self.assertEqual(latest.data["sender"], "assistant")
+        self.assertEqual(latest.data["content"], "Once a year.")
+        self.assertEqual(latest.data["generation"]["assistant_message"], latest.data["id"])
+
+    def test_failed_job_is_marked_failed(self):
+        self.client.post(
+            "/aiassistant/messages/",
+            {"content": "Flu shot schedule?", "conversation": self.conversation.id},
+            format="json",
+        )
+        llm = mock.Mock()
+        llm.invoke.side_effect = RuntimeError("watsonx down")
+        with mock.patch("aiassistant.services.get_llm", return_value=llm):
+            job = process_next_job()
+
+        self.assertEqual(job.status, GenerationJob.STATUS_FAILED)
+        self.assertEqual(job.error, "watsonx down")
+        self.assertIsNone(job.assistant_message)
+        self.assertFalse(Message.objects.filter(sender="assistant").exists())
+        latest = self.client.get(f"/aiassistant/conversations/{self.conversation.id}/latest-message/")
+        self.assertEqual(latest.data["generation"]["status"], GenerationJob.STATUS_FAILED)
+        self.assertNotIn("watsonx down", json.dumps(latest.data, default=str))
+
+    def test_worker_slots_do_not_wait_for_each_other(self):
+        queue = ["slow", "quick", "quick", "quick"]
+        lock = threading.Lock()
+        finished = []
+
+        def process_next_job():
+            with lock:
+                if not queue:
+                    return None
+                job = queue.pop(0)
+            time.sleep(0.5 if job == "slow" else 0.05)
+            finished.append(job)
+            return mock.Mock(conversation_id=self.conversation.id)
+
+        with mock.patch("aiassistant.management.commands.run_generation_worker.process_next_job", process_next_job):
+            call_command("run_generation_worker", "--concurrency=2", "--once", stdout=io.StringIO())
+
+        # The other slot ran every quick job while the slow one was still generating
+        self.assertEqual(finished, ["quick", "quick", "quick", "slow"])
+
+    @override_settings(GENERATION_QUEUE="inprocess", GENERATION_STALE_AFTER=600, GENERATION_RECOVER_INTERVAL=60)
+    def test_recover_jobs_requeues_and_resubmits_orphans(self):
+        message = Message.objects.create(conversation=self.conversation, sender="user", content="Orphan?")
+        long_ago = timezone.now() - timedelta(hours=1)
+        orphan = GenerationJob.objects.create(conversation=self.conversation, user_message=message, prompt="p")
+        GenerationJob.objects.filter(id=orphan.id).update(
+            status=GenerationJob.STATUS_RUNNING, started_at=long_ago, created_at=long_ago,
+        )
+        fresh_message = Message.objects.create(conversation=self.conversation, sender="user", content="New?")
+        GenerationJob.objects.create(conversation=self.conversation, user_message=fresh_message, prompt="p")
+
+        with mock.patch("aiassistant.jobs.get_executor") as executor:
+            self.assertEqual(recover_jobs(), 1)
+            self.assertEqual(recover_jobs(), 1)
+        orphan.refresh_from_db()
+        self.assertEqual(orphan.status, GenerationJob.STATUS_QUEUED)
+        # Submitted once: it is still waiting on this process's pool the second time
+        executor.return_value.submit.assert_called_once_with(mock.ANY, orphan.id)
+
+
+# ---- Pooled Watsonx client tests
+@mock.patch("langchain_ibm.WatsonxLLM")
+@mock.patch("ibm_watsonx_ai.APIClient")
+class LLMRegistryTests(SimpleTestCase):
+    def test_client_is_created_once_and_reused(self, api_client_cls, llm_cls):
+        registry = LLMRegistry()
+
+        first = registry.get()
+        second = registry.get()
+
+        self.assertIs(first, second)
+        api_client_cls.assert_called_once()
+        llm_cls.assert_called_once()
+        self.assertEqual(registry.stats()["clients_created"], 1)
+        self.assertEqual(registry.stats()["clients_reused"], 1)
+
+    def test_different_params_get_their_own_client(self, api_client_cls, llm_cls):
+        llm_cls.side_effect = lambda **kwargs: mock.Mock()
+        registry = LLMRegistry()
+
+        self.assertIsNot(registry.get(params={"max_new_tokens": 10}), registry.get())
+        self.assertEqual(registry.stats()["clients"], 2)
+        api_client_cls.assert_called_once()
+
+    def test_token_refreshes_are_counted(self, api_client_cls, llm_cls):
+        type(api_client_cls.return_value).token = mock.PropertyMock(side_effect=["t1", "t1", "t2"])
+        registry = LLMRegistry()
+
+        for _ in range(3):
+            registry.get()
+
+        self.assertEqual(registry.stats()["token_refreshes"], 1)
+
+
+# ---- Response cache tests
+class ResponseCacheTests(SimpleTestCase):
+    def test_lru_evicts_least_recently_used(self):
+        backend = LocMemLRUBackend(max_entries=2)
+        backend.set("a", 1, 60)
+        backend.set("b", 2, 60)
+        backend.get("a")
+        backend.set("c", 3, 60)
+
+        self.assertEqual(backend.get("a"), 1)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(len(backend), 2)
+
+    def test_entries_expire_after_ttl(self):
+        backend = LocMemLRUBackend()
+        backend.set("a", 1, 60)
+        with mock.patch("aiassistant.cache.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(backend.get("a"))
+
+    def test_key_normalizes_question_and_includes_params(self):
+        response_cache = ResponseCache([LocMemLRUBackend()], ttl=60)
+        key = response_cache.make_key("How to lower blood pressure?", "m", {"temperature": 0})
+
+        self.assertEqual(key, response_cache.make_key("  how to LOWER blood   pressure ", "m", {"temperature": 0}))
+        self.assertNotEqual(key, response_cache.make_key("How to lower blood pressure?", "m", {"temperature": 1}))
+
+    def test_lower_tier_hit_backfills_upper_tier(self):
+        local, shared = LocMemLRUBackend(), LocMemLRUBackend()
+        response_cache = ResponseCache([local, shared], ttl=60)
+        shared.set("k", "answer", 60)
+
+        self.assertEqual(response_cache.get("k"), "answer")
+        self.assertEqual(local.get("k"), "answer")
+        self.assertEqual(response_cache.stats()["hits"], 1)
+
+    def test_generate_reply_calls_llm_once_for_repeated_question(self):
+        response_cache = ResponseCache([LocMemLRUBackend()], ttl=60)
+        llm = FakeStreamingLLM(["Exercise and eat less salt."])
+        llm.invoke = mock.Mock(wraps=llm.invoke)
+
+        with mock.patch("aiassistant.services.get_response_cache", return_value=response_cache), \
+                mock.patch("aiassistant.services.get_llm", return_value=llm):
+            first = generate_reply("prompt", question="How to lower blood pressure?")
+            second = generate_reply("prompt", question="how to lower blood pressure")
+
+        self.assertEqual(first, second)
+        llm.invoke.assert_called_once()
+        self.assertEqual(response_cache.stats()["misses"], 1)
+        self.assertEqual(response_cache.stats()["hits"], 1)
+
+    def test_system_prompt_edit_or_new_index_misses_the_cache(self):
+        response_cache = ResponseCache([LocMemLRUBackend()], ttl=60)
+        llm = mock.Mock()
+        llm.invoke.return_value = "Answer."
+
+        with mock.patch("aiassistant.services.get_response_cache", return_value=response_cache), \
+                mock.patch("aiassistant.services.get_llm", return_value=llm), \
+                mock.patch("aiassistant.retrieval.index_version", return_value="build-1") as index_version:
+            generate_reply("prompt", question="Is coffee bad?")
+            with mock.patch("aiassistant.services.SYSTEM_PROMPT", "You are a terse assistant."):
+                generate_reply("prompt", question="Is coffee bad?")
+            index_version.return_value = "build-2"
+            generate_reply("prompt", question="Is coffee bad?")
+            generate_reply("prompt", question="Is coffee bad?")
+
+        self.assertEqual(llm.invoke.call_count, 3)
+        self.assertEqual(response_cache.stats()["hits"], 1)
+
+    def test_invalidate_all_changes_keys(self):
+        response_cache = ResponseCache([LocMemLRUBackend()], ttl=60)
+        key = response_cache.make_key("q", "m", {})
+        response_cache.set(key, "answer")
+
+        response_cache.invalidate()
+
+        self.assertIsNone(response_cache.get(response_cache.make_key("q", "m", {})))
+
+    def test_invalidating_a_question_reaches_other_workers_local_tier(self):
+        cache.clear()
+        workers = [ResponseCache([LocMemLRUBackend(), DjangoCacheBackend()], ttl=60) for _ in range(2)]
+        for worker in workers:
+            worker.set(worker.make_key("Is coffee bad?", "m", {}), "old answer")
+        other_key = workers[1].make_key("Is tea bad?", "m", {})
+        workers[1].set(other_key, "tea answer")
+
+        workers[0].invalidate("is coffee bad", "m", {})
+
+        self.assertIsNone(workers[1].get(workers[1].make_key("Is coffee bad?", "m", {})))
+        self.assertEqual(workers[1].get(workers[1].make_key("Is tea bad?", "m", {})), "tea answer")
+        self.assertEqual(workers[1].stats()["tier_hits"]["locmem"], 1)
+
+
+# ---- Retrieval tests
+class RetrievalTests(SimpleTestCase):
+    CHUNKS = [
+        {"title": "Blood pressure", "source": "who.int/bp", "text": "Lower blood pressure by reducing salt and exercising."},
+        {"title": "Flu vaccine", "source": "cdc.gov/flu", "text": "Get a flu shot every year before flu season."},
+        {"title": "Sleep", "source": "nih.gov/sleep", "text": "Adults need seven or more hours of sleep."},
+    ]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.index_dir = Path(tmp.name) / "index"
+
+    def test_chunks_overlap(self):
+        chunks = chunk_text(" ".join(str(i) for i in range(250)), max_words=120, overlap=20)
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[1].startswith("100 "))
+
+    def test_retriever_finds_matching_chunk(self):
+        embedder = HashingEmbedder(dim=256)
+        index = VectorIndex.build(self.CHUNKS, self.index_dir, embedder, batch_size=2)
+        retriever = Retriever(index, embedder, top_k=1)
+
+        hits = retriever.retrieve("When should I get my flu shot?")
+        self.assertEqual(hits[0]["source"], "cdc.gov/flu")
+
+    def test_blocked_search_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        chunks = [{"title": str(i), "source": str(i), "text": str(i)} for i in range(50)]
+        embedder = mock.Mock(dim=8)
+        embedder.name = "random"
+        embedder.embed.side_effect = lambda texts: rng.standard_normal((len(texts), 8)).astype(np.float32)
+        index = VectorIndex.build(chunks, self.index_dir, embedder, batch_size=7)
+        index.BLOCK_ROWS = 16
+        queries = rng.standard_normal((4, 8)).astype(np.float32)
+
+        results = index.search(queries, k=5)
+
+        expected = np.argsort(-(queries @ np.asarray(index.vectors).T), axis=1)[:, :5]
+        self.assertEqual([[row for _, row in hits] for hits in results], expected.tolist())
+
+    def test_rebuild_switches_running_workers_to_the_new_index(self):
+        with override_settings(RETRIEVAL_INDEX_DIR=str(self.index_dir)):
+            VectorIndex.build(self.CHUNKS[:1], self.index_dir, HashingEmbedder(dim=64))
+            old = get_retriever()
+            self.assertIs(get_retriever(), old)
+            old_version = index_version()
+
+            VectorIndex.build(self.CHUNKS, self.index_dir, HashingEmbedder(dim=64))
+            VectorIndex.build(self.CHUNKS[1:], self.index_dir, HashingEmbedder(dim=64))
+            new = get_retriever()
+            self.assertNotEqual(index_version(), old_version)   # new response cache keys
+
+        self.assertEqual((len(old.index), len(new.index)), (1, 2))
+        self.assertEqual(old.retrieve("salt")[0]["source"], "who.int/bp")   # the old mapping still reads
+        self.assertTrue(self.index_dir.is_symlink())
+        self.assertEqual(len(list(self.index_dir.parent.glob("index.*"))), 2)   # current + previous build
+
+    def test_embedder_comes_from_the_index_not_the_setting(self):
+        VectorIndex.build(self.CHUNKS, self.index_dir, HashingEmbedder(dim=64))
+        with override_settings(RETRIEVAL_EMBEDDER="aiassistant.tests.OtherEmbedder"):
+            self.assertIsInstance(load_retriever(self.index_dir).embedder, HashingEmbedder)
+
+        meta = json.loads((self.index_dir / "meta.json").read_text())
+        (self.index_dir / "meta.json").write_text(json.dumps(dict(meta, embedder="hashing-128")))
+        with self.assertRaises(ImproperlyConfigured):
+            load_retriever(self.index_dir)
+
+
+# ---- Conversation context tests
+class ContextAssemblerTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create_user(
+            email="context@example.com", first_name="Context", last_name="User", password="pass12345"
+        )
+        self.conversation = Conversation.objects.create(user=self.user)
+
+    def add(self, sender, content):
+        return Message.objects.create(conversation=self.conversation, sender=sender, content=content)
+
+    def test_first_message_is_standalone(self):
+        message = self.add("user", "Is coffee bad for me?")
+        context = ContextAssembler(budget=500, summary_budget=50).assemble(message, "System.")
+
+        self.assertTrue(context.is_standalone)
+        self.assertEqual(context.prompt, "System.\n\nUser question:\nIs coffee bad for me?")
+        self.assertEqual(context.tokens["total"], count_tokens(context.prompt))
+
+    def test_recent_turns_kept_and_older_turns_summarized(self):
+        for i in range(3):
+            self.add("user", f"Question {i}. " + "word " * 40)
+            self.add("assistant", f"Answer {i}. " + "word " * 40)
+        message = self.add("user", "And now?")
+
+        context = ContextAssembler(budget=200, summary_budget=60).assemble(message, "System.")
+
+        self.assertEqual(context.history_turns, 2)
+        self.assertEqual(context.summarized_turns, 4)
+        self.assertIn("Answer 2.", context.prompt)
+        self.assertIn("- User asked: Question 1.", context.prompt)
+        self.assertFalse(context.is_standalone)
+        self.assertLessEqual(context.tokens["total"], 200)
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summarized_until, message.id - 3)
+
+    def test_summary_is_updated_incrementally(self):
+        for i in range(3):
+            self.add("user", f"Question {i}. " + "word " * 40)
+        first = self.add("user", "First follow-up")
+        ContextAssembler(budget=150, summary_budget=60).assemble(first, "System.")
+        self.conversation.refresh_from_db()
+        summary = self.conversation.summary
+
+        second = self.add("user", "Second follow-up")
+        second.conversation = self.conversation
+        with self.assertNumQueries(1):  # only the unsummarized tail is read; nothing new to fold
+            context = ContextAssembler(budget=150, summary_budget=60).assemble(second, "System.")
+
+        self.assertIn(summary, context.prompt)
+        self.assertEqual(context.summarized_turns, 0)
+
+
+# ---- Message sync tests
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class MessageSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()  # fresh rate-limit buckets
+        self.user = UserAccount.objects.create_user(
+            email="sync@example.com", first_name="Sync", last_name="User", password="pass12345"
+        )
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.messages = Message.objects.bulk_create(
+            Message(conversation=self.conversation, sender="assistant", content=f"Answer {i}") for i in range(5)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_is_cursor_paginated(self):
+        url = f"/aiassistant/messages/all/?conversation={self.conversation.id}&page_size=2"
+        contents = []
+        while url:
+            response = self.client.get(url)
+            contents += [m["content"] for m in response.data["results"]]
+            url = response.data["next"]
+
+        self.assertEqual(contents, [f"Answer {i}" for i in range(5)])
+
+    def test_since_returns_only_newer_messages(self):
+        response = self.client.get(
+            f"/aiassistant/messages/all/?conversation={self.conversation.id}&since={self.messages[2].id}"
+        )
+        self.assertEqual([m["content"] for m in response.data["results"]], ["Answer 3", "Answer 4"])
+
+    def test_other_users_conversation_is_hidden(self):
+        other = UserAccount.objects.create_user(email="other@example.com", first_name="O", last_name="U")
+        self.client.force_authenticate(other)
+        response = self.client.get(f"/aiassistant/messages/all/?conversation={self.conversation.id}")
+        self.assertEqual(response.data["results"], [])
+
+    def test_create_returns_only_new_messages(self):
+        with mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["Rest well."])):
+            response = self.client.post(
+                "/aiassistant/messages/",
+                {"content": "Any tips?", "conversation": self.conversation.id},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([(m["sender"], m["content"]) for m in response.data],
+                         [("user", "Any tips?"), ("assistant", "Rest well.")])
+        self.assertIn("X-Prompt-Tokens", response)
+
+    def test_cannot_post_into_another_users_conversation(self):
+        other = UserAccount.objects.create_user(email="intruder@example.com", first_name="I", last_name="N")
+        self.client.force_authenticate(other)
+        with mock.patch("aiassistant.services.get_llm") as get_llm:
+            for url in ("/aiassistant/messages/", "/aiassistant/messages/stream/"):
+                response = self.client.post(url, {"content": "Show me", "conversation": self.conversation.id}, format="json")
+                self.assertEqual(response.status_code, 400, url)
+                self.assertIn("conversation", response.data)
+            get_llm.assert_not_called()
+
+        self.assertEqual(Message.objects.count(), 5)
+        self.assertFalse(Conversation.objects.filter(user=other).exists())
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, "")
+
+
+# ---- Conversation list tests
+class ConversationListTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create_user(
+            email="sidebar@example.com", first_name="Side", last_name="Bar", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_conversations(self, count):
+        for i in range(count):
+            conversation = Conversation.objects.create(user=self.user, title=f"Chat {i}")
+            Message.objects.bulk_create([
+                Message(conversation=conversation, sender="user", content=f"Question {i}"),
+                Message(conversation=conversation, sender="assistant", content=f"Answer {i}"),
+            ])
+
+    def test_list_returns_summary_without_nested_messages(self):
+        self.add_conversations(1)
+        response = self.client.get("/aiassistant/conversations/")
+
+        item = response.data["results"][0]
+        self.assertNotIn("messages", item)
+        self.assertEqual(item["message_count"], 2)
+        self.assertEqual(item["last_message"], "Answer 0")
+
+    def test_query_count_is_constant(self):
+        # One query for the ETag marker, one for the page
+        self.add_conversations(2)
+        with self.assertNumQueries(2):
+            self.client.get("/aiassistant/conversations/")
+
+        self.add_conversations(15)
+        with self.assertNumQueries(2):
+            response = self.client.get("/aiassistant/conversations/")
+        self.assertEqual(len(response.data["results"]), 17)
+
+    def test_detail_keeps_nested_messages(self):
+        self.add_conversations(1)
+        conversation = Conversation.objects.get(user=self.user)
+        response = self.client.get(f"/aiassistant/conversations/{conversation.id}/")
+        self.assertEqual(len(response.data["messages"]), 2)
+
+    def test_create_returns_new_conversation(self):
+        response = self.client.post("/aiassistant/conversations/", {}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Conversation.objects.filter(id=response.data["id"], user=self.user).exists())
+
+
+# ---- Prompt list tests
+class PromptListTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create_user(
+            email="prompts@example.com", first_name="Prompt", last_name="List", password="pass12345"
+        )
+        self.other = UserAccount.objects.create_user(
+            email="other-prompts@example.com", first_name="Other", last_name="User", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_prompt(self, user=None, days_ago=0, **fields):
+        prompt = Prompt.objects.create(user=user or self.user, input_text="x" * 2000, output_text="y" * 2000, **fields)
+        Prompt.objects.filter(id=prompt.id).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return prompt
+
+    def test_list_is_scoped_to_user_and_leaves_out_bodies(self):
+        mine = self.add_prompt(title="Mine")
+        self.add_prompt(user=self.other, title="Theirs")
+        response = self.client.get("/aiassistant/prompts/")
+
+        self.assertEqual([item["id"] for item in response.data["results"]], [mine.id])
+        item = response.data["results"][0]
+        self.assertNotIn("input_text", item)
+        self.assertNotIn("output_text", item)
+        self.assertEqual(len(item["input_preview"]), 120)
+
+    def test_keyset_pages_newest_first_in_one_query(self):
+        prompts = [self.add_prompt(days_ago=i) for i in range(5)]
+        with self.assertNumQueries(1):
+            response = self.client.get("/aiassistant/prompts/?page_size=3")
+        self.assertEqual([item["id"] for item in response.data["results"]], [p.id for p in prompts[:3]])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual([item["id"] for item in response.data["results"]], [p.id for p in prompts[3:]])
+        self.assertIsNone(response.data["next"])
+
+    def test_filters_by_model_and_date_range(self):
+        recent = self.add_prompt(days_ago=1, model_used="granite")
+        self.add_prompt(days_ago=1, model_used="fastai")
+        self.add_prompt(days_ago=10, model_used="granite")
+        since = (timezone.now() - timedelta(days=3)).date().isoformat()
+
+        response = self.client.get(f"/aiassistant/prompts/?model_used=granite&created_after={since}")
+        self.assertEqual([item["id"] for item in response.data["results"]], [recent.id])
+
+        response = self.client.get(f"/aiassistant/prompts/?created_before={since}")
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_invalid_date_is_rejected(self):
+        response = self.client.get("/aiassistant/prompts/?created_after=yesterday")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("created_after", response.data)
+
+    def test_detail_returns_bodies_for_owner_only(self):
+        mine = self.add_prompt()
+        theirs = self.add_prompt(user=self.other)
+
+        response = self.client.get(f"/aiassistant/prompts/{mine.id}/")
+        self.assertEqual(len(response.data["input_text"]), 2000)
+        self.assertEqual(self.client.get(f"/aiassistant/prompts/{theirs.id}/").status_code, 404)
+
+    def test_create_assigns_requesting_user(self):
+        response = self.client.post(
+            "/aiassistant/prompts/", {"input_text": "Hello", "user": self.other.id}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Prompt.objects.get(id=response.data["id"]).user, self.user)
+
+
+# ---- Conditional GET tests
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user(email="poll@example.com", first_name="P", last_name="U")
+        self.conversation = Conversation.objects.create(user=self.user)
+        Message.objects.create(conversation=self.conversation, sender="user", content="Hi")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.urls = [
+            f"/aiassistant/conversations/{self.conversation.id}/latest-message/",
+            f"/aiassistant/messages/all/?conversation={self.conversation.id}",
+            "/aiassistant/conversations/",
+        ]
+
+    def test_unchanged_poll_gets_304_from_one_query(self):
+        for url in self.urls:
+            etag = self.client.get(url)["ETag"]
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response["ETag"], etag)
+
+    def test_new_message_changes_every_etag(self):
+        etags = [self.client.get(url)["ETag"] for url in self.urls]
+        with mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["Hello."])):
+            self.client.post("/aiassistant/messages/", {"content": "More?", "conversation": self.conversation.id}, format="json")
+
+        for url, etag in zip(self.urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response["ETag"], etag)
+
+    def test_job_status_change_invalidates_latest_message(self):
+        url = self.urls[0]
+        GenerationJob.objects.create(
+            conversation=self.conversation, user_message=self.conversation.messages.get(), prompt="Hi"
+        )
+        etag = self.client.get(url)["ETag"]
+        GenerationJob.objects.update(status=GenerationJob.STATUS_RUNNING)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_other_users_conversation_is_not_found(self):
+        other = UserAccount.objects.create_user(email="other@example.com", first_name="O", last_name="U")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.urls[0]).status_code, 404)
+
+
+# ---- Conversation counter tests
+class ConversationCounterTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create_user(
+            email="counter@example.com", first_name="Count", last_name="User", password="pass12345"
+        )
+        self.conversation = Conversation.objects.create(user=self.user)
+
+    def test_counters_follow_inserts(self):
+        Message.objects.create(conversation=self.conversation, sender="user", content="Hi")
+        reply = Message.objects.create(conversation=self.conversation, sender="assistant", content="Hello")
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.user_message_count, 1)
+        self.assertEqual(self.conversation.last_message_at, reply.created_at)
+
+    def test_limit_check_does_not_count_rows(self):
+        Message.objects.create(conversation=self.conversation, sender="user", content="Hi")
+        # FK check from full_clean(), then INSERT + counter UPDATE in a savepoint; no COUNT(*)
+        with self.assertNumQueries(5):
+            Message.objects.create(conversation=self.conversation, sender="user", content="Again")
+
+    def test_limit_is_enforced_even_with_a_stale_counter(self):
+        Conversation.objects.filter(pk=self.conversation.pk).update(
+            user_message_count=Message.MAX_MESSAGES_PER_CONVERSATION
+        )
+        stale = Message(conversation=self.conversation, sender="user", content="One too many")
+
+        with self.assertRaises(ValidationError):
+            stale.save()
+        self.assertFalse(Message.objects.filter(content="One too many").exists())
+
+    def test_message_losing_the_last_slot_race_goes_to_a_new_conversation(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        real_update = QuerySet.update
+        raced = []
+
+        def update(queryset, **changes):
+            # The first user-counter update matches zero rows, as if a concurrent message took the slot
+            if "user_message_count" in changes and not raced:
+                raced.append(True)
+                return 0
+            return real_update(queryset, **changes)
+
+        with mock.patch.object(QuerySet, "update", autospec=True, side_effect=update), \
+                mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["Hello."])):
+            response = client.post(
+                "/aiassistant/messages/", {"content": "Last one?", "conversation": self.conversation.id}, format="json"
+            )
+
+        self.assertEqual(response.status_code, 201)
+        moved = Message.objects.get(content="Last one?")
+        self.assertNotEqual(moved.conversation_id, self.conversation.id)
+        self.assertEqual(moved.conversation.user_message_count, 1)
+        self.assertFalse(Message.objects.filter(conversation=self.conversation).exists())
+
+
+# ---- Metrics tests
+@override_settings(METRICS_TOKEN="scrape-secret")
+class MetricsTests(TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram("latency_seconds", "Latency.", ["route"], buckets=(0.1, 1))
+        histogram.observe(0.05, route="a")
+        histogram.observe(0.5, route="a")
+
+        lines = histogram.render()
+        self.assertIn('latency_seconds_bucket{route="a",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{route="a",le="+Inf"} 2', lines)
+        self.assertIn('latency_seconds_count{route="a"} 2', lines)
+
+    def test_endpoint_exposes_request_and_llm_metrics(self):
+        user = UserAccount.objects.create_user(email="metrics@example.com", first_name="M", last_name="U")
+        client = APIClient()
+        client.force_authenticate(user)
+        client.get("/aiassistant/conversations/")
+        with mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["Fine."])):
+            generate_reply("prompt")
+
+        body = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer scrape-secret").content.decode()
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="aiassistant/conversations/",status="200"}', body)
+        self.assertIn('db_queries_per_request_count{route="aiassistant/conversations/"}', body)
+        self.assertIn('llm_call_duration_seconds_count{model="ibm/granite-3-3-8b-instruct",mode="invoke"}', body)
+        self.assertIn("generation_jobs{", body)
+
+    def test_endpoint_needs_token_or_staff(self):
+        # Requests through the local reverse proxy all come from 127.0.0.1
+        self.assertEqual(self.client.get("/metrics/", REMOTE_ADDR="127.0.0.1").status_code, 403)
+        self.assertEqual(self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+        staff = UserAccount.objects.create_user(email="ops-metrics@example.com", first_name="O", last_name="M")
+        staff.is_staff = True
+        staff.save(update_fields=["is_staff"])
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get("/metrics/").status_code, 200)
+
+
+# ---- Health probe tests
+class HealthProbeTests(TestCase):
+    def test_liveness_and_readiness(self):
+        self.assertEqual(self.client.get("/healthz/").json(), {"status": "ok"})
+        self.assertEqual(self.client.get("/readyz/").json(), {"status": "ok"})
+
+    def test_readiness_fails_without_database(self):
+        with mock.patch("fastai.views.connections") as connections:
+            connections.__getitem__.return_value.cursor.side_effect = Exception("db.internal:5432 user app refused")
+            with self.assertLogs("fastai.views", "ERROR"):
+                response = self.client.get("/readyz/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"status": "unavailable"})
+
+
+# ---- Fake LLM tests
+class FakeLLMTests(SimpleTestCase):
+    def test_streams_configured_reply(self):
+        llm = FakeLLM(reply="Drink more water.")
+        self.assertEqual("".join(llm.stream("prompt")).strip(), "Drink more water.")
+        self.assertEqual(llm.invoke("prompt"), "Drink more water.")
+
+    def test_failures_are_reproducible(self):
+        outcomes = []
+        for _ in range(2):
+            llm = FakeLLM(failure_rate=0.5, seed=7)
+            run = []
+            for _ in range(20):
+                try:
+                    llm.invoke("prompt")
+                    run.append(True)
+                except FakeLLMError:
+                    run.append(False)
+            outcomes.append(run)
+        self.assertEqual(outcomes[0], outcomes[1])
+        self.assertIn(False, outcomes[0])
+
+    @override_settings(LLM_BACKEND="fake")
+    def test_get_llm_returns_fake_backend(self):
+        self.assertIsInstance(get_llm(), FakeLLM)
+        self.assertIs(get_llm(), get_llm())
+
+
+# ---- Admission control tests
+class ConcurrencyLimiterTests(SimpleTestCase):
+    def test_rejects_when_queue_is_full(self):
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=0, timeout=1)
+        slot = limiter.acquire()
+        with self.assertRaises(Saturated) as raised:
+            limiter.acquire()
+        self.assertGreaterEqual(raised.exception.wait, 1)
+
+        slot.release()
+        slot.release()  # releasing twice is harmless
+        limiter.acquire().release()
+        self.assertEqual(limiter.stats()["rejected_queue_full"], 1)
+        self.assertEqual(limiter.stats()["in_flight"], 0)
+
+    def test_waiter_gets_released_slot_or_times_out(self):
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1, timeout=0.05)
+        slot = limiter.acquire()
+        with self.assertRaises(Saturated):
+            limiter.acquire()
+        self.assertEqual(limiter.stats()["rejected_timeout"], 1)
+
+        limiter.timeout = 5
+        threading.Timer(0.05, slot.release).start()
+        limiter.acquire().release()
+        self.assertEqual(limiter.stats()["queued"], 2)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False, USER_MESSAGE_BURST=2, USER_MESSAGES_PER_MINUTE=6)
+class AdmissionViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user(email="busy@example.com", first_name="B", last_name="U")
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, path="/aiassistant/messages/"):
+        with mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["Ok."])):
+            return self.client.post(path, {"content": "Hello?", "conversation": self.conversation.id}, format="json")
+
+    def test_user_over_rate_gets_429_with_retry_after(self):
+        self.assertEqual(self.post().status_code, 201)
+        self.assertEqual(self.post().status_code, 201)
+
+        response = self.post()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "10")
+        self.assertEqual(Message.objects.filter(sender="user").count(), 2)
+
+    def test_saturated_llm_returns_429_without_saving(self):
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=0, timeout=1)
+        slot = limiter.acquire()
+        with mock.patch("aiassistant.admission.get_limiter", return_value=limiter):
+            response = self.post()
+            self.assertEqual(response.status_code, 429)
+            self.assertIn("Retry-After", response)
+            self.assertFalse(Message.objects.exists())
+
+            slot.release()
+            response = self.post("/aiassistant/messages/stream/")
+            stream = iter(response.streaming_content)
+            next(stream)
+            self.assertEqual(limiter.stats()["in_flight"], 1)  # held while streaming
+            list(stream)
+            self.assertEqual(limiter.stats()["in_flight"], 0)
+
+
+# ---- Micro-batching tests
+class BatchDispatcherTests(SimpleTestCase):
+    def test_concurrent_prompts_share_one_generate_call(self):
+        llm = FakeLLM(reply="Rest well.")
+        dispatcher = BatchDispatcher(window=0.2, max_batch=4, llm_factory=lambda: llm)
+
+        futures = [dispatcher.submit(f"Question {i}") for i in range(4)]
+        self.assertEqual([future.result(5) for future in futures], ["Rest well."] * 4)
+        self.assertEqual(llm.calls, 1)
+
+    def test_failed_batch_fails_every_prompt(self):
+        llm = FakeLLM(failure_rate=1)
+        dispatcher = BatchDispatcher(window=0.2, max_batch=2, llm_factory=lambda: llm)
+
+        futures = [dispatcher.submit("a"), dispatcher.submit("b")]
+        for future in futures:
+            with self.assertRaises(FakeLLMError):
+                future.result(5)
+
+
+# ---- WebSocket push tests
+class WebsocketCommunicator(ApplicationCommunicator):
+    """Minimal WebSocket test client (channels.testing needs daphne, which we do not ship)."""
+
+    def __init__(self, application, path, headers=(), subprotocols=None):
+        super().__init__(application, {
+            "type": "websocket", "path": path, "query_string": b"", "headers": list(headers),
+            "subprotocols": subprotocols or [],
+        })
+
+    async def connect(self, timeout=1):
+        await self.send_input({"type": "websocket.connect"})
+        response = await self.receive_output(timeout)
+        if response["type"] == "websocket.close":
+            return False, response.get("code", 1000)
+        return True, response.get("subprotocol")
+
+    async def send_json_to(self, data):
+        await self.send_input({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive_json_from(self, timeout=1):
+        return json.loads((await self.receive_output(timeout))["text"])
+
+    async def disconnect(self, code=1000):
+        await self.send_input({"type": "websocket.disconnect", "code": code})
+        await self.wait(1)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class ConversationSocketTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user(email="socket@example.com", first_name="S", last_name="U")
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.token = str(AccessToken.for_user(self.user))
+
+    def connect(self, subprotocols=None, headers=()):
+        from fastai.asgi import application
+
+        return WebsocketCommunicator(
+            application, "/ws/aiassistant/", headers=[(b"host", b"localhost"), *headers], subprotocols=subprotocols
+        )
+
+    def test_rejects_missing_or_bad_token(self):
+        async def run():
+            for communicator in (self.connect(), self.connect(["bearer", "not-a-token"])):
+                connected, code = await communicator.connect()
+                self.assertFalse(connected)
+                self.assertEqual(code, 4401)
+
+        async_to_sync(run)()
+
+    def test_subscriber_gets_saved_reply(self):
+        async def run():
+            communicator = self.connect(["bearer", self.token])
+            connected, subprotocol = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual(subprotocol, "bearer")
+
+            await communicator.send_json_to({"action": "subscribe", "conversation": self.conversation.id})
+            self.assertEqual((await communicator.receive_json_from())["type"], "subscribed")
+
+            await sync_to_async(save_ai_message)(self.conversation.id, "Sleep well.")
+            event = await communicator.receive_json_from()
+            self.assertEqual(event["type"], "message")
+            self.assertEqual(event["message"]["content"], "Sleep well.")
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+    def test_cannot_subscribe_to_someone_elses_conversation(self):
+        other = UserAccount.objects.create_user(email="nosy@example.com", first_name="N", last_name="U")
+        token = str(AccessToken.for_user(other))
+
+        async def run():
+            communicator = self.connect(headers=[(b"authorization", f"Bearer {token}".encode())])
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_json_to({"action": "subscribe", "conversation": self.conversation.id})
+            self.assertEqual((await communicator.receive_json_from())["type"], "error")
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+
+# ---- Retention and archive tests
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.archive_dir, ignore_errors=True))
+        settings_override = override_settings(ARCHIVE_DIR=self.archive_dir, MESSAGE_RETENTION_DAYS=30)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = UserAccount.objects.create_user(email="archive@example.com", first_name="A", last_name="R")
+        self.other = UserAccount.objects.create_user(email="other-archive@example.com", first_name="O", last_name="R")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def conversation(self, days_ago, user=None, turns=2):
+        conversation = Conversation.objects.create(user=user or self.user, title=f"{days_ago} days ago")
+        for i in range(turns):
+            message = Message.objects.create(conversation=conversation, sender="user", content=f"Question {i}")
+            Message.objects.create(conversation=conversation, sender="assistant", content=f"Answer {i}")
+            GenerationJob.objects.create(conversation=conversation, user_message=message, prompt="p")
+        # Age the whole conversation
+        then = timezone.now() - timedelta(days=days_ago)
+        Message.objects.filter(conversation=conversation).update(created_at=then)
+        Conversation.objects.filter(pk=conversation.pk).update(created_at=then, last_message_at=then)
+        conversation.refresh_from_db()
+        return conversation
+
+    def test_only_idle_conversations_are_archived(self):
+        old, recent = self.conversation(90), self.conversation(1)
+
+        call_command("archive_conversations", stdout=io.StringIO())
+
+        self.assertFalse(Conversation.objects.filter(pk=old.pk).exists())
+        self.assertFalse(Message.objects.filter(conversation_id=old.pk).exists())
+        self.assertFalse(GenerationJob.objects.filter(conversation_id=old.pk).exists())
+        self.assertTrue(Conversation.objects.filter(pk=recent.pk).exists())
+
+        archived = ArchivedConversation.objects.get(conversation_id=old.pk)
+        self.assertEqual(archived.message_count, 4)
+        with gzip.open(Path(self.archive_dir) / archived.archive_file, "rt") as archive:
+            record = json.loads(archive.readline())
+        self.assertEqual(record["id"], old.pk)
+        self.assertEqual([m["content"] for m in record["messages"]][:2], ["Question 0", "Answer 0"])
+
+    def test_batches_write_one_file_each(self):
+        for _ in range(3):
+            self.conversation(60)
+
+        call_command("archive_conversations", batch_size=2, stdout=io.StringIO())
+
+        files = set(ArchivedConversation.objects.values_list("archive_file", flat=True))
+        self.assertEqual(ArchivedConversation.objects.count(), 3)
+        self.assertEqual(len(files), 2)
+
+    def test_conversation_active_again_is_skipped(self):
+        conversation = self.conversation(90)
+        Conversation.objects.filter(pk=conversation.pk).update(last_message_at=timezone.now())
+
+        self.assertEqual(archive_batch([conversation.pk], retention_cutoff()), 0)
+        self.assertTrue(Conversation.objects.filter(pk=conversation.pk).exists())
+
+    def test_restore_keeps_ids_timestamps_and_counters(self):
+        conversation = self.conversation(90)
+        messages = list(Message.objects.filter(conversation=conversation).order_by("id").values_list(
+            "id", "sender", "content", "created_at"
+        ))
+        archive_batch([conversation.pk], retention_cutoff())
+
+        restored = restore_conversation(ArchivedConversation.objects.get(conversation_id=conversation.pk))
+
+        self.assertEqual(restored.pk, conversation.pk)
+        restored.refresh_from_db()
+        self.assertEqual(restored.created_at, conversation.created_at)
+        self.assertEqual(restored.user_message_count, 2)
+        self.assertEqual(list(Message.objects.filter(conversation=restored).order_by("id").values_list(
+            "id", "sender", "content", "created_at"
+        )), messages)
+        self.assertFalse(ArchivedConversation.objects.exists())
+
+    def test_archived_list_and_restore_endpoints(self):
+        mine, theirs = self.conversation(90), self.conversation(90, user=self.other)
+        archive_batch([mine.pk, theirs.pk], retention_cutoff())
+
+        response = self.client.get("/aiassistant/conversations/archived/")
+        self.assertEqual([row["id"] for row in response.json()["results"]], [mine.pk])
+
+        self.assertEqual(self.client.post(f"/aiassistant/conversations/archived/{theirs.pk}/restore/").status_code, 404)
+        response = self.client.post(f"/aiassistant/conversations/archived/{mine.pk}/restore/")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["messages"]), 4)
+
+        response = self.client.get(f"/aiassistant/messages/all/?conversation={mine.pk}")
+        self.assertEqual(len(response.json()["results"]), 4)
+        self.assertEqual(self.client.post(f"/aiassistant/conversations/archived/{mine.pk}/restore/").status_code, 404)
+
+
+class PartitionHelperTests(SimpleTestCase):
+    def test_month_arithmetic_and_names(self):
+        self.assertEqual(add_months(date(2026, 11, 1), 3), date(2027, 2, 1))
+        self.assertEqual(add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+        self.assertEqual(list(months_between(date(2026, 11, 15), date(2027, 1, 1))),
+                         [date(2026, 11, 1), date(2026, 12, 1), date(2027, 1, 1)])
+        self.assertEqual(partition_name(date(2026, 3, 1)), "aiassistant_message_y2026m03")
+
+    def test_month_start_uses_utc(self):
+        late = timezone.datetime(2026, 10, 31, 23, 30, tzinfo=ZoneInfo("America/New_York"))
+        self.assertEqual(month_start(late), date(2026, 11, 1))
+
+
+# ---- Migration tests (PostgreSQL only: on other databases these migrations do nothing)
+@skipUnless(connection.vendor == "postgresql", "runs the PostgreSQL-only DDL of migrations 0007/0008")
+class PostgresMigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        """Migrate aiassistant to ``target`` and return that state's models."""
+        executor = MigrationExecutor(connection)
+        executor.migrate([("aiassistant", target)])
+        return MigrationExecutor(connection).loader.project_state(("aiassistant", target)).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def message_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, conversation_id, content, created_at FROM "aiassistant_message" ORDER BY id')
+            return cursor.fetchall()
+
+    def test_partition_messages_forwards_and_backwards_keeps_rows(self):
+        apps = self.migrate("0006_message_retention")
+        user = UserAccount.objects.create_user(email="partition@example.com", first_name="P", last_name="M")
+        conversation = apps.get_model("aiassistant", "Conversation").objects.create(user_id=user.pk)
+        Message = apps.get_model("aiassistant", "Message")
+        now = timezone.now()
+        months = [now - timedelta(days=days) for days in (400, 150, 0)]
+        for i, created_at in enumerate(months):
+            Message.objects.create(conversation=conversation, sender="user", content=f"row {i}", created_at=created_at)
+        rows = self.message_rows()
+
+        apps = self.migrate("0007_partition_messages")
+        self.assertTrue(is_partitioned(connection))
+        partitions = list_partitions(connection)
+        self.assertEqual(min(partitions), month_start(months[0]))
+        self.assertEqual(max(partitions), add_months(month_start(now), 3))
+        self.assertEqual(self.message_rows(), rows)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM "{partition_name(month_start(months[0]))}"')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        # New rows get ids after the copied ones from the new sequence
+        Message = apps.get_model("aiassistant", "Message")
+        added = Message.objects.create(conversation_id=conversation.pk, sender="user", content="after")
+        self.assertGreater(added.pk, rows[-1][0])
+        rows = self.message_rows()
+
+        apps = self.migrate("0006_message_retention")
+        self.assertFalse(is_partitioned(connection))
+        self.assertEqual(self.message_rows(), rows)
+        Message = apps.get_model("aiassistant", "Message")
+        added = Message.objects.create(conversation_id=conversation.pk, sender="user", content="unpartitioned")
+        self.assertGreater(added.pk, rows[-1][0])
+        with self.assertRaises(IntegrityError), transaction.atomic():   # the foreign key is back (checked at commit)
+            Message.objects.create(conversation_id=conversation.pk + 1000, sender="user", content="orphan")
+
+    def search_vector_columns(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_name FROM information_schema.columns WHERE column_name = 'search_vector' ORDER BY 1"
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_search_index_forwards_and_backwards(self):
+        apps = self.migrate("0007_partition_messages")
+        user = UserAccount.objects.create_user(email="fts@example.com", first_name="F", last_name="T")
+        conversation = apps.get_model("aiassistant", "Conversation").objects.create(user_id=user.pk)
+        apps.get_model("aiassistant", "Message").objects.create(
+            conversation_id=conversation.pk, sender="user", content="Running a fever since Monday",
+        )
+        apps.get_model("aiassistant", "Prompt").objects.create(user_id=user.pk, title="Fevers", input_text="Kids")
+
+        self.migrate("0008_search_index")
+        self.assertEqual(self.search_vector_columns(), ["aiassistant_message", "aiassistant_prompt"])
+        with connection.cursor() as cursor:
+            # Existing rows are indexed, stemmed with the 'english' config the migration froze
+            for table in ("aiassistant_message", "aiassistant_prompt"):
+                cursor.execute(f"SELECT count(*) FROM {table} WHERE search_vector @@ to_tsquery('english', 'fevers')")
+                self.assertEqual(cursor.fetchone()[0], 1, table)
+
+        self.migrate("0007_partition_messages")
+        self.assertEqual(self.search_vector_columns(), [])
+
+
+# ---- Export tests
+class ConversationExportTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create_user(email="export@example.com", first_name="E", last_name="X")
+        other = UserAccount.objects.create_user(email="other-export@example.com", first_name="O", last_name="X")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.first = Conversation.objects.create(user=self.user, title="First")
+        Message.objects.create(conversation=self.first, sender="user", content='Say "hi",\nplease')
+        Message.objects.create(conversation=self.first, sender="assistant", content="Hi")
+        self.empty = Conversation.objects.create(user=self.user, title="Empty")
+        Message.objects.create(conversation=Conversation.objects.create(user=other), sender="user", content="Not mine")
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_ndjson_has_one_line_per_conversation(self):
+        lines = self.download("/aiassistant/conversations/export.ndjson").decode().splitlines()
+
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([r["id"] for r in records], [self.first.id, self.empty.id])
+        self.assertEqual([m["content"] for m in records[0]["messages"]], ['Say "hi",\nplease', "Hi"])
+        self.assertEqual(records[1]["messages"], [])
+
+    def test_csv_has_one_row_per_message(self):
+        body = self.download("/aiassistant/conversations/export.csv").decode()
+
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["content"], 'Say "hi",\nplease')
+        self.assertEqual(rows[2]["conversation_title"], "Empty")
+        self.assertEqual(rows[2]["message_id"], "")
+
+    def test_csv_neutralizes_formulas(self):
+        Conversation.objects.filter(pk=self.empty.pk).update(title="=HYPERLINK(\"http://evil\")")
+        Message.objects.create(conversation=self.first, sender="user", content="+1 for this")
+        Message.objects.create(conversation=self.first, sender="user", content="-2 degrees, then @cmd|'/c calc'!A0")
+        body = self.download("/aiassistant/conversations/export.csv").decode()
+
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([row["content"] for row in rows[2:4]], ["'+1 for this", "'-2 degrees, then @cmd|'/c calc'!A0"])
+        self.assertEqual(rows[4]["conversation_title"], "'=HYPERLINK(\"http://evil\")")
+        self.assertEqual(rows[0]["content"], 'Say "hi",\nplease')   # other text is unchanged
+
+    def test_gzip_and_unknown_format(self):
+        response = self.client.get("/aiassistant/conversations/export.ndjson?gzip=1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('.ndjson.gz"', response["Content-Disposition"])
+        body = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(len(body.splitlines()), 2)
+
+        self.assertEqual(self.client.get("/aiassistant/conversations/export.xml").status_code, 404)
+
+    def test_rows_are_read_in_chunks(self):
+        with mock.patch("django.db.models.query.QuerySet.iterator", autospec=True,
+                        side_effect=lambda qs, chunk_size=None: iter(list(qs))) as iterator:
+            self.download("/aiassistant/conversations/export.ndjson")
+        self.assertEqual(iterator.call_args.kwargs["chunk_size"], 2000)
+
+
+# ---- Image pipeline tests
+def phone_photo(width=2400, height=1800, orientation=None, color=(200, 80, 40)):
+    """A JPEG as a phone camera stores it, optionally with an EXIF orientation."""
+    image = Image.new("RGB", (width, height), color)
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90, exif=exif)
+    return SimpleUploadedFile("IMG_0001.JPG", out.getvalue(), content_type="image/jpeg")
+
+
+@override_settings(IMAGE_QUEUE="db", IMAGE_DISPLAY_SIZE=1280, IMAGE_THUMB_SIZE=256)
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.media_root, ignore_errors=True))
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = UserAccount.objects.create_user(email="images@example.com", first_name="I", last_name="P")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, photo, **fields):
+        return self.client.post("/aiassistant/prompts/", {"input_text": "What is this rash?", "image": photo, **fields})
+
+    def test_upload_is_stored_by_hash_and_queued(self):
+        response = self.upload(phone_photo())
+        self.assertEqual(response.status_code, 201)
+
+        asset = ImageAsset.objects.get()
+        self.assertEqual(asset.status, ImageAsset.STATUS_QUEUED)
+        self.assertEqual(Prompt.objects.get().image.name, f"images/{asset.sha256[:2]}/{asset.sha256}.jpg")
+        self.assertTrue(default_storage.exists(asset.original.name))
+        variants = response.data["image_variants"]
+        self.assertEqual(variants, {"status": "queued", "width": None, "height": None})
+        self.assertNotIn("image", response.data)   # the original keeps its EXIF; only variants are linked
+
+    def test_same_bytes_share_one_asset(self):
+        photo = phone_photo()
+        self.upload(photo)
+        photo.seek(0)
+        self.upload(SimpleUploadedFile("copy.jpg", photo.read(), content_type="image/jpeg"))
+        self.upload(phone_photo(color=(10, 10, 10)))
+
+        self.assertEqual(Prompt.objects.count(), 3)
+        self.assertEqual(ImageAsset.objects.count(), 2)
+        self.assertEqual(len(os.listdir(Path(self.media_root) / "images" / ImageAsset.objects.first().sha256[:2])), 1)
+
+    def test_worker_builds_rotated_webp_variants(self):
+        self.upload(phone_photo(orientation=6))   # stored landscape, shown portrait
+        asset = process_next_image()
+
+        self.assertEqual(asset.status, ImageAsset.STATUS_READY)
+        self.assertEqual((asset.width, asset.height), (1800, 2400))
+        for variant, side in (("display", 1280), ("thumb", 256)):
+            info = asset.variants[variant]
+            with default_storage.open(info["name"]) as stored, Image.open(stored) as image:
+                self.assertEqual(image.format, "WEBP")
+                self.assertEqual(image.size, (info["width"], info["height"]))
+                self.assertEqual(image.height, side)
+                self.assertLess(image.width, image.height)
+        self.assertIsNone(process_next_image())
+
+    def test_list_returns_variant_urls_in_one_query(self):
+        self.upload(phone_photo())
+        self.upload(phone_photo(color=(0, 0, 255)))
+        process_next_image()
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/aiassistant/prompts/")
+        queued, ready = sorted((item["image_variants"] for item in response.data["results"]), key=lambda v: v["status"])
+        self.assertTrue(ready["thumb"].startswith("http://testserver/media/images/"))
+        self.assertTrue(ready["thumb"].endswith("-thumb.webp"))
+        self.assertNotIn("thumb", queued)
+
+    def test_unreadable_original_fails_the_asset(self):
+        asset = store_image(SimpleUploadedFile("broken.jpg", b"not really a jpeg"))
+        self.assertEqual(process_next_image().status, ImageAsset.STATUS_FAILED)
+        asset.refresh_from_db()
+        self.assertTrue(asset.error)
+        self.assertEqual(asset.variants, {})
+
+    def test_failed_asset_is_queued_again_on_next_upload(self):
+        asset = store_image(SimpleUploadedFile("photo.jpg", phone_photo().read()))
+        with mock.patch("aiassistant.images.default_storage.open", side_effect=OSError("storage hiccup")), \
+                self.assertLogs("aiassistant.images", "ERROR"):
+            self.assertEqual(process_next_image().status, ImageAsset.STATUS_FAILED)
+
+        self.assertEqual(self.upload(phone_photo()).data["image_variants"]["status"], "queued")
+        self.assertEqual(process_next_image().status, ImageAsset.STATUS_READY)
+        asset.refresh_from_db()
+        self.assertEqual((asset.attempts, asset.error), (2, ""))
+
+    def test_message_upload_sets_its_asset(self):
+        conversation = Conversation.objects.create(user=self.user)
+        with mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["Looks fine."])):
+            response = self.client.post(
+                "/aiassistant/messages/", {"content": "Is this healing?", "conversation": conversation.id, "image": phone_photo()},
+            )
+        self.assertEqual(response.status_code, 201)
+
+        message = Message.objects.get(sender="user")
+        self.assertEqual(message.image_asset, ImageAsset.objects.get())
+        self.assertEqual(message.image.name, message.image_asset.original.name)
+        process_next_image()
+        variants = self.client.get(f"/aiassistant/conversations/{conversation.id}/").data["messages"][0]["image_variants"]
+        self.assertTrue(variants["thumb"].endswith("-thumb.webp"))
+
+    def test_rejects_non_images_and_oversized_uploads(self):
+        response = self.upload(SimpleUploadedFile("notes.jpg", b"plain text", content_type="image/jpeg"))
+        self.assertEqual(response.status_code, 400)
+        with override_settings(IMAGE_MAX_UPLOAD_MB=0):
+            self.assertEqual(self.upload(phone_photo()).status_code, 400)
+        self.assertFalse(ImageAsset.objects.exists())
+
+    @override_settings(IMAGE_QUEUE="inprocess")
+    def test_inprocess_queue_submits_after_commit(self):
+        with mock.patch("aiassistant.images.get_executor") as executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.upload(phone_photo())
+        executor.return_value.submit.assert_called_once_with(mock.ANY, ImageAsset.objects.get().id)
+
+
+# ---- Usage accounting tests
+@override_settings(RESPONSE_CACHE_ENABLED=False, LLM_PRICE_INPUT_PER_1M=2, LLM_PRICE_OUTPUT_PER_1M=10)
+class UsageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user(email="usage@example.com", first_name="U", last_name="S")
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recently = timezone.now() - timedelta(minutes=10)
+
+    def add_calls(self, days_ago=0, count=1, model=MODEL_ID, status=LLMUsage.STATUS_OK, user=None):
+        LLMUsage.objects.bulk_create([
+            LLMUsage(user=user or self.user, conversation_id=self.conversation.id, model=model, mode="invoke",
+                     status=status, prompt_tokens=100, completion_tokens=20, latency_ms=500 + i,
+                     cost_micros=400 if status == LLMUsage.STATUS_OK else 0,
+                     created_at=self.recently - timedelta(days=days_ago))
+            for i in range(count)
+        ])
+
+    def test_reply_records_tokens_latency_and_cost(self):
+        with mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["Drink more water."])):
+            self.client.post("/aiassistant/messages/", {"content": "Tips?", "conversation": self.conversation.id}, format="json")
+
+        call = LLMUsage.objects.get()
+        self.assertEqual((call.user, call.conversation_id), (self.user, self.conversation.id))
+        self.assertEqual((call.model, call.mode, call.status), (MODEL_ID, "invoke", LLMUsage.STATUS_OK))
+        self.assertEqual(call.completion_tokens, count_tokens("Drink more water."))
+        self.assertGreater(call.prompt_tokens, call.completion_tokens)
+        self.assertEqual(call.cost_micros, call.prompt_tokens * 2 + call.completion_tokens * 10)
+
+    def test_cache_hits_and_errors_are_recorded_but_not_billed(self):
+        response_cache = ResponseCache([LocMemLRUBackend()], ttl=60)
+        failing = mock.Mock(invoke=mock.Mock(side_effect=RuntimeError("down")))
+        with mock.patch("aiassistant.services.get_response_cache", return_value=response_cache):
+            with mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["Rest."])):
+                generate_reply("prompt", question="Tired?", conversation=self.conversation)
+                generate_reply("prompt", question="tired", conversation=self.conversation)
+            with mock.patch("aiassistant.services.get_llm", return_value=failing), self.assertRaises(RuntimeError):
+                generate_reply("prompt", conversation=self.conversation)
+
+        calls = list(LLMUsage.objects.order_by("id").values_list("status", "cost_micros"))
+        self.assertEqual([status for status, _ in calls], ["ok", "cached", "error"])
+        self.assertGreater(calls[0][1], 0)
+        self.assertEqual([cost for _, cost in calls[1:]], [0, 0])
+
+    def test_stream_records_one_call(self):
+        with mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["One ", "two."])):
+            response = self.client.post(
+                "/aiassistant/messages/stream/", {"content": "Count", "conversation": self.conversation.id}, format="json"
+            )
+            b"".join(response.streaming_content)
+
+        call = LLMUsage.objects.get()
+        self.assertEqual((call.mode, call.status, call.completion_tokens), ("stream", "ok", count_tokens("One two.")))
+
+    def test_rollup_is_incremental_per_user_day_and_model(self):
+        other = UserAccount.objects.create_user(email="usage-other@example.com", first_name="O", last_name="U")
+        self.add_calls(days_ago=1, count=3)
+        self.add_calls(days_ago=0, count=2)
+        self.add_calls(days_ago=0, model="other-model")
+        self.add_calls(days_ago=0, status=LLMUsage.STATUS_CACHED)
+        self.add_calls(days_ago=0, user=other)
+
+        self.assertEqual(rollup_usage(lag=0), 8)
+        today = UsageRollup.objects.get(user=self.user, day=timezone.localdate(self.recently), model=MODEL_ID)
+        self.assertEqual((today.calls, today.cached_calls, today.prompt_tokens), (3, 1, 200))
+        self.assertEqual(today.latency_ms_max, 501)
+        self.assertEqual(UsageRollup.objects.count(), 4)
+
+        self.add_calls(days_ago=0, count=2)
+        self.add_calls(days_ago=0)
+        LLMUsage.objects.filter(id=LLMUsage.objects.latest("id").id).update(created_at=timezone.now())
+        self.assertEqual(rollup_usage(lag=60), 2)   # the call from just now waits for the next run
+        today.refresh_from_db()
+        self.assertEqual((today.calls, today.prompt_tokens, today.cost_micros), (5, 400, 1600))
+        self.assertEqual(UsageCheckpoint.objects.get().last_id, LLMUsage.objects.latest("id").id - 1)
+        self.assertEqual(rollup_usage(lag=60), 0)
+
+    def test_prune_keeps_calls_not_rolled_up(self):
+        self.add_calls(days_ago=200, count=2)
+        rollup_usage(lag=0)
+        self.add_calls(days_ago=200)
+        self.assertEqual(prune_usage(), 2)
+        self.assertEqual(LLMUsage.objects.count(), 1)
+
+    def test_usage_endpoint_merges_rollups_and_pending_calls(self):
+        self.add_calls(days_ago=1, count=2)
+        self.add_calls(days_ago=40)
+        rollup_usage(lag=0)
+        self.add_calls(days_ago=0, count=3)
+
+        with self.assertNumQueries(3):   # checkpoint, rollups, pending calls
+            response = self.client.get("/aiassistant/usage/?days=7")
+        self.assertEqual(response.data["totals"]["calls"], 5)
+        self.assertEqual(response.data["totals"]["prompt_tokens"], 500)
+        self.assertAlmostEqual(response.data["totals"]["cost"], 0.002)
+        self.assertEqual([row["calls"] for row in response.data["days"]], [3, 2])
+        self.assertEqual(response.data["days"][0]["latency_ms_avg"], 501)
+        self.assertEqual(self.client.get("/aiassistant/usage/?days=0").status_code, 400)
+
+
+# ---- Search tests
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create_user(email="search@example.com", first_name="S", last_name="E")
+        other = UserAccount.objects.create_user(email="other-search@example.com", first_name="O", last_name="E")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.add("user", "How much magnesium should I take for sleeping?")
+        self.add("assistant", "Adults usually need 310-420 mg of magnesium a day. <b>Ask</b> your doctor first.")
+        self.add("user", "What about vitamin D?")
+        Message.objects.create(conversation=Conversation.objects.create(user=other), sender="user", content="magnesium")
+        Prompt.objects.create(user=self.user, title="Magnesium notes", input_text="Foods rich in magnesium")
+        Prompt.objects.create(user=other, title="Magnesium", input_text="magnesium")
+
+    def add(self, sender, content):
+        return Message.objects.create(conversation=self.conversation, sender=sender, content=content)
+
+    def search(self, **params):
+        response = self.client.get("/aiassistant/search/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_results_are_scoped_ranked_and_stemmed(self):
+        results = self.search(q="magnesium sleep")["results"]
+
+        # "sleep" matches "sleeping"; both words are required
+        self.assertEqual([(r["type"], r["label"]) for r in results], [("message", "user")])
+        self.assertEqual(results[0]["conversation"], self.conversation.id)
+
+        kinds = {r["type"] for r in self.search(q="magnesium")["results"]}
+        self.assertEqual(kinds, {"message", "prompt"})
+        self.assertEqual(len(self.search(q="magnesium")["results"]), 3)
+        self.assertEqual(len(self.search(q="magnesium", type="prompt")["results"]), 1)
+
+    def test_highlight_is_escaped_and_marked(self):
+        results = self.search(q="doctor")["results"]
+
+        self.assertIn("<mark>doctor</mark>", results[0]["highlight"])
+        self.assertIn("&lt;b&gt;Ask&lt;/b&gt;", results[0]["highlight"])
+
+    def test_index_follows_updates_and_deletes(self):
+        message = self.add("user", "Is zinc useful?")
+        self.assertEqual(len(self.search(q="zinc")["results"]), 1)
+        Message.objects.filter(pk=message.pk).update(content="Is iron useful?")
+        self.assertEqual(self.search(q="zinc")["results"], [])
+        message.delete()
+        self.assertEqual(self.search(q="iron")["results"], [])
+
+    @override_settings(SEARCH_MAX_CANDIDATES=1)
+    def test_only_newest_candidates_are_ranked(self):
+        newest = self.add("user", "More magnesium questions")
+
+        results = self.search(q="magnesium", type="message")["results"]
+        self.assertEqual([r["id"] for r in results], [newest.id])
+
+    def test_pagination_and_validation(self):
+        first = self.search(q="magnesium", limit=2)
+        self.assertEqual(len(first["results"]), 2)
+        self.assertIn("offset=2", first["next"])
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(len(second["results"]), 1)
+        self.assertIsNone(second["next"])
+
+        self.assertEqual(self.client.get("/aiassistant/search/").status_code, 400)
+        self.assertEqual(self.client.get("/aiassistant/search/", {"q": "x", "type": "user"}).status_code, 400)
+        self.assertEqual(self.search(q='"-:*')["results"], [])  # no FTS syntax errors from user input
+
+
+# ---- Timeouts, retries, hedging and circuit breaker tests
+class ResilienceTests(TestCase):
+    def setUp(self):
+        cache.clear()  # fresh rate-limit buckets
+
+    def guard(self, **options):
+        defaults = dict(deadline=2, attempt_timeout=0.5, max_retries=2, base_delay=0.001, max_delay=0.005,
+                        hedge_percentile=0, breaker=CircuitBreaker(3, reset_timeout=0.1), threads=4)
+        return Guard(**{**defaults, **options})
+
+    def test_transient_errors_are_retried_and_fatal_ones_are_not(self):
+        guard = self.guard()
+        llm = FakeLLM(reply="Rest.", faults=["error", "error"])
+        self.assertEqual(guard.call(lambda: llm.invoke("prompt")), "Rest.")
+        self.assertEqual((llm.calls, guard.stats()["retries"]), (3, 2))
+
+        llm.faults = ["fatal", None]
+        with self.assertRaises(ValueError):
+            guard.call(lambda: llm.invoke("prompt"))
+        self.assertEqual(llm.calls, 4)
+
+        llm.faults = ["error"] * 3
+        with self.assertRaises(FakeLLMError):
+            guard.call(lambda: llm.invoke("prompt"))
+        self.assertEqual(guard.stats()["failures"], 1)
+
+    def test_slow_attempt_times_out_and_is_retried(self):
+        guard = self.guard(attempt_timeout=0.05, max_retries=1)
+        llm = FakeLLM(reply="Rest.", faults=["slow"], slow_latency=0.5)
+        started = time.monotonic()
+        self.assertEqual(guard.call(lambda: llm.invoke("prompt")), "Rest.")
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(guard.stats()["timeouts"], 1)
+
+        llm.faults = ["slow", "slow"]
+        with self.assertRaises(DeadlineExceeded):
+            guard.call(lambda: llm.invoke("prompt"))
+
+    def test_hedged_request_wins_over_slow_one(self):
+        guard = self.guard(hedge_percentile=90)
+        llm = FakeLLM(reply="Rest.", latency=0.01, slow_latency=0.4)
+        for _ in range(Guard.MIN_HEDGE_SAMPLES):
+            guard.call(lambda: llm.invoke("prompt"))
+        self.assertIsNotNone(guard.stats()["hedge_after_ms"])
+
+        llm.faults = ["slow"]
+        started = time.monotonic()
+        self.assertEqual(guard.call(lambda: llm.invoke("prompt")), "Rest.")
+        self.assertLess(time.monotonic() - started, 0.3)
+        self.assertEqual((guard.stats()["hedges"], guard.stats()["hedge_wins"]), (1, 1))
+
+    def test_breaker_opens_fails_fast_and_recovers(self):
+        guard = self.guard(max_retries=0)
+        llm = FakeLLM(reply="Rest.", faults=["error"] * 3)
+        for _ in range(3):
+            with self.assertRaises(FakeLLMError):
+                guard.call(lambda: llm.invoke("prompt"))
+
+        with self.assertRaises(CircuitOpen) as raised:
+            guard.call(lambda: llm.invoke("prompt"))
+        self.assertGreaterEqual(raised.exception.wait, 1)
+        self.assertEqual(llm.calls, 3)   # refused without calling the backend
+        self.assertEqual(guard.stats()["breaker"]["state"], "open")
+
+        time.sleep(0.12)
+        self.assertEqual(guard.call(lambda: llm.invoke("prompt")), "Rest.")   # the trial call closes it
+        self.assertEqual(guard.stats()["breaker"], {"state": "closed", "consecutive_failures": 0, "opened": 1, "rejected": 1})
+
+    def test_breaker_counts_one_failure_per_call_and_per_batch(self):
+        guard = self.guard(breaker=CircuitBreaker(3, reset_timeout=30))
+        llm = FakeLLM(failure_rate=1)
+        errors = []
+
+        def call(fn, counted=True):
+            try:
+                guard.call(fn, hedge=False, counted=counted)
+            except FakeLLMError as e:
+                errors.append(e)
+
+        callers = [threading.Thread(target=call, args=(lambda: llm.invoke("prompt"),)) for _ in range(2)]
+        for thread in callers:
+            thread.start()
+        for thread in callers:
+            thread.join()
+        self.assertEqual((len(errors), llm.calls, guard.stats()["retries"]), (2, 6, 4))
+        self.assertEqual(guard.stats()["breaker"]["consecutive_failures"], 2)   # not 6
+
+        guard.max_retries = 0
+        dispatcher = BatchDispatcher(window=0.2, max_batch=3, llm_factory=lambda: llm)
+        with mock.patch("aiassistant.resilience._guard", guard):
+            callers = [threading.Thread(target=call, args=(lambda: dispatcher.generate("prompt"), False)) for _ in range(3)]
+            for thread in callers:
+                thread.start()
+            for thread in callers:
+                thread.join()
+        self.assertEqual((len(errors), llm.calls), (5, 7))   # one generate call for the three
+        self.assertEqual(guard.stats()["breaker"]["consecutive_failures"], 3)
+        self.assertEqual(guard.stats()["breaker"]["state"], "open")
+
+    def test_half_open_admits_one_trial_and_gives_it_back_unused(self):
+        breaker = CircuitBreaker(1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        permit = breaker.admit()
+        with self.assertRaises(CircuitOpen):
+            breaker.check()
+        with self.assertRaises(CircuitOpen):
+            breaker.admit()
+
+        permit.release()   # e.g. the request failed validation before calling Watsonx
+        breaker.check()
+        with breaker.admit():
+            pass
+        self.assertEqual(breaker.stats()["state"], "half_open")
+
+    def test_stream_retries_only_before_the_first_chunk(self):
+        guard = self.guard()
+        llm = FakeLLM(reply="One two", faults=["error"])
+        self.assertEqual("".join(guard.stream(lambda: llm.stream("prompt"))), "One two ")
+        self.assertEqual(guard.stats()["retries"], 1)
+
+        broken = FakeStreamingLLM(["One ", "two"], fail_after=1)
+        chunks = []
+        with self.assertRaises(RuntimeError):
+            for chunk in guard.stream(lambda: broken.stream("prompt")):
+                chunks.append(chunk)
+        self.assertEqual((chunks, guard.stats()["retries"]), (["One "], 1))
+
+    def test_open_breaker_returns_503_and_stats_are_exposed(self):
+        user = UserAccount.objects.create_user(email="down@example.com", first_name="D", last_name="O")
+        staff = UserAccount.objects.create_user(email="ops@example.com", first_name="O", last_name="P")
+        staff.is_staff = True
+        staff.save(update_fields=["is_staff"])
+        client = APIClient()
+        client.force_authenticate(user)
+        conversation = Conversation.objects.create(user=user)
+        guard = self.guard(breaker=CircuitBreaker(1, reset_timeout=30))
+        guard.breaker.record_failure()
+
+        with mock.patch("aiassistant.resilience._guard", guard):
+            for path in ("/aiassistant/messages/", "/aiassistant/messages/stream/"):
+                response = client.post(path, {"content": "Hello?", "conversation": conversation.id}, format="json")
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response["Retry-After"], "30")
+            self.assertFalse(Message.objects.exists())
+
+            client.force_authenticate(staff)
+            stats = client.get("/aiassistant/llm/stats/").json()["resilience"]
+        self.assertEqual(stats["breaker"]["state"], "open")
+        self.assertEqual(stats["breaker"]["rejected"], 2)
+
+    def test_failed_call_returns_503_or_504_without_a_reply(self):
+        user = UserAccount.objects.create_user(email="fail@example.com", first_name="F", last_name="A")
+        client = APIClient()
+        client.force_authenticate(user)
+        conversation = Conversation.objects.create(user=user)
+        llm = mock.Mock()
+
+        for error, status_code in ((RuntimeError("token for ibm-host:443 expired"), 503), (DeadlineExceeded(), 504)):
+            llm.invoke.side_effect = error
+            with mock.patch("aiassistant.services.get_llm", return_value=llm), \
+                    override_settings(RESPONSE_CACHE_ENABLED=False), self.assertLogs("aiassistant.views", "ERROR"):
+                response = client.post("/aiassistant/messages/", {"content": "Hello?", "conversation": conversation.id},
+                                       format="json")
+            self.assertEqual(response.status_code, status_code)
+            self.assertNotIn("ibm-host", response.content.decode())
+        self.assertFalse(Message.objects.filter(sender="assistant").exists())
+
+    def test_requests_behind_the_trial_call_get_503_without_saving(self):
+        user = UserAccount.objects.create_user(email="trial@example.com", first_name="T", last_name="R")
+        client = APIClient()
+        client.force_authenticate(user)
+        conversation = Conversation.objects.create(user=user)
+        guard = self.guard(breaker=CircuitBreaker(1, reset_timeout=0.01))
+        guard.breaker.record_failure()
+        time.sleep(0.02)
+        trial = guard.breaker.admit()
+
+        with mock.patch("aiassistant.resilience._guard", guard), \
+                mock.patch("aiassistant.services.get_llm", return_value=FakeStreamingLLM(["Ok."])):
+            for path in ("/aiassistant/messages/", "/aiassistant/messages/stream/"):
+                response = client.post(path, {"content": "Hello?", "conversation": conversation.id}, format="json")
+                self.assertEqual(response.status_code, 503)
+            self.assertFalse(Message.objects.exists())
+
+            trial.release()
+            response = client.post("/aiassistant/messages/", {"content": "Hello?", "conversation": conversation.id}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(guard.stats()["breaker"]["state"], "closed")
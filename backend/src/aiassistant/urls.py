@@ -4,9 +4,18 @@ from . import views
 # ---- URL Path for Views
 urlpatterns = [
     path('conversations/', views.ConversationListCreateView.as_view(), name='conversation-list'),
+    path('conversations/archived/', views.ArchivedConversationListView.as_view(), name='archived-conversation-list'),
+    path('conversations/archived/<int:conversation_id>/restore/', views.ArchivedConversationRestoreView.as_view(), name='archived-conversation-restore'),
+    path('conversations/export.<str:fmt>', views.ConversationExportView.as_view(), name='conversation-export'),
     path('conversations/<int:pk>/', views.ConversationDetailView.as_view(), name='conversation-detail'),
     path("messages/all/", views.MessageListView.as_view(), name="message-list"),
     path('messages/', views.MessageCreateView.as_view(), name='message-create'),
+    path('messages/stream/', views.MessageStreamView.as_view(), name='message-stream'),
+    path('search/', views.SearchView.as_view(), name='search'),
     path('prompts/', views.PromptListCreateView.as_view(), name='prompt-list'),
+    path('prompts/<int:pk>/', views.PromptDetailView.as_view(), name='prompt-detail'),
     path("conversations/<int:conversation_id>/latest-message/", views.LatestMessageView.as_view(), name="latest-message"),
+    path("usage/", views.UsageView.as_view(), name="usage"),
+    path("llm/stats/", views.LLMClientStatsView.as_view(), name="llm-stats"),
+    path("cache/responses/", views.ResponseCacheView.as_view(), name="response-cache"),
 ]
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""
+Per-call LLM usage accounting and its daily rollups.
+
+``record_usage()`` writes one LLMUsage row per LLM call made for a
+conversation (see services.generate_reply / stream_reply): model, mode,
+status (ok, cached or error), token counts, latency and cost. Token counts
+come from the response's usage metadata when the provider returns it, else
+from the word-count estimate in context.py. Only "ok" calls are billed.
+
+``rollup_usage()`` (``manage.py rollup_usage``, every few minutes) folds the
+rows after a checkpoint id into UsageRollup, one row per user, day and model,
+and moves the checkpoint. Rows younger than USAGE_ROLLUP_LAG are left for the
+next run, so a row whose transaction committed after a higher id is not
+skipped. ``usage_by_day()`` reads the rollups plus the rows after the
+checkpoint, so dashboards and quota checks read O(days) rows, not every call.
+"""
+import logging
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .context import count_tokens
+from .models import LLMUsage, UsageCheckpoint, UsageRollup
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = "daily"
+TOTALS = ("calls", "cached_calls", "errors", "prompt_tokens", "completion_tokens", "latency_ms_total", "cost_micros")
+
+
+# ---- Helper function: Tokens of one call
+def token_counts(prompt, response="", raw_response=None):
+    """(prompt, completion) tokens: the provider's usage metadata if any, else estimates."""
+    usage = getattr(raw_response, "usage_metadata", None) or {}
+    return (
+        usage.get("input_tokens") or count_tokens(prompt),
+        usage.get("output_tokens") or count_tokens(response),
+    )
+
+
+def record_usage(conversation, model, mode, status, prompt, response="", raw_response=None, latency=0.0):
+    """Store one call for ``conversation``. Never raises: accounting must not fail a reply."""
+    try:
+        prompt_tokens, completion_tokens = token_counts(prompt, response, raw_response)
+        cost = 0
+        if status == LLMUsage.STATUS_OK:
+            cost = round(prompt_tokens * settings.LLM_PRICE_INPUT_PER_1M
+                         + completion_tokens * settings.LLM_PRICE_OUTPUT_PER_1M)
+        return LLMUsage.objects.create(
+            user_id=conversation.user_id,
+            conversation_id=conversation.id,
+            model=model,
+            mode=mode,
+            status=status,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_ms=round(latency * 1000),
+            cost_micros=cost,
+        )
+    except Exception:
+        logger.exception("Usage recording failed")
+        return None
+
+
+# ---- Helper function: Totals per (user, day, model)
+def aggregate_calls(calls):
+    """Group an LLMUsage queryset by user, day and model, with the UsageRollup totals."""
+    billed = Q(status=LLMUsage.STATUS_OK)
+    return calls.annotate(day=TruncDate("created_at")).values("user_id", "day", "model").annotate(
+        n_calls=Count("id"),
+        n_cached_calls=Count("id", filter=Q(status=LLMUsage.STATUS_CACHED)),
+        n_errors=Count("id", filter=Q(status=LLMUsage.STATUS_ERROR)),
+        n_prompt_tokens=Coalesce(Sum("prompt_tokens", filter=billed), 0),
+        n_completion_tokens=Coalesce(Sum("completion_tokens", filter=billed), 0),
+        n_latency_ms_total=Sum("latency_ms"),
+        n_latency_ms_max=Max("latency_ms"),
+        n_cost_micros=Sum("cost_micros"),
+    ).order_by()
+
+
+def merge_totals(target, group):
+    for name in TOTALS:
+        setattr(target, name, getattr(target, name) + group[f"n_{name}"])
+    target.latency_ms_max = max(target.latency_ms_max, group["n_latency_ms_max"])
+
+
+# ---- Incremental rollup
+def rollup_usage(batch_size=None, lag=None, now=None) -> int:
+    """Fold calls after the checkpoint into UsageRollup. Returns how many calls were folded."""
+    batch_size = batch_size or settings.USAGE_ROLLUP_BATCH
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.USAGE_ROLLUP_LAG if lag is None else lag)
+    UsageCheckpoint.objects.get_or_create(name=CHECKPOINT)
+    folded = 0
+    while True:
+        with transaction.atomic():
+            # Also keeps two rollups from running at once
+            checkpoint = UsageCheckpoint.objects.select_for_update().get(name=CHECKPOINT)
+            last = checkpoint.last_id
+            bounds = LLMUsage.objects.filter(id__gt=last).aggregate(
+                top=Max("id"), fresh=Min("id", filter=Q(created_at__gte=cutoff)),
+            )
+            if bounds["top"] is None:
+                return folded
+            upper = min(last + batch_size, bounds["top"] if bounds["fresh"] is None else bounds["fresh"] - 1)
+            if upper <= last:
+                return folded
+
+            groups = list(aggregate_calls(LLMUsage.objects.filter(id__gt=last, id__lte=upper)))
+            rollups = rollups_for(groups)
+            for group in groups:
+                key = (group["user_id"], group["day"], group["model"])
+                if key not in rollups:
+                    rollups[key] = UsageRollup(user_id=key[0], day=key[1], model=key[2])
+                merge_totals(rollups[key], group)
+                folded += group["n_calls"]
+            # One upsert writes the new totals (bulk_update's CASE per row is slow for thousands of rows)
+            UsageRollup.objects.bulk_create(
+                rollups.values(), batch_size=1000, update_conflicts=True,
+                unique_fields=["user", "day", "model"], update_fields=[*TOTALS, "latency_ms_max"],
+            )
+            checkpoint.last_id = upper
+            checkpoint.save(update_fields=["last_id", "updated_at"])
+
+
+def rollups_for(groups):
+    """Existing UsageRollup rows for the (user, day, model) keys of ``groups``, by key."""
+    if not groups:
+        return {}
+    keys = {(group["user_id"], group["day"], group["model"]) for group in groups}
+    rows = UsageRollup.objects.filter(
+        user_id__in={key[0] for key in keys},
+        day__in={key[1] for key in keys},
+        model__in={key[2] for key in keys},
+    )
+    return {key: row for row in rows if (key := (row.user_id, row.day, row.model)) in keys}
+
+
+def prune_usage(now=None) -> int:
+    """Delete rolled-up calls older than USAGE_RAW_RETENTION_DAYS. Returns how many."""
+    checkpoint = UsageCheckpoint.objects.filter(name=CHECKPOINT).first()
+    if checkpoint is None:
+        return 0
+    cutoff = (now or timezone.now()) - timedelta(days=settings.USAGE_RAW_RETENTION_DAYS)
+    deleted, _ = LLMUsage.objects.filter(id__lte=checkpoint.last_id, created_at__lt=cutoff).delete()
+    return deleted
+
+
+# ---- Reading usage
+def usage_by_day(user, since):
+    """
+    ``user``'s usage per day and model from ``since`` (a date) on, newest first:
+    the rollups plus the calls not rolled up yet.
+    """
+    last_id = UsageCheckpoint.objects.filter(name=CHECKPOINT).values_list("last_id", flat=True).first() or 0
+    totals = {
+        (row.day, row.model): row
+        for row in UsageRollup.objects.filter(user=user, day__gte=since)
+    }
+    start = timezone.make_aware(datetime.combine(since, time.min))
+    pending = LLMUsage.objects.filter(user=user, created_at__gte=start, id__gt=last_id)
+    for group in aggregate_calls(pending):
+        key = (group["day"], group["model"])
+        if key not in totals:
+            totals[key] = UsageRollup(user=user, day=key[0], model=key[1])
+        merge_totals(totals[key], group)
+    return sorted(totals.values(), key=lambda row: (row.day, row.model), reverse=True)
+
+
+def usage_totals(rows):
+    """Sum of usage_by_day() rows, e.g. for a quota check."""
+    summed = dict.fromkeys(TOTALS, 0)
+    for row in rows:
+        for name in TOTALS:
+            summed[name] += getattr(row, name)
+    return summed
@@ -1,87 +1,117 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, time, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Max, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Substr
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from django.conf import settings
-from langchain_ibm import WatsonxLLM
-from langchain_core.messages import AIMessage
-from .models import Conversation, Message, Prompt
-from .serializers import ConversationSerializer, MessageSerializer, PromptSerializer
+from rest_framework.views import APIView
+from .admission import UserTokenBucketThrottle, acquire_llm_slot
+from .archive import ArchiveError, restore_conversation
+from .cache import get_response_cache
+from .conditional import ConditionalGetMixin
+from .export import EXPORT_FORMATS, export_filename, export_stream
+from .context import ContextAssembler
+from .jobs import enqueue_generation
+from .llm import GENERATION_PARAMS, MODEL_ID, SYSTEM_PROMPT, get_provider
+from .models import ArchivedConversation, Conversation, GenerationJob, Message, Prompt
+from .pagination import (
+    ConversationCursorPagination, MessageCursorPagination, PromptCursorPagination, SearchPagination,
+)
+from .push import push_token
+from .resilience import api_error, get_guard
+from .search import KINDS, SearchUnavailable, search
+from .usage import usage_by_day, usage_totals
+from .serializers import (
+    ArchivedConversationSerializer, ConversationSerializer, ConversationSummarySerializer, GenerationJobSerializer,
+    MessageSerializer, PromptSerializer, PromptSummarySerializer, SearchResultSerializer, UsageRollupSerializer,
+)
+from .services import (
+    cache_context, generate_reply, save_ai_message, stream_reply, truncate_words,
+)
+
+logger = logging.getLogger(__name__)
 
 # --- Constants ---
-MAX_WORDS = 1500          # Max words in AI response
 MAX_USER_WORDS = 1000     # Max words in user input
 MAX_MESSAGES_PER_CONVERSATION = 8  # Limit user messages per conversation
 
-# --- Helper function: Save AI message ---
-def save_ai_message(conversation_id: int, ai_message: AIMessage):
-    """Save the AI-generated message and auto-generate a clean title if missing."""
-    conversation = Conversation.objects.get(id=conversation_id)
-
-    # Clean AI message content (remove "Assistant:" or "assistant:")
-    content = ai_message.content.strip()
-    if content.lower().startswith("assistant:"):
-        content = content.split(":", 1)[1].strip()
-
-    # Save the AI-generated message
-    msg = Message.objects.create(
-        conversation=conversation,
-        sender="assistant",
-        content=content
-    )
 
-    # Auto-generate title if it doesn't exist
-    if not conversation.title:
-        # Use first few words of the cleaned content
-        first_words = " ".join(content.split()[:6])
-        title = first_words[:50].rstrip(".!?")
-        conversation.title = title or "New Chat"
-        conversation.save(update_fields=["title"])
+# --- Helper function: Streaming bodies under ASGI ---
+def streaming_body(request, chunks):
+    """
+    Body for a StreamingHttpResponse. Under ASGI the blocking ``chunks`` generator
+    is driven from a worker thread, so it never runs on the event loop.
+    """
+    if isinstance(request._request, ASGIRequest):
+        return async_iterate(chunks)
+    return chunks
 
-    return msg
 
+async def async_iterate(chunks):
+    """Drive a blocking generator from a worker thread."""
+    done = object()
+    try:
+        while True:
+            chunk = await sync_to_async(next)(chunks, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        # Runs on disconnect (task cancelled) too, so e.g. a partial reply gets saved.
+        await asyncio.shield(sync_to_async(chunks.close)())
 
 
 # --- Message List View ---
-class MessageListView(generics.ListAPIView):
+class MessageListView(ConditionalGetMixin, generics.ListAPIView):
     """
-    Returns all messages for a given conversation.
-    GET /aiassistant/messages/?conversation=<conversation_id>
+    Returns the messages of one of the user's conversations, oldest first,
+    one cursor page at a time.
+    GET /aiassistant/messages/all/?conversation=<conversation_id>
+    GET /aiassistant/messages/all/?conversation=<conversation_id>&since=<message_id>
+        -> only messages newer than <message_id> (delta sync)
+    Send If-None-Match with the last ETag to get 304 while nothing changed.
     """
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageCursorPagination
+
+    def get_version(self):
+        conversation_id = self.request.query_params.get("conversation")
+        if not conversation_id or not conversation_id.isdigit():
+            return None
+        updated_at = Conversation.objects.filter(
+            id=conversation_id, user=self.request.user
+        ).values_list("updated_at", flat=True).first()
+        return (updated_at, updated_at) if updated_at else None
 
     def get_queryset(self):
         conversation_id = self.request.query_params.get("conversation")
         if not conversation_id:
             return Message.objects.none()
-        return Message.objects.filter(conversation_id=conversation_id).order_by("created_at")
-
-
+        if not conversation_id.isdigit():
+            raise ValidationError({"conversation": "Must be a conversation id."})
+        queryset = Message.objects.in_conversation(int(conversation_id)).filter(
+            conversation__user=self.request.user,
+        )
 
-# --- Helper function to save AI messages ---
-def save_ai_message(conversation_id: int, ai_message: AIMessage):
-    """Save AI message and generate conversation title if missing."""
-    conversation = Conversation.objects.get(id=conversation_id)
+        since = self.request.query_params.get("since")
+        if since:
+            if not since.isdigit():
+                raise ValidationError({"since": "Must be a message id."})
+            queryset = queryset.filter(id__gt=since)
+        return queryset.select_related("image_asset").order_by("created_at", "id")
 
-    # Clean AI message content (remove "Assistant:" prefix)
-    content = ai_message.content.strip()
-    if content.lower().startswith("assistant:"):
-        content = content.split(":", 1)[1].strip()
 
-    # Save AI-generated message
-    msg = Message.objects.create(
-        conversation=conversation,
-        sender="assistant",
-        content=content
-    )
-
-    # Auto-generate title if missing
-    if not conversation.title:
-        first_words = " ".join(content.split()[:6])
-        title = first_words[:50].rstrip(".!?")
-        conversation.title = title or "New Chat"
-        conversation.save(update_fields=["title"])
-
-    return msg
 
 # --- Message Create View ---
 class MessageCreateView(generics.CreateAPIView):
@@ -92,36 +122,31 @@ class MessageCreateView(generics.CreateAPIView):
     - Sends it to Watsonx AI using LangChain.
     - Uses a system prompt to guide AI responses for health-focused Q&A.
     - Limits a conversation to 8 user messages; creates a new conversation automatically if exceeded.
+    - Returns only the new user and assistant messages (use messages/all/?since= to sync).
+    - With GENERATION_QUEUE set to "inprocess" or "db", queues the AI reply as a GenerationJob
+      and returns 202 with the job; poll latest-message for its status.
+    - Returns 429 with Retry-After when the user is over their message rate, or when every
+      LLM slot is busy and the wait queue is full (see admission.py).
+    - Returns 503 with Retry-After while the circuit breaker around Watsonx is open (see resilience.py).
+    - Returns 503 (or 504 on a timeout) when the call fails after its retries; no assistant
+      message is saved and the cause is only logged.
     """
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle]
 
-    SYSTEM_PROMPT = (
-        "You are a professional health assistant. Always answer health-related questions accurately and politely.\n"
-        "Do NOT create any new questions or topics. Only answer the user question.\n\n"
-        "- Always provide sources for only health related question.\n"
-        "- Use Markdown formatting for emphasis:\n"
-        "  - **Bold important terms**\n"
-        "  - Use bullet points for lists\n"
-        "  - Use tables when appropriate\n"
-        "  - Use headings for sections"
-    )
+    SYSTEM_PROMPT = SYSTEM_PROMPT   # llm.py: it is part of every response cache key
 
-    def perform_create(self, serializer):
+    def prepare_user_message(self, serializer):
+        """Resolve the conversation, validate and save the user's message."""
         request = serializer.context.get("request")
 
         # --- Determine conversation ---
         conversation = serializer.validated_data.get("conversation")
 
         if conversation:
-            # Count existing user messages
-            existing_user_messages = Message.objects.filter(
-                conversation=conversation,
-                sender="user"
-            ).count()
-
             # If user reached max messages, create a new conversation
-            if existing_user_messages >= MAX_MESSAGES_PER_CONVERSATION:
+            if conversation.user_message_count >= MAX_MESSAGES_PER_CONVERSATION:
                 conversation = Conversation.objects.create(user=request.user)
                 serializer.validated_data['conversation'] = conversation
         else:
@@ -137,92 +162,241 @@ class MessageCreateView(generics.CreateAPIView):
             raise ValueError(f"Message too long (max {MAX_USER_WORDS} words).")
 
         # --- Save user message ---
-        message = serializer.save()
-
-        # --- Prepare full prompt for AI ---
-        full_prompt = f"{self.SYSTEM_PROMPT}\n\nUser question:\n{user_content}"
-
         try:
-            llm = WatsonxLLM(
-                model_id="ibm/granite-3-3-8b-instruct",
-                url=settings.WATSONX_URL,
-                project_id=settings.WATSONX_PROJECT_ID,
-                apikey=settings.WATSONX_APIKEY,
-                params={
-                    "decoding_method": "greedy",
-                    "temperature": 0,
-                    "min_new_tokens": 10,
-                    "max_new_tokens": 800,
-                    "repetition_penalty": 1.2,
-                }
-            )
-
-            # --- Invoke AI model ---
-            raw_response = llm.invoke(full_prompt)
+            return serializer.save()
+        except DjangoValidationError as e:
+            # Message.save() re-checks the limit atomically: a concurrent request took the last
+            # slot after the check above. Continue in a new conversation, like the check does.
+            if getattr(e, "code", None) != "conversation_full":
+                raise ValidationError(e.messages)
+            serializer.validated_data['conversation'] = Conversation.objects.create(user=request.user)
+            return serializer.save()
+
+    def build_prompt(self, message):
+        """
+        Prepare the full prompt sent to the AI for a saved user message.
+        The assembled context (token counts per section) is kept on ``self.context``.
+        """
+        user_content = message.content.strip()
+
+        # --- Add matching passages from the health corpus, if an index is built ---
+        from .retrieval import format_sources, get_retriever  # loads numpy on the first message, not at boot
+
+        retriever = get_retriever()
+        chunks = retriever.retrieve(user_content) if retriever else []
+        sources = ""
+        if chunks:
+            sources = f"Cite only these sources, by number, when they are relevant:\n\n{format_sources(chunks)}"
+
+        # --- Fit earlier turns of the conversation into the token budget ---
+        self.context = ContextAssembler().assemble(message, self.SYSTEM_PROMPT, sources)
+        return self.context.prompt
 
-            # --- Normalize AI response ---
-            if hasattr(raw_response, "content"):
-                ai_response = raw_response.content
-            elif isinstance(raw_response, dict) and "generations" in raw_response:
-                ai_response = "\n".join([g.get("text", "") for g in raw_response["generations"]])
-            elif isinstance(raw_response, list):
-                ai_response = "\n".join(str(part) for part in raw_response)
-            else:
-                ai_response = str(raw_response)
-
-            ai_response = ai_response.strip()
-
-            # --- Truncate AI response if too long ---
-            words = ai_response.split()
-            if len(words) > MAX_WORDS:
-                ai_response = " ".join(words[:MAX_WORDS])
+    def perform_create(self, serializer):
+        message = self.prepare_user_message(serializer)
+        full_prompt = self.build_prompt(message)
 
-            # --- Save AI response ---
-            ai_message = AIMessage(content=ai_response)
-            save_ai_message(message.conversation.id, ai_message)
+        # --- Queue mode: hand the reply to a worker and return right away ---
+        if settings.GENERATION_QUEUE != "sync":
+            self.job = enqueue_generation(message, full_prompt, cacheable=self.context.is_standalone)
+            return message
 
+        try:
+            # --- Invoke AI model ---
+            question = message.content if self.context.is_standalone else None
+            ai_response = generate_reply(
+                full_prompt, question=question, conversation=message.conversation, permit=self.permit
+            )
         except Exception as e:
-            print("WatsonxAI error:", str(e))
-            error_text = f"Sorry, I encountered an error generating a response. (Error: {str(e)})"
-            ai_message = AIMessage(content=error_text)
-            save_ai_message(message.conversation.id, ai_message)
+            # No assistant message: the client gets 503/504 and the cause stays in the logs
+            logger.exception("WatsonxAI error")
+            raise api_error(e) from e
 
+        reply = save_ai_message(message.conversation.id, ai_response)
+        self.new_messages = [message, reply]
         return message
 
     def create(self, request, *args, **kwargs):
         # --- Save message and generate AI response ---
-        response = super().create(request, *args, **kwargs)
+        self.job = None
+        self.permit = None
+        if settings.GENERATION_QUEUE != "sync":
+            response = super().create(request, *args, **kwargs)
+        else:
+            # Pass the circuit breaker (503 while Watsonx is down) and wait for an LLM slot
+            # before saving anything, so a rejected request leaves no trace
+            with get_guard().breaker.admit() as self.permit:
+                slot = acquire_llm_slot()
+                try:
+                    response = super().create(request, *args, **kwargs)
+                finally:
+                    if slot:
+                        slot.release()
+
+        # --- Queued: the client polls latest-message for the job status ---
+        if self.job is not None:
+            response = Response(GenerationJobSerializer(self.job).data, status=status.HTTP_202_ACCEPTED)
+            response["X-Prompt-Tokens"] = self.context.tokens["total"]
+            return response
+
+        # --- Return only the new user and assistant messages ---
+        serialized = MessageSerializer(self.new_messages, many=True)
+        response = Response(serialized.data, status=status.HTTP_201_CREATED)
+        response["X-Prompt-Tokens"] = self.context.tokens["total"]
+        return response
+
+
+# --- Message Stream View ---
+class MessageStreamView(MessageCreateView):
+    """
+    Same as MessageCreateView, but streams the AI reply as Server-Sent Events.
+    POST /aiassistant/messages/stream/
+
+    Events:
+    - ``message``: the saved user message.
+    - ``token``: a chunk of the AI reply, as soon as the LLM produces it.
+    - ``done``: the saved assistant message.
+    - ``error``: the call failed (``detail`` and ``code`` as in the 503/504 of
+      MessageCreateView). Tokens already sent are still saved and followed by
+      ``done``; with none, the stream ends without an assistant message.
+
+    The assistant message is written once, when the stream finishes or when
+    the client disconnects (with whatever was generated so far).
+    Served asynchronously under ``fastai/asgi.py``; WSGI falls back to a
+    blocking iterator.
+    """
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # --- Hold the breaker permit and an LLM slot until the response is closed (stream finished or client gone) ---
+        permit = get_guard().breaker.admit()
+        slot = None
+        try:
+            slot = acquire_llm_slot()
+            message = self.prepare_user_message(serializer)
+            events = self.event_stream(message, self.build_prompt(message), permit)
+        except BaseException:
+            if slot:
+                slot.release()
+            permit.release()
+            raise
+
+        response = StreamingHttpResponse(streaming_body(request, events), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # keep nginx from buffering the stream
+        if slot:
+            response._resource_closers.append(slot.release)
+        response._resource_closers.append(permit.release)
+        return response
+
+    @staticmethod
+    def format_event(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    def event_stream(self, message, prompt, permit=None):
+        conversation_id = message.conversation.id
+        chunks = []
+        saved = None
 
-        # --- Return all messages of the conversation ---
-        conversation_id = request.data.get("conversation")
-        messages = Message.objects.filter(conversation_id=conversation_id).order_by("created_at")
-        serialized = MessageSerializer(messages, many=True)
-        return Response(serialized.data, status=status.HTTP_201_CREATED)
+        try:
+            yield self.format_event("message", MessageSerializer(message).data)
+
+            try:
+                for chunk in stream_reply(prompt, conversation=message.conversation, permit=permit):
+                    chunks.append(chunk)
+                    if settings.WEBSOCKET_PUSH_TOKENS:
+                        push_token(conversation_id, chunk)
+                    yield self.format_event("token", {"content": chunk})
+            except Exception as e:
+                logger.exception("WatsonxAI error while streaming")
+                error = api_error(e)
+                yield self.format_event("error", {"detail": str(error.detail), "code": error.default_code})
+                if not chunks:
+                    return   # nothing to save
+
+            ai_response = truncate_words("".join(chunks).strip())
+            saved = save_ai_message(conversation_id, ai_response)
+            yield self.format_event("done", MessageSerializer(saved).data)
+
+        finally:
+            # --- Client disconnected mid-stream: keep the partial reply ---
+            partial = "".join(chunks).strip()
+            if saved is None and partial:
+                save_ai_message(conversation_id, truncate_words(partial))
 
 
 # --- Latest Message View ---
-class LatestMessageView(generics.RetrieveAPIView):
+class LatestMessageView(ConditionalGetMixin, generics.RetrieveAPIView):
     """
     Returns the latest message (user or assistant) for a given conversation.
+    Send If-None-Match with the last ETag to get 304 while nothing changed
+    (no new message and no change in the generation job status).
     """
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_version(self):
+        latest_job = GenerationJob.objects.filter(conversation=OuterRef("pk")).order_by("-created_at", "-id")
+        row = Conversation.objects.filter(
+            id=self.kwargs.get("conversation_id"), user=self.request.user
+        ).annotate(
+            job_id=Subquery(latest_job.values("id")[:1]),
+            job_status=Subquery(latest_job.values("status")[:1]),
+        ).values_list("updated_at", "job_id", "job_status").first()
+        if row is None:
+            raise NotFound()
+        updated_at, job_id, job_status = row
+        return f"{updated_at.isoformat()}|{job_id}|{job_status}", updated_at
+
     def get_object(self):
         conversation_id = self.kwargs.get("conversation_id")
-        return Message.objects.filter(conversation_id=conversation_id).order_by("-created_at").first()
+        return Message.objects.in_conversation(conversation_id).filter(
+            conversation__user=self.request.user
+        ).select_related("image_asset").order_by("-created_at", "-id").first()
+
+    def retrieve(self, request, *args, **kwargs):
+        # --- Attach the latest generation job so clients can poll its status ---
+        data = dict(self.get_serializer(self.get_object()).data)
+        job = GenerationJob.objects.filter(
+            conversation_id=self.kwargs.get("conversation_id")
+        ).order_by("-created_at", "-id").first()
+        data["generation"] = GenerationJobSerializer(job).data if job else None
+        return Response(data)
 
 
 # --- Conversation List & Create View ---
-class ConversationListCreateView(generics.ListCreateAPIView):
+class ConversationListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     """
-    Lists all conversations for the authenticated user and allows creating new ones.
+    Lists the authenticated user's conversations and allows creating new ones.
+    The list is a paginated summary (message count and last message preview,
+    loaded in one query); the full nested form is served by ConversationDetailView.
+    GET answers 304 to If-None-Match while no conversation was added, removed or changed.
     """
-    serializer_class = ConversationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ConversationCursorPagination
+
+    PREVIEW_LENGTH = 120
+
+    def get_version(self):
+        # Count catches deletions, the newest updated_at catches everything else
+        version = Conversation.objects.filter(user=self.request.user).aggregate(
+            count=Count("id"), updated_at=Max("updated_at")
+        )
+        return f"{version['count']}|{version['updated_at']}", version["updated_at"]
+
+    def get_serializer_class(self):
+        if self.request.method == "GET":
+            return ConversationSummarySerializer
+        return ConversationSerializer
 
     def get_queryset(self):
-        return Conversation.objects.filter(user=self.request.user)
+        last_message = Message.objects.filter(conversation=OuterRef("pk")).order_by("-created_at", "-id")
+        return Conversation.objects.filter(user=self.request.user).annotate(
+            message_count=Count("messages"),
+            last_message_preview=Substr(Subquery(last_message.values("content")[:1]), 1, self.PREVIEW_LENGTH),
+        )
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -237,17 +411,227 @@ class ConversationDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Conversation.objects.filter(user=self.request.user)
+        messages = Message.objects.select_related("image_asset")
+        return Conversation.objects.filter(user=self.request.user).prefetch_related(Prefetch("messages", messages))
+
+
+# --- Archived Conversation List View ---
+class ArchivedConversationListView(generics.ListAPIView):
+    """
+    Lists the user's conversations moved to cold storage by the retention policy
+    (newest first). Restore one with POST .../archived/<id>/restore/.
+    """
+    serializer_class = ArchivedConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ConversationCursorPagination
+
+    def get_queryset(self):
+        return ArchivedConversation.objects.filter(user=self.request.user)
+
+
+# --- Archived Conversation Restore View ---
+class ArchivedConversationRestoreView(generics.GenericAPIView):
+    """
+    Brings an archived conversation back under its original id and returns it
+    with its messages (201). 404 when it is not archived (or already restored).
+    """
+    serializer_class = ConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, conversation_id):
+        archived = generics.get_object_or_404(
+            ArchivedConversation, conversation_id=conversation_id, user=request.user
+        )
+        try:
+            conversation = restore_conversation(archived)
+        except ArchivedConversation.DoesNotExist:
+            raise NotFound()
+        except ArchiveError:
+            logger.exception("Archive error")
+            return Response({"detail": "The archived conversation could not be read."},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(self.get_serializer(conversation).data, status=status.HTTP_201_CREATED)
+
+
+# --- Conversation Export View ---
+class ConversationExportView(APIView):
+    """
+    Streams all of the user's conversations and messages as a download.
+    GET /aiassistant/conversations/export.ndjson  -> one conversation per line, messages nested
+    GET /aiassistant/conversations/export.csv     -> one message per row
+    Add ?gzip=1 for a gzip-compressed file. Memory use stays flat whatever the
+    history size (see export.py).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, fmt):
+        if fmt not in EXPORT_FORMATS:
+            raise NotFound()
+        compress = request.query_params.get("gzip") in ("1", "true")
+        chunks = export_stream(request.user, fmt, compress=compress)
+
+        response = StreamingHttpResponse(
+            streaming_body(request, chunks), content_type="application/gzip" if compress else f"{EXPORT_FORMATS[fmt]}; charset=utf-8"
+        )
+        filename = export_filename(fmt, compress, timezone.now())
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response["Cache-Control"] = "private, no-store"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+# --- Search View ---
+class SearchView(generics.GenericAPIView):
+    """
+    Ranked full-text search over the user's messages and prompts (see search.py).
+    GET /aiassistant/search/?q=<words>[&type=message|prompt][&limit=20&offset=0]
+    On PostgreSQL, q accepts web search syntax ("exact phrase", or, -word).
+    Each result carries a highlight with the matches wrapped in <mark>.
+    """
+    serializer_class = SearchResultSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SearchPagination
+
+    MAX_QUERY_LENGTH = 200
+
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "This parameter is required."})
+        if len(query) > self.MAX_QUERY_LENGTH:
+            raise ValidationError({"q": f"Use at most {self.MAX_QUERY_LENGTH} characters."})
+        kind = request.query_params.get("type")
+        if kind and kind not in KINDS:
+            raise ValidationError({"type": f"Must be one of: {', '.join(KINDS)}."})
+
+        try:
+            results = self.paginator.paginate_search(
+                lambda limit, offset: search(request.user, query, (kind,) if kind else KINDS, limit, offset), request
+            )
+        except SearchUnavailable:
+            logger.exception("Search error")
+            return Response({"detail": "Search is not available."}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        return self.get_paginated_response(self.get_serializer(results, many=True).data)
 
 
 # --- Prompt List & Create View ---
 class PromptListCreateView(generics.ListCreateAPIView):
     """
-    Retrieve and create prompts by the user.
+    Lists the authenticated user's prompts (newest first, keyset-paginated) and creates new ones.
+    The list leaves out input_text/output_text, sending a short preview of the input
+    instead; PromptDetailView returns the full prompt.
+    Optional filters: ?model_used=<name>, ?created_after=<date|datetime> (inclusive)
+    and ?created_before=<date|datetime> (exclusive). Naive values use the current time zone.
     """
-    queryset = Prompt.objects.all().order_by('-created_at')
-    serializer_class = PromptSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PromptCursorPagination
+
+    PREVIEW_LENGTH = 120
+
+    def get_serializer_class(self):
+        if self.request.method == "GET":
+            return PromptSummarySerializer
+        return PromptSerializer
+
+    def get_queryset(self):
+        prompts = Prompt.objects.filter(user=self.request.user).select_related("image_asset")
+        if self.request.method != "GET":
+            return prompts
+        params = self.request.query_params
+        if params.get("model_used"):
+            prompts = prompts.filter(model_used=params["model_used"])
+        if params.get("created_after"):
+            prompts = prompts.filter(created_at__gte=self.parse_bound("created_after"))
+        if params.get("created_before"):
+            prompts = prompts.filter(created_at__lt=self.parse_bound("created_before"))
+        return prompts.defer("input_text", "output_text", "metadata").annotate(
+            input_preview=Substr("input_text", 1, self.PREVIEW_LENGTH),
+        )
+
+    def parse_bound(self, name):
+        value = self.request.query_params[name]
+        try:
+            moment = parse_datetime(value)
+            if moment is None and (day := parse_date(value)) is not None:
+                moment = datetime.combine(day, time.min)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({name: "Must be an ISO 8601 date or datetime."})
+        return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+
+# --- Prompt Detail View ---
+class PromptDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """
+    Retrieve, update, or delete one of the user's prompts, with its full input and output.
+    """
+    serializer_class = PromptSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Prompt.objects.filter(user=self.request.user).select_related("image_asset")
+
+
+# --- Usage View ---
+class UsageView(APIView):
+    """
+    The user's LLM usage per day and model, newest first, with totals.
+    GET /aiassistant/usage/?days=30   (1 to 366 days, today included)
+    Reads the daily rollups plus the calls not rolled up yet (see usage.py).
+    Tokens and cost count billed calls only; cached replies and errors are counted separately.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    MAX_DAYS = 366
+
+    def get(self, request):
+        days = request.query_params.get("days", "30")
+        if not days.isdigit() or not 1 <= int(days) <= self.MAX_DAYS:
+            raise ValidationError({"days": f"Must be a number of days from 1 to {self.MAX_DAYS}."})
+        since = timezone.localdate() - timedelta(days=int(days) - 1)
+        rows = usage_by_day(request.user, since)
+        totals = usage_totals(rows)
+        return Response({
+            "since": since,
+            "totals": {
+                **{name: totals[name] for name in ("calls", "cached_calls", "errors", "prompt_tokens", "completion_tokens")},
+                "cost": totals["cost_micros"] / 1_000_000,
+            },
+            "days": UsageRollupSerializer(rows, many=True).data,
+        })
+
+
+# --- LLM Client Stats View ---
+class LLMClientStatsView(APIView):
+    """
+    Staff-only counters for the pooled Watsonx clients (created / reused / token refreshes),
+    plus retries, timeouts, hedges and the circuit breaker state under "resilience".
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({**get_provider().stats(), "resilience": get_guard().stats()})
+
+
+# --- Response Cache View ---
+class ResponseCacheView(APIView):
+    """
+    Staff-only response cache admin.
+    GET    /aiassistant/cache/responses/                  -> hit/miss stats
+    DELETE /aiassistant/cache/responses/?question=<text>  -> drop one question, or everything
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        response_cache = get_response_cache()
+        return Response({"enabled": response_cache is not None, **(response_cache.stats() if response_cache else {})})
+
+    def delete(self, request):
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            response_cache.invalidate(request.query_params.get("question"), MODEL_ID, GENERATION_PARAMS, cache_context())
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,13 +1,59 @@
 #!/bin/sh
+set -e
 
-# ---- Echo a message 
-echo "Running migrations..."
-# ---- Creating migration file and create a database model
-python3 manage.py makemigrations
-# ---- Running migrate and migrate the created database model to the postgres database
-python3 manage.py migrate
+# ---- Usage: ./entrypoint.sh [web|migrate|worker|images|retention|usage|dev]
+# web     - production server (gunicorn + uvicorn workers, see gunicorn.conf.py)
+# migrate - one-shot release step: apply migrations and collect static files
+# worker  - background generation worker (GENERATION_QUEUE=db)
+# images  - image variant worker (IMAGE_QUEUE=db)
+# retention - daily job: archive idle conversations, then maintain the message partitions
+# usage   - job for every few minutes: roll up LLM usage per user, day and model
+# dev     - Django development server (migrates first)
+if [ "$DJANGO_ENV" = "productions" ]; then
+    DEFAULT_MODE="web"
+else
+    DEFAULT_MODE="dev"
+fi
+MODE="${1:-$DEFAULT_MODE}"
 
-# ---- Echo message
-echo "Starting server..."
-# running the Django server
-python3 manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+case "$MODE" in
+    migrate)
+        echo "Running migrations..."
+        python3 manage.py migrate --noinput
+        python3 manage.py createcachetable
+        echo "Collecting static files..."
+        python3 manage.py collectstatic --noinput
+        ;;
+    web)
+        echo "Starting production server..."
+        exec gunicorn fastai.asgi:application -c gunicorn.conf.py
+        ;;
+    worker)
+        echo "Starting generation worker..."
+        exec python3 manage.py run_generation_worker
+        ;;
+    images)
+        echo "Starting image worker..."
+        exec python3 manage.py run_image_worker
+        ;;
+    retention)
+        echo "Archiving idle conversations..."
+        python3 manage.py archive_conversations
+        echo "Maintaining message partitions..."
+        python3 manage.py manage_message_partitions
+        ;;
+    usage)
+        echo "Rolling up LLM usage..."
+        python3 manage.py rollup_usage
+        ;;
+    dev)
+        echo "Running migrations..."
+        python3 manage.py migrate
+        echo "Starting server..."
+        exec python3 manage.py runserver 0.0.0.0:8000
+        ;;
+    *)
+        echo "Unknown mode: $MODE (expected web, migrate, worker, images, retention, usage or dev)"
+        exit 1
+        ;;
+esac
@@ -11,6 +11,20 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fastai.settings')
+env = os.getenv("DJANGO_ENV", "development")
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', f'fastai.settings.{env}')
 
-application = get_asgi_application()
+# Set up Django before importing anything that touches models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from aiassistant.routing import websocket_urlpatterns  # noqa: E402
+from users.middleware import JWTAuthMiddleware  # noqa: E402
+
+# ---- HTTP goes to Django, WebSockets to the push consumers.
+# Sockets authenticate with a JWT rather than cookies, so there is no Origin check
+# (it would only lock out the React dev server and non-browser clients).
+application = ProtocolTypeRouter({
+    "http": django_asgi_app,
+    "websocket": JWTAuthMiddleware(URLRouter(websocket_urlpatterns)),
+})
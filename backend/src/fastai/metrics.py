@@ -0,0 +1,204 @@
+"""
+In-process metrics in Prometheus text format.
+
+Counters, gauges and histograms are plain Python objects guarded by a lock,
+so recording a sample costs a dict lookup and an addition. Values are per
+process; scrape every worker (or aggregate in the collector) when running
+several.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; tuned for web requests and LLM calls (which can take tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, key, ['le="%s"' % le])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        """
+        Add a callable returning ``(name, kind, documentation, {labels_tuple: value})``
+        tuples, evaluated at scrape time (for stats kept elsewhere, e.g. cache hit counts).
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        for collector in collectors:
+            try:
+                samples = list(collector())
+            except Exception:
+                logger.exception("Metrics collector %r failed", collector)
+                continue
+            for name, kind, documentation, values in samples:
+                lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+                for labels, value in values.items():
+                    label_text = "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}" if labels else ""
+                    lines.append(f"{name}{label_text} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ---- HTTP / database metrics (recorded by fastai.middleware.MetricsMiddleware)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route.", ["method", "route", "status"]
+)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "Requests currently being served.")
+http_exceptions = registry.counter("http_exceptions_total", "Unhandled exceptions by route.", ["route"])
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "SQL queries executed per request.", ["route"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 500),
+)
+db_query_duration_per_request = registry.histogram(
+    "db_query_seconds_per_request", "Total SQL time per request.", ["route"]
+)
+
+# ---- LLM metrics (recorded by aiassistant.services)
+llm_call_duration = registry.histogram("llm_call_duration_seconds", "Latency of LLM calls.", ["model", "mode"])
+llm_prompt_chars = registry.histogram("llm_prompt_chars", "Prompt size in characters.", ["model"], buckets=SIZE_BUCKETS)
+llm_response_chars = registry.histogram("llm_response_chars", "Response size in characters.", ["model"], buckets=SIZE_BUCKETS)
+llm_errors = registry.counter("llm_errors_total", "Failed LLM calls.", ["model", "error"])
+llm_generations_in_flight = registry.gauge("llm_generations_in_flight", "LLM generations currently running.")
+llm_batch_size = registry.histogram(
+    "llm_batch_size", "Prompts per batched generate call.", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+llm_batch_wait = registry.histogram("llm_batch_wait_seconds", "Time a prompt waited for its batch to start.")
@@ -0,0 +1,49 @@
+import time
+from django.db import connection
+from .metrics import (
+    db_queries_per_request, db_query_duration_per_request, http_exceptions,
+    http_request_duration, http_requests_in_flight,
+)
+
+
+# ---- Request, SQL and error metrics for every request
+class MetricsMiddleware:
+    """
+    Records latency per route (the URL pattern, not the raw path, so label
+    cardinality stays bounded), the number and total time of SQL queries,
+    and unhandled exceptions.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0, 0.0]
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries[0] += 1
+                queries[1] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with http_requests_in_flight.track_inprogress(), connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+
+        route = self.route(request)
+        http_request_duration.observe(
+            time.perf_counter() - started, method=request.method, route=route, status=response.status_code
+        )
+        db_queries_per_request.observe(queries[0], route=route)
+        db_query_duration_per_request.observe(queries[1], route=route)
+        return response
+
+    def process_exception(self, request, exception):
+        http_exceptions.inc(route=self.route(request))
+
+    @staticmethod
+    def route(request):
+        match = getattr(request, "resolver_match", None)
+        return match.route if match else "unmatched"
@@ -17,9 +17,180 @@ WATSONX_APIKEY = os.getenv("WATSONX_APIKEY")
 WATSONX_URL = os.getenv("WATSONX_URL")
 WATSONX_PROJECT_ID = os.getenv("WATSONX_PROJECT_ID")
 
-if not all([WATSONX_APIKEY, WATSONX_URL, WATSONX_PROJECT_ID]):
+# "watsonx" calls IBM Watsonx; "fake" uses the local stand-in in aiassistant/fake_llm.py
+# (benchmarks and load tests, no credentials needed); or a dotted path to an
+# aiassistant.llm.LLMProvider instance. SDKs are imported on first use, not at boot.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "watsonx")
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))                # seconds to first token
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50"))
+FAKE_LLM_FAILURE_RATE = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+FAKE_LLM_SLOW_RATE = float(os.getenv("FAKE_LLM_SLOW_RATE", "0"))                # share of calls that are slow
+FAKE_LLM_SLOW_LATENCY = float(os.getenv("FAKE_LLM_SLOW_LATENCY", "30"))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
+
+if LLM_BACKEND == "watsonx" and not all([WATSONX_APIKEY, WATSONX_URL, WATSONX_PROJECT_ID]):
     raise ValueError("Watsonx environment variables are missing! Check your .env file.")
 
+# ---- Watsonx client pool (one client per process, see aiassistant/llm.py)
+WATSONX_MAX_CONNECTIONS = int(os.getenv("WATSONX_MAX_CONNECTIONS", "10"))
+WATSONX_KEEPALIVE_SECONDS = int(os.getenv("WATSONX_KEEPALIVE_SECONDS", "60"))
+WATSONX_WARMUP = os.getenv("WATSONX_WARMUP", "False") == "True"
+
+# ---- Resilience around LLM calls (see aiassistant/resilience.py)
+# A reply gets LLM_DEADLINE seconds in total (for streams: until the first token), each attempt
+# at most LLM_ATTEMPT_TIMEOUT (also the Watsonx HTTP read timeout). Keep the deadline below GUNICORN_TIMEOUT.
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "90"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "40"))
+# Transient failures (timeouts, connection errors, 429/5xx) are retried up to LLM_MAX_RETRIES times,
+# after a random delay of up to LLM_RETRY_BASE_DELAY * 2^n seconds, capped at LLM_RETRY_MAX_DELAY.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+# With LLM_HEDGE_PERCENTILE set (e.g. 95; 0 disables), a non-streamed call still running after that
+# percentile of recent call latencies gets a second, identical request; the first reply wins.
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+# LLM_BREAKER_FAILURES calls in a row failing after their retries (0 disables) open the circuit: calls fail at once (503) for
+# LLM_BREAKER_RESET seconds, then one trial call decides whether it closes again.
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+# Threads that run attempts (a timed-out attempt keeps its thread until the HTTP timeout frees it)
+LLM_CALL_THREADS = int(os.getenv("LLM_CALL_THREADS", "32"))
+
+# ---- Response cache for repeated questions (see aiassistant/cache.py)
+# Backends are tried in order: "locmem" (per-process LRU), "django" (CACHES alias
+# below) or a dotted path to a custom backend class.
+# Keep a shared tier when running several workers: invalidating an answer reaches the
+# other workers' LRUs through it (with "locmem" alone they keep it until RESPONSE_CACHE_TTL).
+# "django" is only shared when CACHES is: the default CACHES backend is per-process LocMem,
+# so production settings require CACHE_BACKEND (Redis, database) for it (productions.py).
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "True") == "True"
+RESPONSE_CACHE_BACKENDS = os.getenv("RESPONSE_CACHE_BACKENDS", "locmem,django").split(",")
+RESPONSE_CACHE_ALIAS = os.getenv("RESPONSE_CACHE_ALIAS", "default")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(60 * 60 * 24)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+# ---- Retrieval over the curated health corpus (see aiassistant/retrieval.py)
+# Build the index with `manage.py build_retrieval_index --corpus <dir>`.
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "True") == "True"
+RETRIEVAL_INDEX_DIR = os.getenv("RETRIEVAL_INDEX_DIR", os.path.join(BASE_DIR, "retrieval_index"))
+RETRIEVAL_EMBEDDER = os.getenv("RETRIEVAL_EMBEDDER", "aiassistant.retrieval.HashingEmbedder")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.1"))
+
+# ---- Conversation history sent with each question (see aiassistant/context.py)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "300"))
+
+# ---- Retention of conversations (see aiassistant/archive.py and aiassistant/partitions.py)
+# `manage.py archive_conversations` moves conversations idle for MESSAGE_RETENTION_DAYS (0 disables)
+# into gzipped JSONL files under ARCHIVE_DIR; users can restore them on demand.
+# On PostgreSQL `manage.py manage_message_partitions` keeps MESSAGE_PARTITIONS_AHEAD monthly
+# partitions of the message table ready and drops the emptied ones past the retention window.
+MESSAGE_RETENTION_DAYS = int(os.getenv("MESSAGE_RETENTION_DAYS", "365"))
+MESSAGE_PARTITIONS_AHEAD = int(os.getenv("MESSAGE_PARTITIONS_AHEAD", "3"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+
+# ---- Streaming export of a user's conversations (see aiassistant/export.py)
+# Rows fetched per round trip from the database cursor.
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+
+# ---- Full-text search over messages and prompts (see aiassistant/search.py)
+# Text search configuration (stemming, stop words) used by queries. Migration 0008 builds the PostgreSQL
+# index with 'english'; another value needs a new migration that rebuilds the search_vector columns.
+SEARCH_CONFIG = os.getenv("SEARCH_CONFIG", "english")
+# Only the newest SEARCH_MAX_CANDIDATES matches per kind are ranked (0: all), which bounds the cost of very common words.
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "500"))
+
+# ---- Uploaded images (see aiassistant/images.py)
+# Originals are stored once per content hash under MEDIA_ROOT/images/; a worker pool
+# builds WebP variants no larger than IMAGE_THUMB_SIZE and IMAGE_DISPLAY_SIZE pixels per side.
+# "inprocess": IMAGE_WORKERS threads in the web process (default).
+# "db": leave assets queued for `manage.py run_image_worker` (a process pool).
+MEDIA_URL = os.getenv("MEDIA_URL", "/media/")
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", os.path.join(BASE_DIR, "media"))
+IMAGE_QUEUE = os.getenv("IMAGE_QUEUE", "inprocess")
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_THUMB_SIZE = int(os.getenv("IMAGE_THUMB_SIZE", "256"))
+IMAGE_DISPLAY_SIZE = int(os.getenv("IMAGE_DISPLAY_SIZE", "1280"))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+IMAGE_MAX_UPLOAD_MB = int(os.getenv("IMAGE_MAX_UPLOAD_MB", "20"))
+
+# ---- LLM usage accounting (see aiassistant/usage.py)
+# Prices per million tokens (any currency); costs are stored in millionths of it.
+LLM_PRICE_INPUT_PER_1M = float(os.getenv("LLM_PRICE_INPUT_PER_1M", "0"))
+LLM_PRICE_OUTPUT_PER_1M = float(os.getenv("LLM_PRICE_OUTPUT_PER_1M", "0"))
+# `manage.py rollup_usage` (run every few minutes) folds calls older than USAGE_ROLLUP_LAG seconds
+# into per-user, per-day, per-model rollups, USAGE_ROLLUP_BATCH ids per transaction, and deletes
+# rolled-up calls older than USAGE_RAW_RETENTION_DAYS.
+USAGE_ROLLUP_LAG = int(os.getenv("USAGE_ROLLUP_LAG", "300"))
+USAGE_ROLLUP_BATCH = int(os.getenv("USAGE_ROLLUP_BATCH", "50000"))
+USAGE_RAW_RETENTION_DAYS = int(os.getenv("USAGE_RAW_RETENTION_DAYS", "90"))
+
+# ---- Prometheus metrics at /metrics/ (see fastai/metrics.py)
+# Scrapers send "Authorization: Bearer <METRICS_TOKEN>"; without a token only staff sessions
+# get in. (No IP allow-list: behind the reverse proxy every client comes from 127.0.0.1.)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# ---- AI reply generation
+# "sync": generate inside the request (default).
+# "inprocess": enqueue a job and run it on a thread pool in the web process.
+# "db": enqueue a job and let `manage.py run_generation_worker` pick it up.
+GENERATION_QUEUE = os.getenv("GENERATION_QUEUE", "sync")
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "4"))
+# "inprocess": every GENERATION_RECOVER_INTERVAL seconds each web process requeues jobs running for
+# more than GENERATION_STALE_AFTER seconds (their process died) and runs jobs queued for longer than
+# the interval (lost on restart). Keep GENERATION_STALE_AFTER above LLM_DEADLINE.
+GENERATION_RECOVER_INTERVAL = int(os.getenv("GENERATION_RECOVER_INTERVAL", "60"))
+GENERATION_STALE_AFTER = int(os.getenv("GENERATION_STALE_AFTER", "600"))
+
+# ---- Admission control in front of the LLM (see aiassistant/admission.py)
+# At most LLM_MAX_CONCURRENCY sync/streamed replies run at once per web process (0 disables);
+# LLM_MAX_QUEUE more may wait up to LLM_QUEUE_TIMEOUT seconds, the rest get a 429.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+# Per-user token bucket: bursts of USER_MESSAGE_BURST, refilled at USER_MESSAGES_PER_MINUTE (0 disables).
+USER_MESSAGE_BURST = int(os.getenv("USER_MESSAGE_BURST", "5"))
+USER_MESSAGES_PER_MINUTE = float(os.getenv("USER_MESSAGES_PER_MINUTE", "10"))
+RATE_LIMIT_CACHE_ALIAS = os.getenv("RATE_LIMIT_CACHE_ALIAS", "default")
+
+# ---- Micro-batching of concurrent prompts (see aiassistant/batching.py)
+# Prompts arriving within LLM_BATCH_WINDOW_MS (0 disables) are sent as one generate call
+# of up to LLM_BATCH_MAX_SIZE prompts; LLM_BATCH_CONCURRENCY batches may run at once.
+# Raise LLM_MAX_CONCURRENCY along with the batch size, since every waiting caller holds a slot.
+LLM_BATCH_WINDOW_MS = int(os.getenv("LLM_BATCH_WINDOW_MS", "0"))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))
+LLM_BATCH_CONCURRENCY = int(os.getenv("LLM_BATCH_CONCURRENCY", "4"))
+
+# ---- WebSocket push of new messages (see aiassistant/consumers.py, served by fastai/asgi.py)
+# The in-memory layer only reaches sockets in the same process (tests, a single worker).
+# With several workers, nodes or a separate generation worker, set CHANNEL_REDIS_URL
+# (needs `pip install channels-redis`) or CHANNEL_LAYER_BACKEND to another layer.
+CHANNEL_REDIS_URL = os.getenv("CHANNEL_REDIS_URL")
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CHANNEL_LAYER_BACKEND",
+            "channels_redis.core.RedisChannelLayer" if CHANNEL_REDIS_URL else "channels.layers.InMemoryChannelLayer",
+        ),
+        "CONFIG": {"hosts": [CHANNEL_REDIS_URL]} if CHANNEL_REDIS_URL else {},
+    }
+}
+# Also push every streamed token to subscribed sockets (one channel-layer send per token)
+WEBSOCKET_PUSH_TOKENS = os.getenv("WEBSOCKET_PUSH_TOKENS", "False") == "True"
+
+# ---- Cache shared by rate limits and the response cache.
+# The default is per-process memory; with several workers use the database
+# (CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache, CACHE_LOCATION=django_cache,
+# created by `./entrypoint.sh migrate`) or Redis so every worker sees the same counters.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
 
 
 # Application definition
@@ -39,6 +210,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'fastai.middleware.MetricsMiddleware',  # first, so it times the whole stack
     "corsheaders.middleware.CorsMiddleware", 
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -141,12 +313,19 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     )
 }
 
+# ---- Users resolved from a JWT are cached for USER_CACHE_TTL seconds (0 disables),
+# see users/authentication.py. Use a shared, fast cache (Redis), not the DB cache: with
+# per-process locmem a deactivated user or changed password only reaches the other workers
+# after the TTL, so production settings refuse it (productions.py).
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_ALIAS = os.getenv("USER_CACHE_ALIAS", "default")
+
 # ----- JSON Web Token Authentication Implemntation in Django with simple JWT
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
@@ -180,4 +359,21 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # SOCIAL_AUTH_GOOGLE_OAUTH2_KEY = os.getenv("Your social gooogle Oauth2 key")
 # SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET = os.getenv("Your social google oauth2 secret")
 
-AUTH_USER_MODEL = 'users.UserAccount'
\ No newline at end of file
+AUTH_USER_MODEL = 'users.UserAccount'
+
+# ---- Logging: app errors go to stderr with tracebacks (collected by gunicorn / the container runtime)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "plain"},
+    },
+    "loggers": {
+        app: {"handlers": ["console"], "level": LOG_LEVEL, "propagate": False}
+        for app in ("aiassistant", "fastai", "users")
+    },
+}
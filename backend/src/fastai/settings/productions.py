@@ -1,4 +1,5 @@
 # --- Production related setting
+from django.core.exceptions import ImproperlyConfigured
 from .base import *
 
 DEBUG = os.getenv("DEBUG", "False") == "True"
@@ -16,6 +17,63 @@ DATABASES = {
     }
 }
 
+# Reuse database connections instead of reconnecting on every request.
+# DB_POOL=True (default): psycopg3 connection pool per worker process; works
+# well with ASGI, where persistent per-thread connections do not.
+# DB_POOL=False: persistent connections kept for CONN_MAX_AGE seconds.
+if os.getenv("DB_POOL", "True") == "True":
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            'max_size': int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            'timeout': int(os.getenv("DB_POOL_TIMEOUT", "10")),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv("CONN_MAX_AGE", "60"))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# ---- Static files served by WhiteNoise (compressed, cache-forever hashed names)
+MIDDLEWARE = MIDDLEWARE.copy()
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                  'whitenoise.middleware.WhiteNoiseMiddleware')
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
+
+# ---- Basic auth hashes the password on every request (hundreds of ms of CPU);
+# production clients use JWTs, so it is off unless BASIC_AUTH_ENABLED=True.
+if os.getenv("BASIC_AUTH_ENABLED", "False") != "True":
+    REST_FRAMEWORK = dict(REST_FRAMEWORK, DEFAULT_AUTHENTICATION_CLASSES=tuple(
+        cls for cls in REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES']
+        if cls != 'rest_framework.authentication.BasicAuthentication'
+    ))
+
+# ---- JWT user cache (users/authentication.py) only on a cache every worker shares:
+# users/signals.py drops a changed user from that cache only, so with per-process memory
+# a deactivated user or an old password keeps working on the other workers for up to
+# USER_CACHE_TTL seconds. Off by default until USER_CACHE_ALIAS points at Redis or similar.
+USER_CACHE_SHARED = CACHES[USER_CACHE_ALIAS]["BACKEND"] != "django.core.cache.backends.locmem.LocMemCache"
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60" if USER_CACHE_SHARED else "0"))
+if USER_CACHE_TTL and not USER_CACHE_SHARED:
+    raise ImproperlyConfigured(
+        f"USER_CACHE_TTL={USER_CACHE_TTL} needs a shared cache, but USER_CACHE_ALIAS "
+        f"'{USER_CACHE_ALIAS}' is per-process memory. Set CACHE_BACKEND or USER_CACHE_TTL=0."
+    )
+
+# ---- Response cache: the "django" tier is what carries invalidations to the other workers,
+# which it cannot do on per-process memory. Left out by default until CACHES is shared.
+RESPONSE_CACHE_SHARED = CACHES[RESPONSE_CACHE_ALIAS]["BACKEND"] != "django.core.cache.backends.locmem.LocMemCache"
+RESPONSE_CACHE_BACKENDS = os.getenv(
+    "RESPONSE_CACHE_BACKENDS", "locmem,django" if RESPONSE_CACHE_SHARED else "locmem"
+).split(",")
+if "django" in RESPONSE_CACHE_BACKENDS and not RESPONSE_CACHE_SHARED:
+    raise ImproperlyConfigured(
+        f"RESPONSE_CACHE_BACKENDS has a 'django' tier, but RESPONSE_CACHE_ALIAS '{RESPONSE_CACHE_ALIAS}' "
+        f"is per-process memory. Set CACHE_BACKEND or drop the tier."
+    )
+
 # Security hardening
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
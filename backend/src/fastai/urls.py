@@ -1,6 +1,9 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include, re_path
 from django.views.generic import TemplateView
+from .views import healthz_view, metrics_view, readyz_view
 
 # Admin related names
 urlpatterns = [
@@ -8,6 +11,12 @@ urlpatterns = [
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.jwt')),
     path('aiassistant/', include('aiassistant.urls')), 
+    path('metrics/', metrics_view, name='metrics'),
+    path('healthz/', healthz_view, name='healthz'),
+    path('readyz/', readyz_view, name='readyz'),
 ]
 
+# Uploaded images (see aiassistant/images.py); in production the web server or a CDN serves MEDIA_URL
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
 urlpatterns += [re_path(r'^.*', TemplateView.as_view(template_name='index.html'))]
@@ -0,0 +1,39 @@
+import hmac
+import logging
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+# ---- Prometheus scrape endpoint (internal only)
+def metrics_view(request):
+    """Metrics in Prometheus text format, for scrapers with METRICS_TOKEN or staff users."""
+    if not (has_metrics_token(request) or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def has_metrics_token(request):
+    scheme, _, token = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    return bool(settings.METRICS_TOKEN) and scheme.lower() == "bearer" and \
+        hmac.compare_digest(token.strip().encode(), settings.METRICS_TOKEN.encode())
+
+
+# ---- Liveness probe: the process is up and serving (no DB, no LLM)
+def healthz_view(request):
+    return JsonResponse({"status": "ok"})
+
+
+# ---- Readiness probe: the database answers (the LLM is deliberately not checked)
+def readyz_view(request):
+    try:
+        with connections["default"].cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except Exception:
+        # The driver's message can name the host, database and user: logs only
+        logger.exception("Readiness check failed")
+        return JsonResponse({"status": "unavailable"}, status=503)
+    return JsonResponse({"status": "ok"})
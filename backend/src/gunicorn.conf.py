@@ -0,0 +1,38 @@
+# ---- Gunicorn settings for the production web server (./entrypoint.sh web)
+# Workers run the ASGI app (fastai/asgi.py) through Uvicorn, so SSE streaming
+# and slow LLM calls do not pin a whole process per request.
+import multiprocessing
+import os
+
+# Tell AiassistantConfig.ready() not to start threads in the master before fork
+os.environ.setdefault("GUNICORN_PRELOAD", "1")
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True             # import Django once, share the pages copy-on-write
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))           # LLM replies can take a while
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))  # recycle workers to cap memory growth
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "200"))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_worker_init(worker):
+    # Each worker builds its own Watsonx client (sockets must not be shared across forks)
+    # and starts its own job recovery thread (threads do not survive the fork)
+    from django.conf import settings
+
+    if settings.WATSONX_WARMUP:
+        from aiassistant.apps import warm_up_llm
+
+        warm_up_llm()
+    if settings.GENERATION_QUEUE == "inprocess":
+        from aiassistant.jobs import start_job_recovery
+
+        start_job_recovery()
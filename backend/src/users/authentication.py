@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+# ---- Helper function: Cache key of a user resolved from a JWT
+def user_cache_key(user_id) -> str:
+    return f"users:jwt-user:{user_id}"
+
+
+def get_user_cache():
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+# ---- SimpleJWT authentication with a short-lived user cache
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    Same as ``JWTAuthentication``, but keeps the resolved user in the
+    USER_CACHE_ALIAS cache for USER_CACHE_TTL seconds, so most requests skip
+    the ``UserAccount`` query. Saving or deleting a user drops its entry
+    (users/signals.py); bulk ``update()`` calls bypass that, so the TTL is
+    the upper bound on staleness. Invalidation only reaches other workers
+    through a shared cache, which production settings therefore require.
+    """
+
+    def get_user(self, validated_token):
+        ttl = settings.USER_CACHE_TTL
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if not ttl or user_id is None:
+            return super().get_user(validated_token)
+
+        key = user_cache_key(user_id)
+        user = get_user_cache().get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            get_user_cache().set(key, user, ttl)
+            return user
+
+        # Re-run the checks the parent applies after its query
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
@@ -0,0 +1,64 @@
+import base64
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from users.authentication import CachedJWTAuthentication
+from users.models import UserAccount
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure authentication overhead per request: Basic (password hash), plain "
+        "SimpleJWT and the cached JWT authenticator. Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--basic-repeat", type=int, default=10, help="Basic auth is slow; fewer rounds.")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        self.stdout.write(f"{'authenticator':<14} {'p50 ms':>9} {'mean ms':>9} {'queries':>8}")
+        try:
+            with transaction.atomic():
+                user = UserAccount.objects.create_user(
+                    email="bench-auth@example.invalid", first_name="Bench", last_name="Auth", password="bench-password"
+                )
+                basic = base64.b64encode(b"bench-auth@example.invalid:bench-password").decode()
+                bearer = f"Bearer {AccessToken.for_user(user)}"
+
+                cases = [
+                    ("basic", BasicAuthentication(), f"Basic {basic}", options["basic_repeat"]),
+                    ("jwt", JWTAuthentication(), bearer, options["repeat"]),
+                    ("cached jwt", CachedJWTAuthentication(), bearer, options["repeat"]),
+                ]
+                for name, authenticator, header, repeat in cases:
+                    self.run_case(factory, name, authenticator, header, repeat)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run_case(self, factory, name, authenticator, header, repeat):
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(repeat):
+                request = Request(factory.get("/aiassistant/conversations/", HTTP_AUTHORIZATION=header))
+                began = time.perf_counter()
+                user, _ = authenticator.authenticate(request)
+                timings.append((time.perf_counter() - began) * 1000)
+                assert user.is_authenticated
+        self.stdout.write(
+            f"{name:<14} {statistics.median(timings):>9.3f} {statistics.mean(timings):>9.3f} "
+            f"{len(queries) / repeat:>8.2f}"
+        )
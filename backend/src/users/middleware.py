@@ -0,0 +1,47 @@
+from channels.db import database_sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from .authentication import CachedJWTAuthentication
+
+BEARER_SUBPROTOCOL = "bearer"
+
+
+# ---- Helper function: Find the access token of a WebSocket handshake
+def get_raw_token(scope):
+    """
+    Browsers cannot set headers on a WebSocket, so the token is read from
+    the ``Sec-WebSocket-Protocol`` list (``new WebSocket(url, ["bearer", token])``)
+    and otherwise from an ``Authorization: Bearer <token>`` header.
+    """
+    subprotocols = scope.get("subprotocols") or []
+    if len(subprotocols) >= 2 and subprotocols[0] == BEARER_SUBPROTOCOL:
+        return subprotocols[1]
+
+    headers = dict(scope.get("headers") or [])
+    auth = headers.get(b"authorization", b"").decode().split()
+    if len(auth) == 2 and auth[0] == "Bearer":
+        return auth[1]
+    return None
+
+
+@database_sync_to_async
+def get_user(raw_token):
+    authentication = CachedJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return AnonymousUser()
+
+
+# ---- ASGI middleware: SimpleJWT authentication for WebSocket connections
+class JWTAuthMiddleware:
+    """Sets ``scope["user"]`` from the same access tokens the REST API accepts."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        raw_token = get_raw_token(scope)
+        scope = dict(scope, user=await get_user(raw_token) if raw_token else AnonymousUser())
+        return await self.app(scope, receive, send)
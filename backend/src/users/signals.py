@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import get_user_cache, user_cache_key
+from .models import UserAccount
+
+
+# ---- Drop the cached JWT user whenever the account changes (deactivation, password, profile)
+@receiver(post_save, sender=UserAccount)
+@receiver(post_delete, sender=UserAccount)
+def invalidate_cached_user(sender, instance, **kwargs):
+    key = user_cache_key(instance.pk)
+    get_user_cache().delete(key)
+    # Again after commit, in case a request re-cached the old row in between
+    transaction.on_commit(lambda: get_user_cache().delete(key))
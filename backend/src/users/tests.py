@@ -1,3 +1,40 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import CachedJWTAuthentication
+from .models import UserAccount
 
-# Create your tests here.
+
+# ---- Cached JWT authentication tests
+@override_settings(USER_CACHE_TTL=60)
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user(email="jwt@example.com", first_name="J", last_name="W")
+        self.header = f"Bearer {AccessToken.for_user(self.user)}"
+
+    def authenticate(self):
+        request = Request(APIRequestFactory().get("/", HTTP_AUTHORIZATION=self.header))
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_second_request_skips_the_user_query(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate().pk, self.user.pk)
+
+    def test_deactivation_takes_effect_immediately(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_profile_change_is_visible(self):
+        self.authenticate()
+        self.user.first_name = "Renamed"
+        self.user.save()
+        self.assertEqual(self.authenticate().first_name, "Renamed")